@@ -13,6 +13,7 @@ from src.ui.main_window import RisonCopyChecker
 from src.ui.report_generator import generate_markdown_report
 from src.ui.api_key_dialog import ApiKeyDialog
 from src.utils.api_key_manager import ApiKeyManager
+from src.utils.metrics import MetricsSummary
 
 class MarkdownReportViewer(QtWidgets.QWidget):
     """A window for displaying Markdown reports"""
@@ -171,6 +172,17 @@ class EnhancedRisonCopyChecker(RisonCopyChecker):
         api_key_action.triggered.connect(self.show_api_key_dialog)
         settings_menu.addAction(api_key_action)
         
+        # Add rubric toggle
+        rubric_action = QtWidgets.QAction("Use Precompiled Rubric", self)
+        rubric_action.setCheckable(True)
+        rubric_action.setChecked(self.use_rubric)
+        rubric_action.toggled.connect(self.set_use_rubric)
+        settings_menu.addAction(rubric_action)
+        
+    def set_use_rubric(self, checked):
+        """Toggle sending a compiled rubric instead of the reference pages"""
+        self.use_rubric = checked
+        
     def show_api_key_dialog(self):
         """Show the API key dialog to update the API key"""
         current_key = ApiKeyManager.get_api_key()
@@ -325,12 +337,19 @@ class EnhancedRisonCopyChecker(RisonCopyChecker):
                 # User cancelled the dialog
                 return
         
+        if self.page_selection() is None:
+            if hasattr(self, 'status_box'):
+                self.status_box.setText("Invalid page range")
+                self.status_box.setStyleSheet("background-color: #002021; color: #FF0000; padding: 20px; border-radius: 0px;")
+            return
+        
         # Update our status panel
         if hasattr(self, 'status_box'):
             self.status_box.setText("Processing PDFs... 10%")
             self.status_box.setStyleSheet("background-color: #002021; color: #FFFFFF; padding: 20px; border-radius: 0px;")
             self.status_progress.setValue(10)
             self.status_progress.setVisible(True)
+            self.cancel_button.setEnabled(True)
             
         # Call the parent class's start_checking method to do the actual work
         super().start_checking()
@@ -392,6 +411,39 @@ class EnhancedRisonCopyChecker(RisonCopyChecker):
         self.status_progress.setVisible(False)
         status_layout.addWidget(self.status_progress)
         
+        # Add the deadline setting and a cancel button for the running check
+        controls_layout = QtWidgets.QHBoxLayout()
+        deadline_label = QtWidgets.QLabel("Deadline:")
+        deadline_label.setStyleSheet("color: #002021;")
+        controls_layout.addWidget(deadline_label)
+        self.deadline_spin = QtWidgets.QSpinBox()
+        self.deadline_spin.setRange(0, 120)
+        self.deadline_spin.setSuffix(" min")
+        self.deadline_spin.setSpecialValueText("None")
+        self.deadline_spin.setToolTip("Abandon a check that takes longer than this")
+        self.deadline_spin.valueChanged.connect(self.set_job_deadline)
+        controls_layout.addWidget(self.deadline_spin)
+        controls_layout.addStretch()
+        self.cancel_button = QtWidgets.QPushButton("Cancel")
+        self.cancel_button.setStyleSheet("background-color: #002021; color: #FFFFFF; padding: 6px 16px;")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_checking)
+        controls_layout.addWidget(self.cancel_button)
+        status_layout.addLayout(controls_layout)
+        
+        # Add a live summary of the grading metrics
+        status_layout.addSpacing(10)
+        self.metrics_label = QtWidgets.QLabel()
+        self.metrics_label.setFont(QtGui.QFont("Arial", 10))
+        self.metrics_label.setStyleSheet("background-color: #002021; color: #97F4FC; padding: 10px;")
+        self.metrics_label.setWordWrap(True)
+        status_layout.addWidget(self.metrics_label)
+        self.metrics_summary = MetricsSummary()
+        self.metrics_timer = QtCore.QTimer(self)
+        self.metrics_timer.timeout.connect(self.update_metrics_summary)
+        self.metrics_timer.start(2000)
+        self.update_metrics_summary()
+        
         # Add spacer to push content to the top
         status_layout.addStretch()
         
@@ -401,6 +453,30 @@ class EnhancedRisonCopyChecker(RisonCopyChecker):
         # Set the new layout to the widget
         current_layout.addLayout(main_horizontal_layout)
 
+    def set_job_deadline(self, minutes):
+        """Deadline for the next check; 0 means no limit"""
+        self.job_deadline = minutes * 60 or None
+
+    def cancel_checking(self):
+        """Cancel the running check and show that it is stopping"""
+        super().cancel_checking()
+        if hasattr(self, 'status_box') and self.worker is not None:
+            self.cancel_button.setEnabled(False)
+            self.status_box.setText("Cancelling...")
+            self.status_box.setStyleSheet("background-color: #002021; color: #FF9500; padding: 20px; border-radius: 0px;")
+
+    def handle_cancelled(self, message):
+        """Override handle_cancelled to update our status panel"""
+        self.video_playing = False
+        if hasattr(self, 'status_box'):
+            self.status_box.setText(f"Cancelled: {message}")
+            self.status_box.setStyleSheet("background-color: #002021; color: #FF9500; padding: 20px; border-radius: 0px;")
+            self.status_progress.setVisible(False)
+
+    def update_metrics_summary(self):
+        """Refresh the metrics summary in the status panel"""
+        self.metrics_label.setText(self.metrics_summary.text())
+
     def update_asset_paths(self):
         """Update asset paths to use absolute paths in the cloned repository structure"""
         # Update video path
@@ -469,10 +545,15 @@ class EnhancedRisonCopyChecker(RisonCopyChecker):
         # Update status panel
         if hasattr(self, 'status_progress'):
             self.status_progress.setVisible(False)
+            self.cancel_button.setEnabled(False)
         
         # Close the progress dialog if it exists
         if hasattr(self, 'progress'):
             self.progress.close()
+        self.worker = None
+        if self.response_text is None:
+            # Failed or cancelled; the status panel already says why
+            return
             
         try:
             # Generate a report with the response
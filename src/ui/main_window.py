@@ -1,38 +1,61 @@
 import sys, os, tempfile, cv2, threading
 from PyQt5 import QtWidgets, QtGui, QtCore
 from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtCore import QTimer, pyqtSignal, QObject, QThread
+from PyQt5.QtCore import QTimer, pyqtSignal, QObject
 
-from src.utils.pdf_processor import PDFProcessor
+from src.utils.cancellation import CancellationToken, JobCancelled
+from src.utils.pdf_loading import open_pdf, parse_page_ranges
+from src.utils.preprocessing import Preprocessor
+from src.utils.processing_service import ProcessingService
 from src.ui.prompts import construct_prompt
+from src.ui.thumbnail_strip import ThumbnailStrip
 from src.ui.report_generator import generate_markdown_report
 
 
 class ProcessingWorker(QObject):
-    """Worker class for processing PDFs in a background thread"""
+    """Bridges a job on the shared processing service back to Qt signals"""
     finished = pyqtSignal()
     progress = pyqtSignal(int)
     result = pyqtSignal(str)
     error = pyqtSignal(str)
+    cancelled = pyqtSignal(str)
     
-    def __init__(self, api_key, pdf_paths, prompt, parent=None):
+    def __init__(self, service, pdf_paths, prompt, use_rubric=False, deadline=None, page_selection=None,
+                 parent=None):
         super().__init__(parent)
-        self.api_key = api_key
+        self.service = service
         self.pdf_paths = pdf_paths
+        self.page_selection = page_selection
         self.prompt = prompt
+        self.use_rubric = use_rubric
+        # deadline is in seconds from submission; None lets the job run as long as it needs
+        self.cancel_token = CancellationToken(deadline)
         
     def run(self):
         try:
-            processor = PDFProcessor(self.api_key)
-            self.progress.emit(30)
-            
-            # Process the PDFs and get the API response
-            response = processor.process_pdfs(self.pdf_paths, self.prompt)
+            # The service's long-lived thread does the work; signals are
+            # emitted from that thread and queued onto the GUI thread
+            future = self.service.submit(self.pdf_paths, self.prompt, self.progress.emit, self.use_rubric,
+                                         cancel_token=self.cancel_token, page_selection=self.page_selection)
+            future.add_done_callback(self.job_done)
+        except Exception as e:
+            self.error.emit(str(e))
+            self.finished.emit()
+
+    def cancel(self):
+        """Stop the job at the next page or while it waits on the model"""
+        self.cancel_token.cancel()
+
+    def job_done(self, future):
+        try:
+            response = future.result()
             self.progress.emit(80)
             
             # Signal success with the response
             self.result.emit(response)
             self.progress.emit(100)
+        except JobCancelled as e:
+            self.cancelled.emit(str(e))
         except Exception as e:
             self.error.emit(str(e))
         finally:
@@ -132,6 +155,7 @@ class RisonCopyChecker(QtWidgets.QWidget):
         self.question_status_label.setFont(label_font)
         self.question_status_label.setStyleSheet("color: #000000;")
         question_layout.addWidget(self.question_status_label)
+        question_layout.addWidget(self.make_page_range_edit("Question Paper"))
         layout.addLayout(question_layout)
 
         # Answer Sheet Upload
@@ -146,6 +170,7 @@ class RisonCopyChecker(QtWidgets.QWidget):
         self.answer_status_label.setFont(label_font)
         self.answer_status_label.setStyleSheet("color: #000000;")
         answer_layout.addWidget(self.answer_status_label)
+        answer_layout.addWidget(self.make_page_range_edit("Actual Answer"))
         layout.addLayout(answer_layout)
 
         # Reference Answer Sheet Upload
@@ -160,8 +185,13 @@ class RisonCopyChecker(QtWidgets.QWidget):
         self.reference_status_label.setFont(label_font)
         self.reference_status_label.setStyleSheet("color: #000000;")
         reference_layout.addWidget(self.reference_status_label)
+        reference_layout.addWidget(self.make_page_range_edit("Reference Answer"))
         layout.addLayout(reference_layout)
 
+        # Page previews of the most recently selected PDF
+        self.thumbnail_strip = ThumbnailStrip(self)
+        layout.addWidget(self.thumbnail_strip)
+
         # Add the Clear Button
         self.clear_button = QtWidgets.QPushButton("Clear All", self)
         self.clear_button.setFont(button_font)
@@ -179,6 +209,13 @@ class RisonCopyChecker(QtWidgets.QWidget):
         # Set layout
         self.setLayout(layout)
         self.pdf_paths = {"Question Paper": "", "Reference Answer": "", "Actual Answer": ""}
+        self.processing_service = None
+        self.preprocessor = Preprocessor()
+        self.use_rubric = True
+        # Seconds a check may take before it is abandoned; None for no limit
+        self.job_deadline = None
+        self.worker = None
+        self.response_text = None
         self.show()
         
     def update_frame(self):
@@ -199,7 +236,83 @@ class RisonCopyChecker(QtWidgets.QWidget):
     def closeEvent(self, event):
         # Release resources when closing
         self.capture.release()
+        self.preprocessor.cancel_all()
+        if self.processing_service is not None:
+            self.processing_service.shutdown()
         event.accept()
+
+    def get_processing_service(self, api_key):
+        """Return the shared processing service, recreating it if the API key changed"""
+        if self.processing_service is None or self.processing_service.api_key != api_key:
+            if self.processing_service is not None:
+                self.processing_service.shutdown()
+            self.processing_service = ProcessingService(api_key)
+        return self.processing_service
+
+    def make_page_range_edit(self, label):
+        """Field for the pages of one PDF to grade, e.g. "3-12, 15"; empty means all pages"""
+        if not hasattr(self, 'page_range_edits'):
+            self.page_range_edits = {}
+        edit = QtWidgets.QLineEdit(self)
+        edit.setPlaceholderText("All pages")
+        edit.setToolTip("Pages to grade, e.g. 3-12, 15. Other pages are never loaded.")
+        edit.setFixedWidth(120)
+        edit.setStyleSheet("background-color: #effdfe; color: #000000;")
+        edit.editingFinished.connect(lambda: self.page_range_changed(label))
+        self.page_range_edits[label] = edit
+        return edit
+
+    def parse_page_selection(self, label):
+        """Return the page numbers selected for a slot, or None for all pages; raises ValueError"""
+        spec = self.page_range_edits[label].text().strip()
+        if not spec or not self.pdf_paths[label]:
+            return None
+        with open_pdf(self.pdf_paths[label]) as pdf_document:
+            return parse_page_ranges(spec, len(pdf_document))
+
+    def page_range_changed(self, label):
+        """Validate an edited page range and preprocess just those pages"""
+        edit = self.page_range_edits[label]
+        try:
+            pages = self.parse_page_selection(label)
+        except ValueError as e:
+            edit.setStyleSheet("background-color: #effdfe; color: #FF0000;")
+            edit.setToolTip(str(e))
+            return
+        edit.setStyleSheet("background-color: #effdfe; color: #000000;")
+        edit.setToolTip("Pages to grade, e.g. 3-12, 15. Other pages are never loaded.")
+        if self.pdf_paths[label]:
+            self.preprocessor.start(label, self.pdf_paths[label], pages)
+
+    def page_selection(self):
+        """
+        Return {label: page numbers} for the slots limited to some pages, or
+        None after warning about an invalid range.
+        """
+        selection = {}
+        for label in self.page_range_edits:
+            try:
+                pages = self.parse_page_selection(label)
+            except ValueError as e:
+                QtWidgets.QMessageBox.warning(self, "Invalid Page Range", f"{label}: {e}")
+                return None
+            if pages is not None:
+                selection[label] = pages
+        return selection
+
+    def start_preprocessing(self, label, file_path):
+        """Render and encode a selected PDF in the background so grading can start straight away"""
+        try:
+            pages = self.parse_page_selection(label)
+        except ValueError:
+            pages = None
+        self.preprocessor.start(label, file_path, pages)
+        self.thumbnail_strip.set_document(file_path)
+        # Creating the service also connects its worker to the model
+        from src.utils.api_key_manager import ApiKeyManager
+        api_key = ApiKeyManager.get_api_key()
+        if api_key:
+            self.get_processing_service(api_key)
         
     def clear_selections(self):
         """Reset all file uploads and labels."""
@@ -207,6 +320,10 @@ class RisonCopyChecker(QtWidgets.QWidget):
         self.question_status_label.setText("No file selected")
         self.answer_status_label.setText("No file selected")
         self.reference_status_label.setText("No file selected")
+        self.thumbnail_strip.clear_document()
+        self.preprocessor.cancel_all()
+        for edit in self.page_range_edits.values():
+            edit.clear()
 
         # Reset label colors
         self.question_status_label.setStyleSheet("color: #000000;")
@@ -219,6 +336,7 @@ class RisonCopyChecker(QtWidgets.QWidget):
             self, "Select Question Paper PDF", "", "PDF Files (*.pdf);;All Files (*)", options=options)
         if file_path:
             self.pdf_paths["Question Paper"] = file_path
+            self.start_preprocessing("Question Paper", file_path)
             self.question_status_label.setText("Uploaded")
             self.question_status_label.setStyleSheet("color: #28C76F;")
         else:
@@ -230,6 +348,7 @@ class RisonCopyChecker(QtWidgets.QWidget):
             self, "Select Answer Sheet PDF", "", "PDF Files (*.pdf);;All Files (*)", options=options)
         if file_path:
             self.pdf_paths["Actual Answer"] = file_path
+            self.start_preprocessing("Actual Answer", file_path)
             self.answer_status_label.setText("Uploaded")
             self.answer_status_label.setStyleSheet("color: #28C76F;")
         else:
@@ -241,6 +360,7 @@ class RisonCopyChecker(QtWidgets.QWidget):
             self, "Select Reference Answer Sheet PDF", "", "PDF Files (*.pdf);;All Files (*)", options=options)
         if file_path:
             self.pdf_paths["Reference Answer"] = file_path
+            self.start_preprocessing("Reference Answer", file_path)
             self.reference_status_label.setText("Uploaded")
             self.reference_status_label.setStyleSheet("color: #28C76F;")
         else:
@@ -255,6 +375,10 @@ class RisonCopyChecker(QtWidgets.QWidget):
             QtWidgets.QMessageBox.warning(self, "Missing Files", "Please upload an Answer Sheet PDF.")
             return
 
+        page_selection = self.page_selection()
+        if page_selection is None:
+            return
+
         # Set up a progress dialog
         # self.progress = QtWidgets.QProgressDialog("Processing PDFs...", "Cancel", 0, 100, self)
         # self.progress.setWindowTitle("Please Wait")
@@ -273,24 +397,23 @@ class RisonCopyChecker(QtWidgets.QWidget):
         # Start playing the video during processing
         self.video_playing = True
         
-        # Create a worker thread for processing
-        self.thread = QThread()
-        self.worker = ProcessingWorker(api_key, self.pdf_paths, prompt)
-        self.worker.moveToThread(self.thread)
+        # Submit the job to the long-lived processing service
+        service = self.get_processing_service(api_key)
+        self.response_text = None
+        self.worker = ProcessingWorker(service, self.pdf_paths, prompt, self.use_rubric, self.job_deadline,
+                                       page_selection)
         
         # Connect signals and slots
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.thread.quit)
         self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
-        self.thread.finished.connect(self.processing_finished)
+        self.worker.finished.connect(self.processing_finished)
         
         self.worker.progress.connect(self.update_progress)
         self.worker.result.connect(self.handle_result)
         self.worker.error.connect(self.handle_error)
+        self.worker.cancelled.connect(self.handle_cancelled)
         
-        # Start the thread
-        self.thread.start()
+        # Start the job
+        self.worker.run()
     
     def update_progress(self, value):
         """Update the progress dialog with the current progress value."""
@@ -302,6 +425,16 @@ class RisonCopyChecker(QtWidgets.QWidget):
         # Generate a report with the response
         self.response_text = response
     
+    def cancel_checking(self):
+        """Cancel the running check, if any"""
+        if self.worker is not None:
+            self.worker.cancel()
+
+    def handle_cancelled(self, message):
+        """Handle a check that was cancelled or ran past its deadline."""
+        self.video_playing = False
+        QtWidgets.QMessageBox.information(self, "Checking Cancelled", message)
+
     def handle_error(self, error_message):
         """Handle errors during processing."""
         # Pause the video
@@ -318,6 +451,10 @@ class RisonCopyChecker(QtWidgets.QWidget):
         # Close the progress dialog
         if hasattr(self, 'progress'):
             self.progress.close()
+        self.worker = None
+        if self.response_text is None:
+            # Failed or cancelled; there is nothing to report
+            return
             
         try:
             # Generate a report with the response
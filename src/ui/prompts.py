@@ -1,4 +1,4 @@
-def construct_prompt(has_reference):
+def construct_prompt(has_reference, rubric_text=None):
     """Construct the prompt for the Gemini API based on uploaded files."""
     prompt = (
         "You are an expert university professor with decades of experience grading exams. "
@@ -6,7 +6,15 @@ def construct_prompt(has_reference):
         "I will provide you with a question paper and a student's answer sheet. "
     )
     
-    if has_reference:
+    if rubric_text:
+        prompt += (
+            "Instead of the reference answer sheet, you are given a marking rubric compiled from it. "
+            "The rubric lists, for each question, the marks allocated, the key points a full answer must "
+            "contain and any accepted variants. Treat it as 100% correct and as your primary standard. "
+            "An answer that covers every key point (even if worded differently) should receive full marks. "
+            "RUBRIC:\n" + rubric_text + "\n"
+        )
+    elif has_reference:
         prompt += (
             "I will also provide a reference answer sheet created by the professor. "
             "This reference contains model answers that should be considered 100% correct. "
@@ -57,3 +65,19 @@ def construct_prompt(has_reference):
     )
     
     return prompt
+
+
+def construct_rubric_prompt():
+    """Construct the prompt that compiles a marking rubric from the question paper and reference."""
+    return (
+        "You are an expert university professor preparing a marking rubric. "
+        "I will provide you with a question paper followed by the professor's reference answer sheet. "
+        "For every question, extract the marks allocated, the key points a fully correct answer must contain "
+        "(short phrases, as few as needed) and any alternative answers that should also be accepted. "
+        "Set type to mcq for multiple-choice questions, numeric for questions with a single numeric answer "
+        "and written for everything else. For mcq give the correct option letter as answer; for numeric give "
+        "the number, with a tolerance such as 9.8 ± 0.1 if one is stated; otherwise leave answer empty. "
+        "Respond with JSON only, in exactly this form: "
+        '{"questions": [{"question": "1", "marks": 5, "type": "written", "answer": "", '
+        '"key_points": ["..."], "accepted_variants": ["..."]}]}'
+    )
@@ -84,11 +84,12 @@ def generate_html_report(response_text):
     return os.path.abspath(report_filename)
 
 
-def generate_markdown_report(response_text):
+def generate_markdown_report(response_text, report_filename=None):
     """Generate a Markdown report with the API response."""
     now = datetime.now()
     date_str = now.strftime("%Y%m%d_%H%M")
-    report_filename = f"report_risonCc_{date_str}.md"
+    if report_filename is None:
+        report_filename = f"report_risonCc_{date_str}.md"
     
     # Format the Markdown content
     markdown_content = f"""# Rison Copy Checker Report
@@ -108,4 +109,30 @@ def generate_markdown_report(response_text):
     with open(report_filename, "w", encoding="utf-8") as f:
         f.write(markdown_content)
         
-    return os.path.abspath(report_filename)
\ No newline at end of file
+    return os.path.abspath(report_filename)
+
+def generate_class_report(exam_name, sections, report_filename=None):
+    """Generate a Markdown class report from (heading, markdown) sections."""
+    now = datetime.now()
+    date_str = now.strftime("%Y%m%d_%H%M")
+    if report_filename is None:
+        report_filename = f"class_report_risonCc_{date_str}.md"
+    
+    # Format the Markdown content
+    body = "\n\n".join(f"## {heading}\n\n{content}" for heading, content in sections)
+    markdown_content = f"""# Rison Copy Checker Class Report: {exam_name}
+
+**Generated on:** {now.strftime("%Y-%m-%d %H:%M:%S")}
+
+{body}
+
+---
+
+*Generated by Rison Copy Checker | © {now.year}*
+"""
+    
+    # Write the Markdown content to a file
+    with open(report_filename, "w", encoding="utf-8") as f:
+        f.write(markdown_content)
+        
+    return os.path.abspath(report_filename)
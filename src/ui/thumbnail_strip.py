@@ -0,0 +1,140 @@
+import os, queue, threading
+from collections import OrderedDict
+
+from PyQt5 import QtWidgets, QtGui, QtCore
+from PyQt5.QtCore import pyqtSignal, QObject
+from PyQt5.QtGui import QImage, QPixmap
+
+from src.utils.pdf_loading import open_pdf
+from src.utils.render_cache import shared_render_cache
+
+THUMBNAIL_HEIGHT = 140
+
+
+class ThumbnailLoader(QObject):
+    """
+    Renders thumbnails on a background thread.
+    Pages go through the shared render cache at grading resolution, so every
+    previewed page is already rasterised when grading starts.
+    """
+    thumbnail_ready = pyqtSignal(str, int, QImage)
+
+    def __init__(self, render_cache=None, parent=None):
+        super().__init__(parent)
+        self.render_cache = render_cache or shared_render_cache
+        self.requests = queue.Queue()
+        self.generation = 0
+        thread = threading.Thread(target=self._run, name="ThumbnailLoader", daemon=True)
+        thread.start()
+
+    def request(self, pdf_path, page_numbers):
+        """Queue pages of a document; pages queued for an earlier document are dropped"""
+        self.requests.put((self.generation, pdf_path, list(page_numbers)))
+
+    def cancel_pending(self):
+        self.generation += 1
+
+    def _run(self):
+        while True:
+            generation, pdf_path, page_numbers = self.requests.get()
+            if generation != self.generation:
+                continue
+            try:
+                with open_pdf(pdf_path) as pdf_document:
+                    for page_number in page_numbers:
+                        if generation != self.generation:
+                            break
+                        image = self.render_cache.render(pdf_document, pdf_path, page_number)
+                        thumbnail = image.copy()
+                        thumbnail.thumbnail((THUMBNAIL_HEIGHT * 2, THUMBNAIL_HEIGHT))
+                        data = thumbnail.tobytes("raw", "RGB")
+                        q_image = QImage(data, thumbnail.width, thumbnail.height, thumbnail.width * 3,
+                                         QImage.Format_RGB888).copy()
+                        self.thumbnail_ready.emit(pdf_path, page_number, q_image)
+            except Exception as e:
+                print(f"Error rendering thumbnails for {pdf_path}: {e}")
+
+
+class ThumbnailStrip(QtWidgets.QListWidget):
+    """Horizontal strip of page thumbnails for the most recently selected PDF"""
+
+    def __init__(self, parent=None, max_cached=200):
+        super().__init__(parent)
+        self.setViewMode(QtWidgets.QListView.IconMode)
+        self.setFlow(QtWidgets.QListView.LeftToRight)
+        self.setWrapping(False)
+        self.setMovement(QtWidgets.QListView.Static)
+        self.setIconSize(QtCore.QSize(THUMBNAIL_HEIGHT, THUMBNAIL_HEIGHT))
+        self.setFixedHeight(THUMBNAIL_HEIGHT + 50)
+        self.setHorizontalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        self.setStyleSheet("background-color: #effdfe; color: #000000;")
+
+        self.pdf_path = ""
+        self.requested = set()
+        # LRU of (pdf path, page number) -> QPixmap, shared across documents
+        self.pixmaps = OrderedDict()
+        self.max_cached = max_cached
+        self.loader = ThumbnailLoader(parent=self)
+        self.loader.thumbnail_ready.connect(self.thumbnail_ready)
+        self.horizontalScrollBar().valueChanged.connect(self.request_visible)
+
+    def set_document(self, pdf_path):
+        """Show placeholders for every page and start rendering the visible ones"""
+        self.loader.cancel_pending()
+        self.clear()
+        self.requested = set()
+        self.pdf_path = pdf_path
+        try:
+            with open_pdf(pdf_path) as pdf_document:
+                page_count = len(pdf_document)
+        except Exception as e:
+            print(f"Error opening {pdf_path} for preview: {e}")
+            return
+        self.setToolTip(os.path.basename(pdf_path))
+        for page_number in range(1, page_count + 1):
+            item = QtWidgets.QListWidgetItem(f"Page {page_number}")
+            item.setSizeHint(QtCore.QSize(THUMBNAIL_HEIGHT + 10, THUMBNAIL_HEIGHT + 40))
+            pixmap = self._cached(pdf_path, page_number)
+            if pixmap is not None:
+                item.setIcon(QtGui.QIcon(pixmap))
+                self.requested.add(page_number)
+            self.addItem(item)
+        # Wait for the layout so the visible range is known
+        QtCore.QTimer.singleShot(0, self.request_visible)
+
+    def clear_document(self):
+        self.loader.cancel_pending()
+        self.clear()
+        self.pdf_path = ""
+        self.setToolTip("")
+
+    def _cached(self, pdf_path, page_number):
+        key = (pdf_path, page_number)
+        if key in self.pixmaps:
+            self.pixmaps.move_to_end(key)
+            return self.pixmaps[key]
+        return None
+
+    def visible_pages(self):
+        viewport = self.viewport().rect()
+        return [row + 1 for row in range(self.count()) if self.visualItemRect(self.item(row)).intersects(viewport)]
+
+    def request_visible(self, *args):
+        if not self.pdf_path:
+            return
+        pages = [page for page in self.visible_pages() if page not in self.requested]
+        if pages:
+            self.requested.update(pages)
+            self.loader.request(self.pdf_path, pages)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.request_visible()
+
+    def thumbnail_ready(self, pdf_path, page_number, q_image):
+        pixmap = QPixmap.fromImage(q_image)
+        self.pixmaps[(pdf_path, page_number)] = pixmap
+        while len(self.pixmaps) > self.max_cached:
+            self.pixmaps.popitem(last=False)
+        if pdf_path == self.pdf_path and page_number <= self.count():
+            self.item(page_number - 1).setIcon(QtGui.QIcon(pixmap))
@@ -0,0 +1,381 @@
+import re
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from src.utils.metrics import LOCAL_QUESTIONS
+from src.utils.model_routing import ROUTING_COLUMN
+from src.utils.pdf_loading import open_pdf, parse_page_ranges
+from src.utils.regrade import QUESTION_START, merge_rows, split_questions
+from src.utils.result_parser import parse_results_table, format_results_table, question_key
+
+KeyEntry = namedtuple("KeyEntry", ["question", "kind", "answer", "marks", "tolerance"])
+
+LOCAL_GRADER = "answer key"
+# Relative tolerance for numeric answers when the key does not give one (1%)
+DEFAULT_RELATIVE_TOLERANCE = 0.01
+
+_NUMBER = r"-?\d[\d,]*(?:\.\d+)?"
+# "Answer: B", "Ans - (c)", "Correct option: d"; a letter starting a word ("Answer: A cell is", "e.g.") is not an option
+_EXPLICIT_CHOICE = re.compile(
+    r"\b(?:ans(?:wer)?|correct (?:answer|option)|option|key)\s*[:=\-]?\s*"
+    r"(?:\(([a-e])\)|([a-e])\)|([a-e])\.?(?=[ \t]*(?:$|[,;])))",
+    re.IGNORECASE | re.MULTILINE)
+# An answer that is only an option: "b", "(b)", "B.", or an option followed by its text: "(b) Paris", "b) Paris"
+_BARE_CHOICE = re.compile(r"^\s*(?:\(?([a-e])\)?\.?\s*$|\(([a-e])\)|([a-e])\))", re.IGNORECASE)
+# A key that is nothing but an option token, trusted even when the question paper lists no options
+_OPTION_TOKEN = re.compile(r"^\s*\(?([a-e])\)?\.?\s*$", re.IGNORECASE)
+# Options printed in a question: "(a) Paris", "b) London", "C. Rome", on their own lines or inline
+_QUESTION_OPTION = re.compile(r"(?:^|\s)\(?([a-e])[).]\s+\S", re.IGNORECASE | re.MULTILINE)
+# The value a line of working ends on: "v = 12.5 m/s"
+_ASSIGNED_NUMBER = re.compile(r"=\s*(" + _NUMBER + r")")
+_UNIT = r"[a-z/%°^²³\d]*"
+# An optional tolerance after the value and its unit: "± 0.1", "+/- 0.1 m/s", "± 2%"
+_TOLERANCE = r"(?:\s*" + _UNIT + r"\s*(?:±|\+/-)\s*(\d+(?:\.\d+)?)\s*(%)?)?"
+# "Answer: 12.5 m/s", "Final answer = 3.2 ± 0.1"
+_EXPLICIT_NUMBER = re.compile(
+    r"\b(?:ans(?:wer)?|final answer|result)\s*[:=\-]?\s*(" + _NUMBER + r")" + _TOLERANCE, re.IGNORECASE)
+# "12.5", "12.5 m/s", "9.8 ± 0.1", "9.8 +/- 0.1 m/s^2"
+_BARE_NUMBER = re.compile(r"^\s*(" + _NUMBER + r")" + _TOLERANCE + r"\s*" + _UNIT + r"\s*$", re.IGNORECASE)
+_MARKS = re.compile(r"\[\s*(\d+(?:\.\d+)?)\s*(?:marks?)?\s*\]|\(\s*(\d+(?:\.\d+)?)\s*marks?\s*\)", re.IGNORECASE)
+
+
+def _answer_text(question_text):
+    """Drop the question label ("Q3.", "3)") from the start of a question's text"""
+    first_line, _, rest = question_text.partition("\n")
+    match = QUESTION_START.match(first_line)
+    if match:
+        first_line = first_line[match.end():].lstrip(" .:)-")
+    return (first_line + "\n" + rest).strip()
+
+
+def _to_number(value):
+    return float(value.replace(",", ""))
+
+
+def read_choice(text):
+    """Return the option letter a student or reference marked in an answer, or None"""
+    match = _EXPLICIT_CHOICE.search(text)
+    if not match:
+        match = _BARE_CHOICE.match(text)
+    if not match:
+        return None
+    return next(group for group in match.groups() if group).lower()
+
+
+def read_number(text, final=True):
+    """
+    Return (value, tolerance) for a numeric answer, or None.
+    A stated tolerance ("9.8 ± 0.1", "+/- 2%") is returned as an absolute
+    amount; tolerance is None when the answer gives none.
+    With final=True free working is read as well: the value assigned on the
+    last line with an "=" ("v = 12.5 m/s after 3 s" gives 12.5), or the only
+    number in the answer. Anything more ambiguous returns None and is left to the model.
+    """
+    match = _EXPLICIT_NUMBER.search(text) or _BARE_NUMBER.match(text)
+    if match:
+        value, tolerance, percent = match.groups()
+        value = _to_number(value)
+        if tolerance is None:
+            return value, None
+        # "± 2%" is relative to the value; the key stores absolute tolerances
+        return value, abs(value) * float(tolerance) / 100 if percent else float(tolerance)
+    if final:
+        assigned = [line for line in text.splitlines() if _ASSIGNED_NUMBER.search(line)]
+        if assigned:
+            return _to_number(_ASSIGNED_NUMBER.findall(assigned[-1])[-1]), None
+        numbers = re.findall(_NUMBER, text)
+        if len(numbers) == 1:
+            return _to_number(numbers[0]), None
+    return None
+
+
+def question_options(question_text):
+    """Return the option letters a question lists, or an empty set for a written question"""
+    letters = {letter.lower() for letter in _QUESTION_OPTION.findall(question_text)}
+    # A lone "a." is more likely prose than an option list
+    return letters if {"a", "b"} <= letters else set()
+
+
+def question_marks(question_texts, default_marks=None):
+    """Return {question: marks allocated} from "(2 marks)" or "[2]" annotations in the question paper"""
+    marks = {}
+    for question, text in question_texts.items():
+        match = _MARKS.search(text)
+        if match:
+            marks[question] = float(match.group(1) or match.group(2))
+        elif default_marks is not None:
+            marks[question] = float(default_marks)
+    return marks
+
+
+def answer_key_from_texts(reference_texts, question_texts, default_marks=None):
+    """
+    Build an answer key from the reference's per-question text.
+    Only answers that are a bare option or number (or stated explicitly as
+    "Answer: ...") become key entries; written answers are left to the model.
+    An option is only taken as an MCQ key when the question paper lists that
+    option for the question, or when the answer is nothing but the option.
+    """
+    marks = question_marks(question_texts, default_marks)
+    key = {}
+    for question, text in reference_texts.items():
+        if question not in marks:
+            continue
+        answer = _answer_text(text)
+        options = question_options(question_texts.get(question, ""))
+        choice = read_choice(answer) if options else None
+        if choice is not None and choice not in options:
+            choice = None
+        if choice is None and _OPTION_TOKEN.match(answer):
+            choice = _OPTION_TOKEN.match(answer).group(1).lower()
+        if choice is not None:
+            key[question] = KeyEntry(question, "mcq", choice, marks[question], None)
+            continue
+        number = read_number(answer, final=False)
+        if number is not None:
+            key[question] = KeyEntry(question, "numeric", number[0], marks[question], number[1])
+    return key
+
+
+def _page_texts(pdf_path, pages=None):
+    """Return {page number: text} for the selected pages (a range spec or list; None for all)"""
+    with open_pdf(pdf_path) as pdf_document:
+        return {page_number: pdf_document[page_number - 1].get_text()
+                for page_number in parse_page_ranges(pages, len(pdf_document))}
+
+
+def answer_key_from_pdfs(pdf_paths, default_marks=None, page_selection=None):
+    """Build an answer key from the text layers of the reference and question paper"""
+    reference_path = pdf_paths.get("Reference Answer")
+    question_path = pdf_paths.get("Question Paper")
+    if not reference_path or not question_path:
+        return {}
+    page_selection = page_selection or {}
+    reference_texts = split_questions(list(_page_texts(reference_path, page_selection.get("Reference Answer")).values()))[0]
+    if not reference_texts:
+        return {}
+    question_texts = list(_page_texts(question_path, page_selection.get("Question Paper")).values())
+    return answer_key_from_texts(reference_texts, split_questions(question_texts)[0], default_marks)
+
+
+def answer_key_from_rubric(rubric):
+    """Build an answer key from the MCQ and numeric entries of a compiled rubric"""
+    key = {}
+    for entry in rubric.get("questions", []):
+        question = question_key(str(entry.get("question", "")))
+        kind = str(entry.get("type", "")).lower()
+        answer = str(entry.get("answer") or "")
+        try:
+            marks = float(entry.get("marks"))
+        except (TypeError, ValueError):
+            continue
+        if kind == "mcq" and read_choice(answer):
+            key[question] = KeyEntry(question, "mcq", read_choice(answer), marks, None)
+        elif kind == "numeric" and read_number(answer, final=False):
+            value, tolerance = read_number(answer, final=False)
+            key[question] = KeyEntry(question, "numeric", value, marks, tolerance)
+    return key
+
+
+def detect_bubble_rows(image, options=4, fill_threshold=0.5):
+    """
+    Read a scanned bubble/checkbox grid.
+    Returns one entry per row, top to bottom: the marked option letter, or
+    None when no box or several boxes are filled. Returns None unless the
+    boxes form one grid: every row has exactly `options` boxes, lined up in
+    the same columns.
+    """
+    gray = cv2.cvtColor(np.array(image.convert("RGB")), cv2.COLOR_RGB2GRAY)
+    thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
+    contours = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
+
+    min_size, max_size = gray.shape[1] * 0.01, gray.shape[1] * 0.05
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if min_size <= w <= max_size and min_size <= h <= max_size and 0.75 <= w / h <= 1.33:
+            boxes.append((x, y, w, h))
+
+    rows = []
+    for box in sorted(boxes, key=lambda box: box[1] + box[3] / 2):
+        if rows and abs((box[1] + box[3] / 2) - (rows[-1][-1][1] + rows[-1][-1][3] / 2)) < box[3] / 2:
+            rows[-1].append(box)
+        else:
+            rows.append([box])
+
+    if not rows or any(len(row) != options for row in rows):
+        return None
+    columns = [sorted(x + w / 2 for x, _, w, _ in row) for row in rows]
+    width = np.median([w for _, _, w, _ in boxes])
+    if np.abs(np.array(columns) - np.median(columns, axis=0)).max() > width / 2:
+        return None
+
+    answers = []
+    for row in rows:
+        # Shrink each box so its printed outline does not count as ink
+        fills = []
+        for x, y, w, h in sorted(row):
+            inner = thresh[y + h // 4:y + h - h // 4, x + w // 4:x + w - w // 4]
+            fills.append(cv2.countNonZero(inner) / max(inner.size, 1))
+        marked = [index for index, fill in enumerate(fills) if fill >= fill_threshold]
+        answers.append("abcde"[marked[0]] if len(marked) == 1 else None)
+    return answers
+
+
+def student_answers(pdf_path, key, options=4, pages=None):
+    """
+    Read the student's answers to the questions in the key, from the selected pages only.
+    Returns ({question: (answer, how it was read)}, {page number: questions on its text layer}).
+    """
+    answers = {}
+    page_texts = _page_texts(pdf_path, pages)
+    question_texts, page_questions = split_questions(list(page_texts.values()))
+    page_questions = dict(zip(page_texts, page_questions))
+    for question, text in question_texts.items():
+        entry = key.get(question)
+        if entry is None:
+            continue
+        answer = _answer_text(text)
+        value = read_choice(answer) if entry.kind == "mcq" else read_number(answer)
+        if value is not None:
+            answers[question] = (value if entry.kind == "mcq" else value[0], "text")
+
+    # A scanned page (no text layer) is read as a bubble grid for the MCQs not found in text, but
+    # only when it holds one validated grid with a row per MCQ. The page itself is still sent to
+    # the model, since it may hold handwritten answers as well.
+    mcq_questions = [question for question, entry in key.items() if entry.kind == "mcq" and question not in answers]
+    if mcq_questions:
+        with open_pdf(pdf_path) as pdf_document:
+            for page_number, text in page_texts.items():
+                if text.strip():
+                    continue
+                pix = pdf_document[page_number - 1].get_pixmap(dpi=150)
+                rows = detect_bubble_rows(Image.frombytes("RGB", [pix.width, pix.height], pix.samples), options)
+                if rows is None or len(rows) != len(mcq_questions):
+                    continue
+                for question, choice in zip(mcq_questions, rows):
+                    if choice is not None:
+                        answers[question] = (choice, "bubble grid")
+                break
+    return answers, page_questions
+
+
+def score_answer(entry, answer, relative_tolerance=DEFAULT_RELATIVE_TOLERANCE):
+    """Return the marks earned by an answer under the key entry's tolerance rules"""
+    if entry.kind == "mcq":
+        return entry.marks if answer == entry.answer else 0.0
+    tolerance = entry.tolerance if entry.tolerance is not None else abs(entry.answer) * relative_tolerance
+    return entry.marks if abs(answer - entry.answer) <= tolerance + 1e-9 else 0.0
+
+
+def _format_number(value):
+    return f"{value:g}"
+
+
+def score_locally(key, student_path, relative_tolerance=DEFAULT_RELATIVE_TOLERANCE, pages=None):
+    """
+    Score the student's MCQ and numeric answers against the key.
+    Returns (rows in the grading table's format, set of 1-based page numbers
+    that hold only locally scored questions).
+    """
+    answers, page_questions = student_answers(student_path, key, pages=pages)
+    rows = []
+    for question in sorted(answers, key=lambda question: list(key).index(question)):
+        entry = key[question]
+        answer, source = answers[question]
+        awarded = score_answer(entry, answer, relative_tolerance)
+        if entry.kind == "mcq":
+            expected, given = entry.answer.upper(), answer.upper()
+        else:
+            expected, given = _format_number(entry.answer), _format_number(answer)
+            if entry.tolerance is not None:
+                expected += f" ± {_format_number(entry.tolerance)}"
+        rows.append({
+            "Question Number": question,
+            "Marks Allocated": _format_number(entry.marks),
+            "Percentage of Correct Content": f"{100 * awarded / entry.marks:.0f}%" if entry.marks else "0%",
+            "Marks Awarded": _format_number(awarded),
+            "Comments": f"Scored against the answer key ({source}): expected {expected}, answered {given}.",
+        })
+    scored = set(answers)
+    local_pages = {page_number for page_number, questions in page_questions.items()
+                   if questions and all(question in scored for question in questions)}
+    return rows, local_pages
+
+
+def exclusion_prompt(prompt_text, questions):
+    """Tell the model to leave out the questions that were scored locally"""
+    return prompt_text + (
+        " Questions " + ", ".join(questions) + " have already been scored against the answer key; "
+        "leave them out of the table and grade every other question."
+    )
+
+
+def _text_before_table(response_text):
+    lines = []
+    for line in response_text.splitlines():
+        if "|" in line:
+            break
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def merge_local_rows(response_text, local_rows):
+    """Merge locally scored rows into the model's table, in question order"""
+    rows = parse_results_table(response_text)
+    columns = list((rows or local_rows)[0].keys())
+    if ROUTING_COLUMN not in columns:
+        columns.append(ROUTING_COLUMN)
+    for row in local_rows:
+        row[ROUTING_COLUMN] = LOCAL_GRADER
+    preface = _text_before_table(response_text)
+    note = f"{len(local_rows)} questions were scored locally against the answer key."
+    return "\n\n".join(text for text in (preface, note) if text) + "\n\n" + format_results_table(
+        merge_rows(rows, local_rows), columns)
+
+
+def plan_local_scoring(key, pdf_paths, relative_tolerance=DEFAULT_RELATIVE_TOLERANCE, page_selection=None,
+                       questions=None):
+    """
+    Score the student's answers the key covers.
+    Returns (local_rows, local_pages, complete) where complete means every
+    question on the paper was scored locally and the model is not needed.
+    questions lists the paper's questions when it is not read from the question paper.
+    """
+    page_selection = page_selection or {}
+    local_rows, local_pages = score_locally(key, pdf_paths["Actual Answer"], relative_tolerance,
+                                            page_selection.get("Actual Answer"))
+    if not local_rows:
+        return local_rows, local_pages, False
+    LOCAL_QUESTIONS.inc(len(local_rows))
+    all_questions = questions
+    if all_questions is None:
+        question_texts = _page_texts(pdf_paths["Question Paper"], page_selection.get("Question Paper"))
+        all_questions = list(split_questions(list(question_texts.values()))[0])
+    scored = [row["Question Number"] for row in local_rows]
+    return local_rows, local_pages, bool(all_questions) and all(question in scored for question in all_questions)
+
+
+def grade_with_answer_key(processor, pdf_paths, prompt_text, key, relative_tolerance=DEFAULT_RELATIVE_TOLERANCE,
+                          page_selection=None, exam_bundle=None):
+    """
+    Score the answers the key covers locally and send only the rest to the model.
+    Pages holding nothing but locally scored answers are not sent at all.
+    """
+    questions = exam_bundle.questions if exam_bundle is not None else None
+    local_rows, local_pages, complete = plan_local_scoring(key, pdf_paths, relative_tolerance, page_selection,
+                                                           questions)
+    if not local_rows:
+        return processor.route_pages(processor.prepare_pages(pdf_paths, page_selection=page_selection,
+                                                             exam_bundle=exam_bundle), prompt_text)
+    if complete:
+        return merge_local_rows("", local_rows)
+
+    scored = [row["Question Number"] for row in local_rows]
+    encoded_images_sets = processor.prepare_pages(pdf_paths, skip_pages={"Actual Answer": local_pages},
+                                                  page_selection=page_selection, exam_bundle=exam_bundle)
+    response_text = processor.route_pages(encoded_images_sets, exclusion_prompt(prompt_text, scored))
+    return merge_local_rows(response_text, local_rows)
@@ -69,6 +69,21 @@ class ApiKeyManager:
         
         return success
     
+    @classmethod
+    def get_settings(cls, section):
+        """
+        Get one section of the config file as a dict
+        Returns an empty dict if the file or the section is missing
+        """
+        config_file = cls._get_config_path()
+        if config_file.exists():
+            try:
+                with open(config_file, 'r') as f:
+                    return dict(json.load(f).get(section, {}))
+            except Exception as e:
+                print(f"Could not read the {section} settings: {e}")
+        return {}
+
     @classmethod
     def _get_config_path(cls):
         """Get the path to the config file based on platform"""
@@ -0,0 +1,91 @@
+import time, threading
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once its cancellation token is cancelled"""
+
+
+class DeadlineExceeded(JobCancelled, TimeoutError):
+    """Raised inside a job that ran past its deadline"""
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation for one grading job.
+    Work checks the token between pages and before each model call; an
+    optional deadline (seconds from creation) cancels the job on its own.
+    """
+
+    def __init__(self, deadline_seconds=None):
+        self.deadline_seconds = deadline_seconds
+        self.deadline = None if not deadline_seconds else time.monotonic() + deadline_seconds
+        self.event = threading.Event()
+        self.reason = None
+
+    def cancel(self, reason="Cancelled by the user"):
+        if not self.event.is_set():
+            self.reason = reason
+            self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set() or self.expired
+
+    @property
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining(self):
+        """Seconds left before the deadline, or None without one"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def timeout(self, limit):
+        """The smaller of limit and the time left, for bounding a blocking call"""
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        return remaining if limit is None else min(limit, remaining)
+
+    def check(self):
+        """Raise JobCancelled (or DeadlineExceeded) if the job should stop"""
+        if self.event.is_set():
+            raise JobCancelled(self.reason)
+        if self.expired:
+            raise DeadlineExceeded(f"Job exceeded its {self.deadline_seconds:g}s deadline")
+
+
+class SharedCancellationToken(CancellationToken):
+    """
+    Cancellation for one request shared by several jobs (packed scripts).
+    It only stops once every job's own token is cancelled, and its deadline
+    is the latest of theirs, so one job's cancel does not cut the others short.
+    """
+
+    def __init__(self, tokens):
+        super().__init__()
+        self.tokens = list(tokens)
+
+    def cancel(self, reason="Cancelled by the user"):
+        for token in self.tokens:
+            token.cancel(reason)
+
+    @property
+    def cancelled(self):
+        return all(token.cancelled for token in self.tokens)
+
+    @property
+    def expired(self):
+        return all(token.expired for token in self.tokens)
+
+    def remaining(self):
+        remaining = [token.remaining() for token in self.tokens if not token.cancelled]
+        if not remaining:
+            return 0.0
+        return None if None in remaining else max(remaining)
+
+    def check(self):
+        if self.cancelled:
+            for token in self.tokens:
+                token.check()
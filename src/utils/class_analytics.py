@@ -0,0 +1,220 @@
+import sys, argparse
+
+import numpy as np
+
+from src.utils.exam_registry import ExamRegistry
+from src.utils.result_parser import QUESTION_COLUMN, parse_marks, question_key, format_results_table
+from src.utils.results_store import ResultsStore
+
+# Share of the class in the upper and lower groups of the discrimination index
+GROUP_FRACTION = 0.27
+# Robust z-score above which a total or a question mark is flagged
+OUTLIER_Z = 3.5
+
+
+def marks_matrix(records):
+    """
+    Collect stored results into arrays.
+    Returns (students, questions, awarded, allocated): awarded is a
+    students x questions float array with NaN where a question is missing,
+    allocated holds each question's marks (the median over the class).
+    """
+    students = [record["student"] for record in records]
+    questions, columns = [], {}
+    # Labels and mark strings repeat across the class; parse each distinct one once
+    keys, values = {}, {}
+    awarded_column = allocated_column = None
+    cells = []
+    for row_index, record in enumerate(records):
+        for row in record.get("rows", []):
+            if awarded_column not in row or allocated_column not in row:
+                awarded_column = next((column for column in row if "awarded" in column.lower()), None)
+                allocated_column = next((column for column in row if "allocated" in column.lower()), None)
+            label = row.get(QUESTION_COLUMN) or next(iter(row.values()), "")
+            if label not in keys:
+                keys[label] = question_key(label)
+            key = keys[label]
+            if key not in columns:
+                columns[key] = len(questions)
+                questions.append(label)
+            marks = row.get(awarded_column), row.get(allocated_column)
+            for text in marks:
+                if text not in values:
+                    values[text] = parse_marks(text)
+            cells.append((row_index, columns[key], values[marks[0]], values[marks[1]]))
+
+    awarded = np.full((len(students), len(questions)), np.nan)
+    allocated_by_student = np.full((len(students), len(questions)), np.nan)
+    if cells:
+        rows, cols, marks, allocated = (np.array(values) for values in zip(*cells))
+        awarded[rows, cols] = np.array(marks, dtype=float)
+        allocated_by_student[rows, cols] = np.array(allocated, dtype=float)
+    with np.errstate(all="ignore"):
+        allocated = np.nanmedian(allocated_by_student, axis=0) if len(students) else np.zeros(len(questions))
+    return students, questions, awarded, np.nan_to_num(allocated)
+
+
+def load_marks(exam_id, registry=None):
+    """marks_matrix() over every stored result of an exam"""
+    return marks_matrix(ResultsStore(registry or ExamRegistry()).load_all(exam_id))
+
+
+def question_statistics(awarded, allocated, group_fraction=GROUP_FRACTION):
+    """
+    Per-question statistics as a dict of arrays: mean, median, std, facility
+    (mean / marks, the classic difficulty index), discrimination (upper minus
+    lower group mean / marks, groups ranked by total score) and item_total
+    (correlation of the question with the total of the other questions).
+    """
+    with np.errstate(all="ignore"):
+        totals = np.nansum(awarded, axis=1)
+        mean = np.nanmean(awarded, axis=0)
+        median = np.nanmedian(awarded, axis=0)
+        std = np.nanstd(awarded, axis=0)
+        marks = np.where(allocated > 0, allocated, np.nan)
+
+        group = max(1, int(round(len(totals) * group_fraction)))
+        order = np.argsort(totals, kind="stable")
+        lower, upper = awarded[order[:group]], awarded[order[-group:]]
+        discrimination = (np.nanmean(upper, axis=0) - np.nanmean(lower, axis=0)) / marks
+
+        # Corrected item-total correlation, all questions at once
+        filled = np.where(np.isnan(awarded), 0.0, awarded)
+        rest = totals[:, None] - filled
+        item = filled - filled.mean(axis=0)
+        rest = rest - rest.mean(axis=0)
+        item_total = (item * rest).sum(axis=0) / np.sqrt((item ** 2).sum(axis=0) * (rest ** 2).sum(axis=0))
+
+    return {
+        "mean": mean, "median": median, "std": std, "facility": mean / marks,
+        "discrimination": discrimination, "item_total": item_total,
+        "answered": np.sum(~np.isnan(awarded), axis=0),
+    }
+
+
+def score_histogram(totals, max_score, bins=10):
+    """Return (counts, bin edges) of the total scores over 0..max_score"""
+    return np.histogram(totals, bins=bins, range=(0, max(max_score, 1e-9)))
+
+
+def scaling_curve(totals, max_score, target_mean, target_std=None):
+    """
+    Linear moderation of raw totals to a target mean (and spread, if given), clipped to 0..max_score.
+    Returns (raw marks 0..max_score, scaled marks) for tabulating the curve.
+    """
+    mean, std = float(np.mean(totals)), float(np.std(totals))
+    slope = target_std / std if target_std and std > 0 else 1.0
+    raw = np.arange(0, int(np.ceil(max_score)) + 1, dtype=float)
+    return raw, np.clip(target_mean + (raw - mean) * slope, 0, max_score)
+
+
+def robust_z(values, axis=0):
+    """Robust z-scores from the median and the median absolute deviation, ignoring NaN"""
+    with np.errstate(all="ignore"):
+        median = np.nanmedian(values, axis=axis, keepdims=True)
+        mad = np.nanmedian(np.abs(values - median), axis=axis, keepdims=True) * 1.4826
+        return np.where(mad > 0, (values - median) / mad, 0.0)
+
+
+def find_outliers(awarded, threshold=OUTLIER_Z):
+    """
+    Return (student indexes with an unusual total, [(student index, question index, z)]
+    for single question marks far from the rest of the class).
+    """
+    totals = np.nansum(awarded, axis=1)
+    total_z = robust_z(totals)
+    cell_z = robust_z(awarded)
+    students, questions = np.nonzero(np.abs(np.nan_to_num(cell_z)) > threshold)
+    cells = [(int(s), int(q), float(cell_z[s, q])) for s, q in zip(students, questions)]
+    return np.flatnonzero(np.abs(total_z) > threshold), cells
+
+
+def _number(value, digits=2):
+    return "-" if value is None or np.isnan(value) else f"{value:.{digits}f}"
+
+
+def analytics_sections(students, questions, awarded, allocated, target_mean=None, target_std=None, bins=10):
+    """Render the analytics as (heading, markdown) sections for generate_class_report"""
+    if not students or not questions:
+        return [("Class Analytics", "No graded results were found for this exam.")]
+    stats = question_statistics(awarded, allocated)
+    totals = np.nansum(awarded, axis=1)
+    max_score = float(allocated.sum())
+
+    rows = [{
+        QUESTION_COLUMN: question,
+        "Marks": _number(allocated[q], 1),
+        "Answered": str(stats["answered"][q]),
+        "Mean": _number(stats["mean"][q]),
+        "Median": _number(stats["median"][q]),
+        "Std Dev": _number(stats["std"][q]),
+        "Facility": _number(stats["facility"][q]),
+        "Discrimination": _number(stats["discrimination"][q]),
+        "Item-Total r": _number(stats["item_total"][q]),
+    } for q, question in enumerate(questions)]
+    flagged = [questions[q] for q in np.flatnonzero(np.nan_to_num(stats["discrimination"], nan=1.0) < 0.2)]
+    question_text = format_results_table(rows)
+    if flagged:
+        question_text += ("\n\nQuestions with a discrimination below 0.2 separate strong and weak students "
+                          "poorly and are worth reviewing: " + ", ".join(flagged) + ".")
+
+    percentiles = np.percentile(totals, [10, 25, 50, 75, 90])
+    counts, edges = score_histogram(totals, max_score, bins)
+    distribution = [
+        f"{len(students)} students, mean {np.mean(totals):.2f} / {max_score:g} "
+        f"(std dev {np.std(totals):.2f}), median {percentiles[2]:.2f}.",
+        "",
+        "Percentiles: " + ", ".join(f"P{p} {value:.1f}" for p, value in zip((10, 25, 50, 75, 90), percentiles)),
+        "",
+        "| Score Range | Students | |",
+        "| --- | --- | --- |",
+    ]
+    widest = max(int(counts.max()), 1)
+    for count, low, high in zip(counts, edges[:-1], edges[1:]):
+        distribution.append(f"| {low:.1f}–{high:.1f} | {count} | {'█' * int(round(20 * count / widest))} |")
+    sections = [("Question Statistics", question_text), ("Score Distribution", "\n".join(distribution))]
+
+    if target_mean is not None:
+        raw, scaled = scaling_curve(totals, max_score, target_mean, target_std)
+        step = max(1, len(raw) // 20)
+        curve = ["| Raw Mark | Scaled Mark |", "| --- | --- |"]
+        curve += [f"| {r:g} | {s:.1f} |" for r, s in zip(raw[::step], scaled[::step])]
+        sections.append(("Moderation Curve", f"Linear scaling to a mean of {target_mean:g}"
+                         + (f" and a std dev of {target_std:g}" if target_std else "") + ".\n\n" + "\n".join(curve)))
+
+    total_outliers, cell_outliers = find_outliers(awarded)
+    lines = []
+    for s in total_outliers:
+        lines.append(f"| {students[s]} | Total | {totals[s]:g} | {'high' if totals[s] > percentiles[2] else 'low'} |")
+    for s, q, z in cell_outliers:
+        lines.append(f"| {students[s]} | {questions[q]} | {awarded[s, q]:g} | {'high' if z > 0 else 'low'} |")
+    outlier_text = "No outliers were found."
+    if lines:
+        outlier_text = "\n".join(["| Student | Question | Marks | Unusually |", "| --- | --- | --- | --- |"] + lines)
+    sections.append(("Outliers", outlier_text))
+    return sections
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-question statistics and score distribution for an exam")
+    parser.add_argument("--exam", required=True, help="Registered exam ID")
+    parser.add_argument("--target-mean", type=float, help="Add a moderation curve scaling totals to this mean")
+    parser.add_argument("--target-std", type=float, help="Standard deviation for the moderation curve")
+    parser.add_argument("--bins", type=int, default=10, help="Histogram bins")
+    parser.add_argument("--similarity", action="store_true", help="Also flag similar answers across the cohort")
+    parser.add_argument("--output", help="Class report path")
+    args = parser.parse_args(argv)
+
+    from src.ui.report_generator import generate_class_report
+    students, questions, awarded, allocated = load_marks(args.exam)
+    sections = analytics_sections(students, questions, awarded, allocated, args.target_mean, args.target_std,
+                                  args.bins)
+    if args.similarity:
+        from src.utils.similarity import cohort_similarity, similarity_section
+        sections.append(("Answer Similarity", similarity_section(*cohort_similarity(args.exam))))
+    report_path = generate_class_report(args.exam, sections, args.output)
+    print(f"Analysed {len(students)} students and {len(questions)} questions; class report saved to {report_path}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
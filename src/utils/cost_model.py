@@ -0,0 +1,114 @@
+import os, sys, json, argparse, threading
+
+import numpy as np
+
+from src.utils.api_key_manager import ApiKeyManager
+from src.utils.pdf_loading import open_pdf, parse_page_ranges
+
+STAGES = ("render", "model")
+# Seconds per job, per page and per MB for each stage until enough runs have been recorded
+DEFAULT_COEFFICIENTS = {"render": [0.5, 0.3, 0.05], "model": [10.0, 1.5, 0.5]}
+
+
+def job_features(pdf_paths, page_selection=None):
+    """Return [pages, megabytes] over every PDF of a grading job, counting only selected pages"""
+    pages = 0
+    total_bytes = 0
+    for label, pdf_path in pdf_paths.items():
+        if not pdf_path:
+            continue
+        total_bytes += os.path.getsize(pdf_path)
+        with open_pdf(pdf_path) as pdf_document:
+            pages += len(parse_page_ranges((page_selection or {}).get(label), len(pdf_document)))
+    return [pages, total_bytes / (1024 * 1024)]
+
+
+class CostModel:
+    """
+    Predicts how long a grading job takes from its page count and size.
+    Render and model time are fitted separately by least squares over the
+    most recent runs, which are kept in a local JSON lines file.
+    """
+
+    def __init__(self, history_path=None, min_samples=10, window=500):
+        if history_path is None:
+            history_path = ApiKeyManager._get_config_path().parent / "job_costs.jsonl"
+        self.history_path = str(history_path)
+        self.min_samples = min_samples
+        self.window = window
+        self.lock = threading.Lock()
+        self.records = []
+        try:
+            with open(self.history_path, "r", encoding="utf-8") as f:
+                self.records = [json.loads(line) for line in f if line.strip()][-window:]
+        except (OSError, ValueError):
+            pass
+        self.coefficients = self._fit()
+
+    def _fit(self):
+        if len(self.records) < self.min_samples:
+            return dict(DEFAULT_COEFFICIENTS)
+        design = np.array([[1.0] + record["features"] for record in self.records])
+        coefficients = {}
+        for stage in STAGES:
+            actual = np.array([record["actual"][stage] for record in self.records])
+            solution = np.linalg.lstsq(design, actual, rcond=None)[0]
+            coefficients[stage] = [float(value) for value in solution]
+        return coefficients
+
+    def predict(self, features):
+        """Return {stage: seconds} plus the "total" for a job with the given features"""
+        with self.lock:
+            coefficients = self.coefficients
+        inputs = [1.0] + list(features)
+        prediction = {stage: max(0.0, float(np.dot(coefficients[stage], inputs))) for stage in STAGES}
+        prediction["total"] = sum(prediction[stage] for stage in STAGES)
+        return prediction
+
+    def record(self, features, predicted, actual):
+        """Store a finished job's timings and refit"""
+        record = {"features": list(features), "predicted": predicted["total"],
+                  "actual": {stage: actual.get(stage, 0.0) for stage in STAGES}}
+        with self.lock:
+            self.records.append(record)
+            self.records = self.records[-self.window:]
+            try:
+                os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+                with open(self.history_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                print(f"Could not save job timings: {e}")
+            self.coefficients = self._fit()
+
+    def error_summary(self):
+        """Predicted-vs-actual error over the recorded runs"""
+        with self.lock:
+            records = list(self.records)
+        if not records:
+            return {"jobs": 0}
+        predicted = np.array([record["predicted"] for record in records])
+        actual = np.array([sum(record["actual"].values()) for record in records])
+        errors = predicted - actual
+        return {
+            "jobs": len(records),
+            "mean_absolute_error_seconds": float(np.mean(np.abs(errors))),
+            "mean_absolute_percentage_error": float(np.mean(np.abs(errors) / np.maximum(actual, 1e-6)) * 100),
+            "bias_seconds": float(np.mean(errors)),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show how well job durations are being predicted")
+    parser.add_argument("--history", help="Job timing history (default: in the config folder)")
+    args = parser.parse_args(argv)
+
+    cost_model = CostModel(args.history)
+    for key, value in cost_model.error_summary().items():
+        print(f"{key:<34}{value:.2f}" if isinstance(value, float) else f"{key:<34}{value}")
+    for stage in STAGES:
+        base, per_page, per_mb = cost_model.coefficients[stage]
+        print(f"{stage:<34}{base:.2f}s + {per_page:.2f}s/page + {per_mb:.2f}s/MB")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
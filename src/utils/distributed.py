@@ -0,0 +1,442 @@
+import os, sys, json, time, uuid, socket, argparse, tempfile, threading
+import urllib.request, urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.ui.prompts import construct_prompt
+from src.ui.report_generator import generate_markdown_report
+from src.utils.cost_model import CostModel, job_features
+from src.utils.exam_bundle import ExamBundle
+from src.utils.metrics import JOBS, JOBS_IN_FLIGHT, serve_metrics
+from src.utils.result_parser import parse_results_table
+
+
+class GradingJob:
+    """One student script waiting to be graded"""
+
+    def __init__(self, student, files):
+        self.job_id = uuid.uuid4().hex
+        self.student = student
+        self.files = files  # label -> file id served by the coordinator
+        self.state = "pending"
+        self.lease_id = None
+        self.lease_expires = 0.0
+        self.worker = None
+        self.attempts = 0
+        self.response_text = None
+        self.error = None
+        self.predicted_seconds = 0.0
+
+
+def _student_names(student_pdfs):
+    """
+    Name each script after its file. Scripts that share a file name are named
+    by their path below the folder all the scripts have in common, so their
+    reports and results do not overwrite each other.
+    """
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in student_pdfs]
+    paths = [os.path.abspath(path) for path in student_pdfs]
+    try:
+        root = os.path.commonpath([os.path.dirname(path) for path in paths]) if paths else ""
+    except ValueError:
+        # Scripts on different drives
+        root = None
+    names = []
+    for path, stem in zip(paths, stems):
+        name = stem
+        if stems.count(stem) > 1 and root is not None:
+            name = os.path.splitext(os.path.relpath(path, root))[0].replace(os.sep, "_")
+        # Still taken: the same file listed twice, or scripts on different drives
+        unique, number = name, 2
+        while unique in names:
+            unique, number = f"{name}_{number}", number + 1
+        names.append(unique)
+    return names
+
+
+class Coordinator:
+    """
+    Holds a grading batch and hands jobs out to workers on short leases.
+    Leases that are not completed or renewed in time are re-issued.
+    With an exam bundle, workers receive the pre-rendered exam instead of its PDFs.
+    A boilerplate PDF (cover, instructions) goes to the workers alongside the
+    exam so matching pages of every script are skipped.
+    """
+
+    def __init__(self, question_pdf, student_pdfs, reference_pdf=None, output_dir="reports",
+                 lease_seconds=600, max_attempts=3, cost_model=None, exam_bundle=None, boilerplate_pdf=None):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.output_dir = output_dir
+        self.prompt = construct_prompt(bool(reference_pdf))
+        self.bundle_digest = None
+        self.lock = threading.Lock()
+        self.files = {}
+        self.jobs = {}
+        cost_model = cost_model or CostModel()
+
+        if exam_bundle:
+            with ExamBundle(exam_bundle) as bundle:
+                bundle.verify()
+                self.prompt = bundle.prompt
+                self.bundle_digest = bundle.digest
+            exam_files = {"Exam Bundle": self._add_file(exam_bundle)}
+        else:
+            exam_files = {"Question Paper": self._add_file(question_pdf)}
+            if reference_pdf:
+                exam_files["Reference Answer"] = self._add_file(reference_pdf)
+        if boilerplate_pdf:
+            exam_files["Boilerplate"] = self._add_file(boilerplate_pdf)
+        for student, student_pdf in zip(_student_names(student_pdfs), student_pdfs):
+            files = dict(exam_files)
+            files["Actual Answer"] = self._add_file(student_pdf)
+            job = GradingJob(student, files)
+            job.predicted_seconds = cost_model.predict(job_features(
+                {label: self.files[file_id] for label, file_id in files.items()
+                 if label not in ("Exam Bundle", "Boilerplate")}))["total"]
+            self.jobs[job.job_id] = job
+
+    def _add_file(self, path):
+        file_id = uuid.uuid4().hex
+        self.files[file_id] = os.path.abspath(path)
+        return file_id
+
+    def _reclaim_expired(self, now):
+        for job in self.jobs.values():
+            if job.state == "leased" and job.lease_expires < now:
+                print(f"Lease for {job.student} held by {job.worker} expired, re-issuing")
+                job.state = "pending"
+                job.lease_id = None
+
+    def lease(self, worker):
+        """Hand out the longest pending job, or None when nothing is available"""
+        with self.lock:
+            now = time.time()
+            self._reclaim_expired(now)
+            # Largest-first keeps long scripts from finishing last on an otherwise idle pool
+            for job in sorted(self.jobs.values(), key=lambda job: -job.predicted_seconds):
+                if job.state == "pending":
+                    job.state = "leased"
+                    job.lease_id = uuid.uuid4().hex
+                    job.lease_expires = now + self.lease_seconds
+                    job.worker = worker
+                    job.attempts += 1
+                    return {
+                        "job_id": job.job_id,
+                        "lease_id": job.lease_id,
+                        "lease_seconds": self.lease_seconds,
+                        "student": job.student,
+                        "files": job.files,
+                        "prompt": self.prompt,
+                        "bundle_digest": self.bundle_digest,
+                    }
+        return None
+
+    def _leased_job(self, job_id, lease_id):
+        job = self.jobs.get(job_id)
+        if job is None or job.state != "leased" or job.lease_id != lease_id:
+            return None
+        return job
+
+    def renew(self, job_id, lease_id):
+        """Extend a lease; returns False if it was already re-issued"""
+        with self.lock:
+            job = self._leased_job(job_id, lease_id)
+            if job is None:
+                return False
+            job.lease_expires = time.time() + self.lease_seconds
+            return True
+
+    def complete(self, job_id, lease_id, response_text=None, error=None):
+        """Record a worker's result; returns False for stale leases"""
+        with self.lock:
+            job = self._leased_job(job_id, lease_id)
+            if job is None:
+                return False
+            job.lease_id = None
+            if error is not None:
+                job.error = error
+                job.state = "pending" if job.attempts < self.max_attempts else "failed"
+                print(f"Job for {job.student} failed on {job.worker}: {error}")
+                return True
+            job.response_text = response_text
+            job.state = "done"
+        self._write_report(job)
+        return True
+
+    def _write_report(self, job):
+        os.makedirs(self.output_dir, exist_ok=True)
+        report_path = os.path.join(self.output_dir, f"report_{job.student}.md")
+        generate_markdown_report(job.response_text, report_path)
+        print(f"Graded {job.student} ({len(parse_results_table(job.response_text))} questions) -> {report_path}")
+
+    def is_finished(self):
+        with self.lock:
+            return all(job.state in ("done", "failed") for job in self.jobs.values())
+
+    def status(self):
+        with self.lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.state] = counts.get(job.state, 0) + 1
+            return {"total": len(self.jobs), "counts": counts}
+
+    def results(self):
+        """Return structured results for every finished job"""
+        with self.lock:
+            return {
+                job.student: {
+                    "state": job.state,
+                    "rows": parse_results_table(job.response_text) if job.response_text else [],
+                    "error": job.error,
+                }
+                for job in self.jobs.values()
+            }
+
+    def serve(self, host="127.0.0.1", port=8765):
+        """Start the HTTP server in a background thread and return it"""
+        server = ThreadingHTTPServer((host, port), _make_handler(self))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+
+def _make_handler(coordinator):
+    class CoordinatorHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if self.path == "/status":
+                self._send_json(200, coordinator.status())
+            elif self.path.startswith("/files/"):
+                path = coordinator.files.get(self.path[len("/files/"):])
+                if path is None:
+                    self._send_json(404, {"error": "unknown file"})
+                    return
+                with open(path, "rb") as f:
+                    data = f.read()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream" if path.endswith(".rcbundle")
+                                 else "application/pdf")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            payload = self._read_json()
+            if self.path == "/lease":
+                job = coordinator.lease(payload.get("worker", "unknown"))
+                if job is not None:
+                    self._send_json(200, job)
+                else:
+                    self._send_json(200, {"done": coordinator.is_finished()})
+            elif self.path == "/renew":
+                ok = coordinator.renew(payload["job_id"], payload["lease_id"])
+                self._send_json(200 if ok else 409, {"ok": ok})
+            elif self.path == "/result":
+                ok = coordinator.complete(payload["job_id"], payload["lease_id"],
+                                          payload.get("response_text"), payload.get("error"))
+                self._send_json(200 if ok else 409, {"ok": ok})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+    return CoordinatorHandler
+
+
+class Worker:
+    """Pulls jobs from a coordinator, renders and grades them locally and pushes results back"""
+
+    def __init__(self, coordinator_url, processor, worker_id=None, poll_interval=5, request_timeout=30):
+        self.coordinator_url = coordinator_url.rstrip("/")
+        self.processor = processor
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.request_timeout = request_timeout
+        self.file_cache_dir = tempfile.mkdtemp()
+        self.file_cache = {}
+        self.bundles = {}
+
+    def _post(self, path, payload):
+        request = urllib.request.Request(
+            self.coordinator_url + path, data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.request_timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 409:
+                return {"ok": False}
+            raise
+
+    def _fetch_file(self, file_id):
+        # Exam inputs are shared by every job, so they are only downloaded once
+        if file_id not in self.file_cache:
+            path = os.path.join(self.file_cache_dir, f"{file_id}.pdf")
+            with urllib.request.urlopen(f"{self.coordinator_url}/files/{file_id}",
+                                        timeout=self.request_timeout) as response:
+                with open(path, "wb") as f:
+                    f.write(response.read())
+            self.file_cache[file_id] = path
+        return self.file_cache[file_id]
+
+    def _open_bundle(self, file_id, digest):
+        # Opened once per batch; the digest check means a damaged download is never trusted
+        if file_id not in self.bundles:
+            try:
+                bundle = ExamBundle(self._fetch_file(file_id), digest)
+                bundle.verify()
+            except ValueError:
+                os.remove(self.file_cache.pop(file_id))
+                raise
+            self.bundles[file_id] = bundle
+        return self.bundles[file_id]
+
+    def _keep_lease_alive(self, job, stop_event):
+        interval = max(1, job["lease_seconds"] / 3)
+        while not stop_event.wait(interval):
+            try:
+                self._post("/renew", {"job_id": job["job_id"], "lease_id": job["lease_id"]})
+            except OSError as e:
+                print(f"Could not renew the lease for {job['student']}: {e}")
+
+    def run_job(self, job):
+        stop_event = threading.Event()
+        heartbeat = threading.Thread(target=self._keep_lease_alive, args=(job, stop_event), daemon=True)
+        heartbeat.start()
+        result = {"job_id": job["job_id"], "lease_id": job["lease_id"]}
+        JOBS_IN_FLIGHT.inc()
+        try:
+            files = dict(job["files"])
+            bundle_id = files.pop("Exam Bundle", None)
+            exam_bundle = self._open_bundle(bundle_id, job.get("bundle_digest")) if bundle_id else None
+            boilerplate_id = files.pop("Boilerplate", None)
+            boilerplate_pdf = self._fetch_file(boilerplate_id) if boilerplate_id else None
+            pdf_paths = {label: self._fetch_file(file_id) for label, file_id in files.items()}
+            result["response_text"] = self.processor.process_pdfs(pdf_paths, job["prompt"], exam_bundle=exam_bundle,
+                                                                  boilerplate_pdf=boilerplate_pdf)
+            JOBS.inc(status="succeeded")
+        except Exception as e:
+            result["error"] = str(e)
+            JOBS.inc(status="failed")
+        finally:
+            JOBS_IN_FLIGHT.dec()
+            stop_event.set()
+        if not self._post("/result", result).get("ok"):
+            print(f"Result for {job['student']} discarded, lease was re-issued")
+
+    def run(self):
+        """Process jobs until the coordinator reports the batch is finished"""
+        idle = False
+        try:
+            while True:
+                try:
+                    job = self._post("/lease", {"worker": self.worker_id})
+                except urllib.error.HTTPError:
+                    raise
+                except OSError as e:
+                    # The coordinator shuts down once the batch is finished; waiting workers just stop
+                    if idle:
+                        print(f"[{self.worker_id}] coordinator is gone ({e}), stopping")
+                        return
+                    raise
+                if "job_id" in job:
+                    print(f"[{self.worker_id}] grading {job['student']}")
+                    self.run_job(job)
+                    idle = False
+                elif job.get("done"):
+                    return
+                else:
+                    idle = True
+                    time.sleep(self.poll_interval)
+        finally:
+            for bundle in self.bundles.values():
+                bundle.close()
+            for path in self.file_cache.values():
+                os.remove(path)
+            os.rmdir(self.file_cache_dir)
+
+
+def _collect_pdfs(paths):
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdfs.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                               if name.lower().endswith(".pdf")))
+        else:
+            pdfs.append(path)
+    return pdfs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed grading for Rison Copy Checker")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    coordinator_parser = subparsers.add_parser("coordinator", help="Serve a batch of answer sheets to workers")
+    exam_group = coordinator_parser.add_mutually_exclusive_group(required=True)
+    exam_group.add_argument("--question", help="Question paper PDF")
+    exam_group.add_argument("--bundle", help="Exam bundle built with src.utils.exam_bundle")
+    coordinator_parser.add_argument("--reference", help="Reference answer PDF")
+    coordinator_parser.add_argument("--boilerplate",
+                                    help="PDF of cover or instruction pages that scripts repeat and need not be sent")
+    coordinator_parser.add_argument("--scripts", nargs="+", required=True, help="Answer sheet PDFs or folders")
+    coordinator_parser.add_argument("--output", default="reports", help="Folder for the generated reports")
+    coordinator_parser.add_argument("--host", default="127.0.0.1")
+    coordinator_parser.add_argument("--port", type=int, default=8765)
+    coordinator_parser.add_argument("--lease-seconds", type=int, default=600)
+    coordinator_parser.add_argument("--shutdown-grace", type=float, default=15,
+                                    help="Seconds to keep telling workers the batch is done before exiting")
+
+    worker_parser = subparsers.add_parser("worker", help="Pull and grade jobs from a coordinator")
+    worker_parser.add_argument("--coordinator", default="http://127.0.0.1:8765")
+    worker_parser.add_argument("--id", help="Worker name shown in coordinator logs")
+    worker_parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    worker_parser.add_argument("--large-requests", choices=("upload", "split"),
+                               help="How to send answer sheets over the inline request limit (default: the requests section of config.json, else upload)")
+    worker_parser.add_argument("--pack-pages", action="store_true",
+                               help="Pack nearly blank pages several to an image (default: the page_packing section of config.json)")
+
+    args = parser.parse_args(argv)
+
+    if args.mode == "coordinator":
+        coordinator = Coordinator(args.question, _collect_pdfs(args.scripts), args.reference,
+                                  args.output, args.lease_seconds, exam_bundle=args.bundle,
+                                  boilerplate_pdf=args.boilerplate)
+        server = coordinator.serve(args.host, args.port)
+        print(f"Coordinator serving {len(coordinator.jobs)} scripts on {args.host}:{args.port}")
+        try:
+            while not coordinator.is_finished():
+                time.sleep(1)
+            # Idle workers poll every few seconds; give each a chance to hear "done" before going away
+            time.sleep(args.shutdown_grace)
+        finally:
+            server.shutdown()
+        print(f"Batch finished: {coordinator.status()['counts']}")
+    else:
+        from src.utils.api_key_manager import ApiKeyManager
+        from src.utils.page_packing import PagePacker
+        from src.utils.pdf_processor import PDFProcessor
+        from src.utils.request_planner import RequestPlanner
+        if args.metrics_port:
+            serve_metrics(args.metrics_port)
+        processor = PDFProcessor(
+            ApiKeyManager.get_api_key(), page_packer=PagePacker() if args.pack_pages else None,
+            request_planner=RequestPlanner(strategy=args.large_requests) if args.large_requests else None)
+        Worker(args.coordinator, processor, args.id).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import os, sys, json, mmap, base64, struct, hashlib, argparse, tempfile
+from datetime import datetime
+
+from src.utils.answer_key import KeyEntry, answer_key_from_pdfs, _page_texts
+from src.utils.regrade import split_questions
+from src.utils.render_cache import RENDER_DPI
+
+MAGIC = b"RCBUNDLE"
+VERSION = 1
+# Magic, format version, reserved flags, index length and the index's SHA-256
+HEADER = struct.Struct("<8sHHI32s")
+# Page payloads start on a page boundary so they can be mapped straight from disk
+ALIGNMENT = 4096
+EXAM_LABELS = ("Question Paper", "Reference Answer")
+
+
+def file_sha256(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_bundle(bundle_path, processor, pdf_paths, prompt_text, name=None, page_selection=None):
+    """
+    Render the question paper and reference once and store them as an exam bundle.
+    The bundle holds each page's encoded payload and hash, the encoding profile,
+    the prompt and, when local scoring is on, the answer key read from the PDFs.
+    Returns the bundle's digest.
+    """
+    exam_paths = {label: pdf_paths[label] for label in EXAM_LABELS if pdf_paths.get(label)}
+    if "Question Paper" not in exam_paths:
+        raise ValueError("An exam bundle needs a question paper")
+    page_selection = page_selection or {}
+    encoded_images_sets = processor.prepare_pages(exam_paths, page_selection=page_selection)
+
+    payloads, pages, offset = [], [], 0
+    for encoded_images in encoded_images_sets:
+        for encoded in encoded_images:
+            data = base64.b64decode(encoded["img_base64"])
+            pages.append({
+                "label": encoded["label"],
+                "page_number": encoded["page_number"],
+                "pages": encoded.get("pages"),
+                "mime_type": encoded["mime_type"],
+                "offset": offset,
+                "length": len(data),
+                "sha256": hashlib.sha256(data).hexdigest(),
+            })
+            payloads.append(data)
+            offset += len(data)
+
+    question_texts = _page_texts(exam_paths["Question Paper"], page_selection.get("Question Paper"))
+    key = answer_key_from_pdfs(exam_paths, page_selection=page_selection) if processor.local_scoring else {}
+    index = {
+        "name": name or os.path.splitext(os.path.basename(exam_paths["Question Paper"]))[0],
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "encoding": {
+            "dpi": RENDER_DPI,
+            "deduplicate": processor.deduplicate_pages,
+            "packed": processor.page_packer is not None,
+        },
+        "prompt": prompt_text,
+        "has_reference": "Reference Answer" in exam_paths,
+        "sources": {label: {"file": os.path.basename(path), "sha256": file_sha256(path),
+                            "pages": page_selection.get(label)}
+                    for label, path in exam_paths.items()},
+        "questions": list(split_questions(list(question_texts.values()))[0]),
+        "answer_key": [list(entry) for entry in key.values()],
+        "pages": pages,
+    }
+    index_bytes = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    index_digest = hashlib.sha256(index_bytes).digest()
+    data_start = -(-(HEADER.size + len(index_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    # Written next to the target and renamed, so readers never see a partial bundle
+    bundle_dir = os.path.dirname(os.path.abspath(bundle_path))
+    fd, temp_path = tempfile.mkstemp(dir=bundle_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, len(index_bytes), index_digest))
+            f.write(index_bytes)
+            f.write(b"\0" * (data_start - HEADER.size - len(index_bytes)))
+            for data in payloads:
+                f.write(data)
+        os.replace(temp_path, bundle_path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return index_digest.hex()
+
+
+class ExamBundle:
+    """
+    A memory-mapped exam bundle. Opening one reads only the header and the
+    index; page payloads are sliced out of the map as they are used and
+    checked against their hash. The digest is the hash of the index, which
+    lists every page's hash, so it identifies the whole bundle's content.
+    """
+
+    def __init__(self, bundle_path, expected_digest=None):
+        self.path = bundle_path
+        with open(bundle_path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self.map) < HEADER.size:
+                raise ValueError(f"{bundle_path} is not an exam bundle")
+            magic, version, _, index_length, index_digest = HEADER.unpack_from(self.map)
+            if magic != MAGIC:
+                raise ValueError(f"{bundle_path} is not an exam bundle")
+            if version != VERSION:
+                raise ValueError(f"Unsupported exam bundle version {version}")
+            index_bytes = self.map[HEADER.size:HEADER.size + index_length]
+            if hashlib.sha256(index_bytes).digest() != index_digest:
+                raise ValueError(f"The index of {bundle_path} is corrupt")
+            self.digest = index_digest.hex()
+            if expected_digest and expected_digest != self.digest:
+                raise ValueError(f"{bundle_path} does not match the expected digest {expected_digest}")
+            self.index = json.loads(index_bytes)
+            self.data_start = -(-(HEADER.size + index_length) // ALIGNMENT) * ALIGNMENT
+        except Exception:
+            self.map.close()
+            raise
+        self.labels = set(self.index["sources"])
+        self.prompt = self.index["prompt"]
+        self.questions = self.index["questions"]
+        self.answer_key = {entry[0]: KeyEntry(*entry) for entry in self.index["answer_key"]}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.map.close()
+
+    def read_page(self, entry, verify=True):
+        """Return the payload bytes of one index entry, checking its hash"""
+        start = self.data_start + entry["offset"]
+        data = self.map[start:start + entry["length"]]
+        if len(data) != entry["length"] or (verify and hashlib.sha256(data).hexdigest() != entry["sha256"]):
+            raise ValueError(f"{entry['label']} page {entry['page_number']} in {self.path} is corrupt")
+        return data
+
+    def verify(self):
+        """Check every page against its hash; raises ValueError on the first mismatch"""
+        for entry in self.index["pages"]:
+            self.read_page(entry)
+
+    def encoded_sets(self, verify=True):
+        """The exam pages as prepare_pages() returns them, one list per PDF"""
+        encoded_images_sets = []
+        sets_by_label = {}
+        for entry in self.index["pages"]:
+            if entry["label"] not in sets_by_label:
+                sets_by_label[entry["label"]] = []
+                encoded_images_sets.append(sets_by_label[entry["label"]])
+            encoded = {
+                "label": entry["label"],
+                "page_number": entry["page_number"],
+                "mime_type": entry["mime_type"],
+                "img_base64": base64.b64encode(self.read_page(entry, verify)).decode("utf-8"),
+            }
+            if entry.get("pages"):
+                encoded["pages"] = entry["pages"]
+            sets_by_label[entry["label"]].append(encoded)
+        return encoded_images_sets
+
+    def matches(self, pdf_paths):
+        """Whether the bundle was built from exactly these exam PDFs"""
+        exam_paths = {label: pdf_paths[label] for label in EXAM_LABELS if pdf_paths.get(label)}
+        sources = self.index["sources"]
+        return (set(exam_paths) == set(sources)
+                and all(file_sha256(path) == sources[label]["sha256"] for label, path in exam_paths.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or check a pre-rendered exam bundle")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Render an exam into a bundle")
+    build_parser.add_argument("--question", required=True, help="Question paper PDF")
+    build_parser.add_argument("--reference", help="Reference answer PDF")
+    build_parser.add_argument("--name", help="Exam name stored in the bundle")
+    build_parser.add_argument("--output", required=True, help="Bundle path, e.g. exam.rcbundle")
+
+    verify_parser = subparsers.add_parser("verify", help="Check a bundle's pages against their hashes")
+    verify_parser.add_argument("bundle")
+    verify_parser.add_argument("--digest", help="Also require this bundle digest")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        from src.ui.prompts import construct_prompt
+        from src.utils.pdf_processor import PDFProcessor
+        pdf_paths = {"Question Paper": args.question, "Reference Answer": args.reference}
+        # Rendering needs no model access, so no API key is required
+        digest = write_bundle(args.output, PDFProcessor(None, router=False), pdf_paths,
+                              construct_prompt(bool(args.reference)), args.name)
+        print(f"Exam bundle saved to {args.output} (digest {digest})")
+        return 0
+
+    try:
+        with ExamBundle(args.bundle, args.digest) as bundle:
+            bundle.verify()
+            index = bundle.index
+            print(f"{index['name']}: {len(index['pages'])} pages, {len(bundle.answer_key)} answer key entries, "
+                  f"rendered at {index['encoding']['dpi']} dpi on {index['created']}")
+            print(f"Digest {bundle.digest} verified")
+    except (OSError, ValueError) as e:
+        print(f"Bundle check failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
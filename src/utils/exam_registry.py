@@ -0,0 +1,146 @@
+import os, re, json, uuid, threading
+from datetime import datetime
+
+from src.utils.api_key_manager import ApiKeyManager
+
+EXAM_FILES = {
+    "Question Paper": "question.pdf",
+    "Reference Answer": "reference.pdf",
+}
+# Optional pages (cover, instructions, rough work) never sent to the model; not one of the graded PDFs
+BOILERPLATE_FILE = "boilerplate.pdf"
+# Stored grading results live here, inside the exam's folder (see ResultsStore)
+RESULTS_DIR = "results"
+
+
+class ExamRegistry:
+    """
+    Stores exam-level inputs (question paper, optional reference and optional
+    boilerplate pages) once, so each submission only needs to bring the
+    student's answer sheet.
+    """
+
+    def __init__(self, root_dir=None):
+        if root_dir is None:
+            root_dir = ApiKeyManager._get_config_path().parent / "exams"
+        self.root_dir = str(root_dir)
+        self.lock = threading.Lock()
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def exam_dir(self, exam_id):
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", exam_id or ""):
+            raise ValueError(f"Invalid exam ID: {exam_id!r}")
+        return os.path.join(self.root_dir, exam_id)
+
+    def register(self, question_pdf, reference_pdf=None, name=None, exam_id=None, boilerplate_pdf=None):
+        """
+        Register an exam from PDF bytes and return its ID.
+        boilerplate_pdf holds pages (cover, instructions) that scripts repeat
+        and that are never sent for grading.
+        Registering an existing exam ID replaces its PDFs but keeps its stored
+        results; if the reference changed, run regrade to bring them up to date.
+        """
+        exam_id = exam_id or uuid.uuid4().hex[:12]
+        exam_dir = self.exam_dir(exam_id)
+        with self.lock:
+            metadata = self.metadata(exam_id) or {}
+            os.makedirs(exam_dir, exist_ok=True)
+            reference_path = os.path.join(exam_dir, EXAM_FILES["Reference Answer"])
+            if os.path.isdir(os.path.join(exam_dir, RESULTS_DIR)) and "reference_fingerprint" not in metadata:
+                old_reference = None
+                if os.path.exists(reference_path):
+                    with open(reference_path, "rb") as f:
+                        old_reference = f.read()
+                if old_reference != (reference_pdf or None):
+                    # Regrading diffs against the reference the stored results were graded with
+                    from src.utils.regrade import document_fingerprint
+                    metadata["reference_fingerprint"] = document_fingerprint(reference_path) if old_reference else None
+            for filename, data in ((EXAM_FILES["Question Paper"], question_pdf),
+                                   (EXAM_FILES["Reference Answer"], reference_pdf),
+                                   (BOILERPLATE_FILE, boilerplate_pdf)):
+                path = os.path.join(exam_dir, filename)
+                if data:
+                    with open(path, "wb") as f:
+                        f.write(data)
+                elif os.path.exists(path):
+                    os.remove(path)
+            metadata.update({
+                "exam_id": exam_id,
+                "name": name or metadata.get("name") or exam_id,
+                "created": metadata.get("created") or datetime.now().isoformat(timespec="seconds"),
+            })
+            self._write_metadata(exam_id, metadata)
+        return exam_id
+
+    def register_files(self, question_path, reference_path=None, name=None, exam_id=None, boilerplate_path=None):
+        """Register an exam from PDF files on disk"""
+        with open(question_path, "rb") as f:
+            question_pdf = f.read()
+        reference_pdf = None
+        if reference_path:
+            with open(reference_path, "rb") as f:
+                reference_pdf = f.read()
+        boilerplate_pdf = None
+        if boilerplate_path:
+            with open(boilerplate_path, "rb") as f:
+                boilerplate_pdf = f.read()
+        return self.register(question_pdf, reference_pdf, name, exam_id, boilerplate_pdf)
+
+    def replace_file(self, exam_id, label, data):
+        """Replace one of an exam's PDFs (e.g. a corrected reference) and return its path"""
+        if not self.exists(exam_id):
+            raise KeyError(f"Unknown exam: {exam_id}")
+        path = os.path.join(self.exam_dir(exam_id), EXAM_FILES[label])
+        with self.lock:
+            with open(path, "wb") as f:
+                f.write(data)
+        return path
+
+    def _metadata_path(self, exam_id):
+        return os.path.join(self.exam_dir(exam_id), "exam.json")
+
+    def _write_metadata(self, exam_id, metadata):
+        with open(self._metadata_path(exam_id), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2)
+
+    def metadata(self, exam_id):
+        """Return the stored metadata for an exam, or None if it is not registered"""
+        try:
+            with open(self._metadata_path(exam_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def update_metadata(self, exam_id, **values):
+        with self.lock:
+            metadata = self.metadata(exam_id)
+            if metadata is None:
+                raise KeyError(f"Unknown exam: {exam_id}")
+            metadata.update(values)
+            self._write_metadata(exam_id, metadata)
+
+    def exists(self, exam_id):
+        return self.metadata(exam_id) is not None
+
+    def pdf_paths(self, exam_id):
+        """Return the exam's PDF paths keyed by label, as used by PDFProcessor"""
+        if not self.exists(exam_id):
+            raise KeyError(f"Unknown exam: {exam_id}")
+        pdf_paths = {}
+        for label, filename in EXAM_FILES.items():
+            path = os.path.join(self.exam_dir(exam_id), filename)
+            pdf_paths[label] = path if os.path.exists(path) else ""
+        return pdf_paths
+
+    def boilerplate_path(self, exam_id):
+        """Return the path of the exam's boilerplate pages, or None if it has none"""
+        path = os.path.join(self.exam_dir(exam_id), BOILERPLATE_FILE)
+        return path if os.path.exists(path) else None
+
+    def list_exams(self):
+        exams = []
+        for exam_id in sorted(os.listdir(self.root_dir)):
+            metadata = self.metadata(exam_id)
+            if metadata is not None:
+                exams.append(metadata)
+        return exams
@@ -0,0 +1,350 @@
+import os, sys, json, time, uuid, queue, argparse, tempfile, threading
+import urllib.request
+from datetime import datetime
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.ui.prompts import construct_prompt
+from src.ui.report_generator import generate_markdown_report
+from src.utils.cancellation import CancellationToken, JobCancelled
+from src.utils.exam_registry import ExamRegistry
+from src.utils.metrics import REGISTRY
+from src.utils.pdf_loading import open_pdf, parse_page_ranges
+from src.utils.result_parser import parse_results_table
+from src.utils.results_store import ResultsStore
+
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+# Finished jobs are forgotten after this many seconds; their reports stay on disk
+JOB_TTL_SECONDS = 24 * 60 * 60
+
+
+def parse_multipart(content_type, body):
+    """
+    Parse a multipart/form-data body.
+    Returns (fields, files) where files maps field name to (filename, bytes).
+    """
+    message = BytesParser(policy=default_policy).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    if not message.is_multipart():
+        raise ValueError("Expected a multipart/form-data body")
+    fields, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if not name:
+            continue
+        payload = part.get_payload(decode=True) or b""
+        filename = part.get_filename()
+        if filename:
+            files[name] = (filename, payload)
+        else:
+            fields[name] = payload.decode("utf-8")
+    return fields, files
+
+
+class SubmissionJob:
+    """A student's answer sheet submitted for grading"""
+
+    def __init__(self, exam_id, student, script_path, callback_url=None, deadline=None):
+        self.job_id = uuid.uuid4().hex
+        self.exam_id = exam_id
+        self.student = student
+        self.script_path = script_path
+        self.callback_url = callback_url
+        self.cancel_token = CancellationToken(deadline)
+        self.state = "queued"
+        self.submitted = datetime.now().isoformat(timespec="seconds")
+        self.response_text = None
+        self.report_path = None
+        self.error = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "exam_id": self.exam_id,
+            "student": self.student,
+            "state": self.state,
+            "submitted": self.submitted,
+            "results": parse_results_table(self.response_text) if self.response_text else [],
+            "error": self.error,
+        }
+
+
+class GradingServer:
+    """
+    Local HTTP front end for LMS integration.
+    Exams are registered once; submissions only upload the student's script and
+    are queued on a bounded ProcessingService, answering 503 when it is full.
+    """
+
+    def __init__(self, service, registry=None, output_dir="reports", max_upload_bytes=MAX_UPLOAD_BYTES,
+                 job_deadline=None, job_ttl=JOB_TTL_SECONDS):
+        self.service = service
+        self.job_deadline = job_deadline
+        self.job_ttl = job_ttl
+        self.registry = registry or ExamRegistry()
+        self.store = ResultsStore(self.registry)
+        self.output_dir = output_dir
+        self.max_upload_bytes = max_upload_bytes
+        self.spool_dir = tempfile.mkdtemp()
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def register_exam(self, fields, files):
+        if "question" not in files:
+            raise ValueError("A 'question' PDF is required")
+        reference = files.get("reference", (None, None))[1]
+        boilerplate = files.get("boilerplate", (None, None))[1]
+        return self.registry.register(files["question"][1], reference, fields.get("name"), fields.get("exam_id"),
+                                      boilerplate)
+
+    def submit(self, fields, files):
+        """
+        Queue a submission and return its job.
+        Raises KeyError for unknown exams, ValueError for invalid fields or an
+        unreadable script, and queue.Full when the service is saturated.
+        """
+        exam_id = fields.get("exam_id", "")
+        if not self.registry.exists(exam_id):
+            raise KeyError(f"Unknown exam: {exam_id}")
+        if "script" not in files:
+            raise ValueError("A 'script' PDF is required")
+        filename, data = files["script"]
+        student = fields.get("student") or os.path.splitext(os.path.basename(filename))[0]
+        try:
+            # Seconds from submission until the job is abandoned, queueing included
+            deadline = float(fields.get("deadline") or 0) or self.job_deadline
+            # Re-submissions jump ahead of first-time scripts unless the caller sets a priority
+            priority = int(fields.get("priority") or (1 if self.store.load(exam_id, student) else 0))
+        except ValueError:
+            raise ValueError("'deadline' must be a number of seconds and 'priority' an integer")
+
+        script_path = os.path.join(self.spool_dir, f"{uuid.uuid4().hex}.pdf")
+        with open(script_path, "wb") as f:
+            f.write(data)
+        job = SubmissionJob(exam_id, student, script_path, fields.get("callback_url"), deadline)
+        try:
+            try:
+                pdf_document = open_pdf(script_path)
+            except Exception as e:
+                raise ValueError(f"'script' is not a readable PDF: {e}")
+            page_selection = {}
+            with pdf_document:
+                if fields.get("pages"):
+                    page_selection["Actual Answer"] = parse_page_ranges(fields["pages"], len(pdf_document))
+
+            pdf_paths = self.registry.pdf_paths(exam_id)
+            pdf_paths["Actual Answer"] = script_path
+            prompt = construct_prompt(bool(pdf_paths["Reference Answer"]))
+            future = self.service.submit(pdf_paths, prompt, lambda value: self._mark_running(job), use_rubric=True,
+                                         priority=priority, cancel_token=job.cancel_token,
+                                         page_selection=page_selection,
+                                         boilerplate_pdf=self.registry.boilerplate_path(exam_id))
+        except Exception:
+            os.remove(script_path)
+            raise
+        with self.lock:
+            self._expire_jobs()
+            self.jobs[job.job_id] = job
+        future.add_done_callback(lambda done: self._job_done(job, done))
+        return job
+
+    def _expire_jobs(self):
+        # Called with the lock held; keeps a long-running service from holding every job it ever saw
+        cutoff = time.monotonic() - self.job_ttl
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def _mark_running(self, job):
+        job.state = "running"
+
+    def _job_done(self, job, future):
+        try:
+            job.response_text = future.result()
+            os.makedirs(self.output_dir, exist_ok=True)
+            job.report_path = generate_markdown_report(
+                job.response_text, os.path.join(self.output_dir, f"report_{job.exam_id}_{job.job_id}.md"))
+            self.store.save(job.exam_id, job.student, parse_results_table(job.response_text),
+                            job.response_text, job.script_path, job_id=job.job_id)
+            job.state = "done"
+        except JobCancelled as e:
+            job.error = str(e)
+            job.state = "cancelled"
+        except Exception as e:
+            job.error = str(e)
+            job.state = "failed"
+        finally:
+            try:
+                os.remove(job.script_path)
+            except OSError:
+                pass
+            job.finished_at = time.monotonic()
+        if job.callback_url:
+            threading.Thread(target=self._send_webhook, args=(job,), daemon=True).start()
+
+    def _send_webhook(self, job):
+        request = urllib.request.Request(
+            job.callback_url, data=json.dumps(job.to_dict()).encode("utf-8"),
+            headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(request, timeout=30).close()
+        except Exception as e:
+            print(f"Webhook for job {job.job_id} failed: {e}")
+
+    def cancel_job(self, job_id):
+        """Cancel a queued or running job; returns the job, or None if it is unknown"""
+        job = self.get_job(job_id)
+        if job is not None and job.state in ("queued", "running"):
+            job.cancel_token.cancel("Cancelled by the client")
+        return job
+
+    def get_job(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def serve(self, host="127.0.0.1", port=8080):
+        """Create the HTTP server; call serve_forever() on the result to run it"""
+        return ThreadingHTTPServer((host, port), _make_handler(self))
+
+
+def _make_handler(grading_server):
+    class GradingRequestHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status, payload, headers=None):
+            self._send(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+        def _read_form(self):
+            length = int(self.headers.get("Content-Length", 0))
+            if length > grading_server.max_upload_bytes:
+                return None
+            return parse_multipart(self.headers.get("Content-Type", ""), self.rfile.read(length))
+
+        def _discard_body(self):
+            remaining = min(int(self.headers.get("Content-Length", 0)), grading_server.max_upload_bytes)
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, 64 * 1024))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if parts == ["metrics"]:
+                self._send(200, REGISTRY.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+            elif parts == ["exams"]:
+                self._send_json(200, grading_server.registry.list_exams())
+            elif len(parts) in (2, 3) and parts[0] == "jobs":
+                job = grading_server.get_job(parts[1])
+                if job is None:
+                    self._send_json(404, {"error": "unknown job"})
+                elif len(parts) == 2:
+                    self._send_json(200, job.to_dict())
+                elif parts[2] == "report" and job.report_path:
+                    with open(job.report_path, "rb") as f:
+                        self._send(200, f.read(), "text/markdown; charset=utf-8")
+                else:
+                    self._send_json(404, {"error": "report not ready", "state": job.state})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            parts = self.path.strip("/").split("/")
+            if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+                job = grading_server.cancel_job(parts[1])
+                if job is None:
+                    self._send_json(404, {"error": "unknown job"})
+                else:
+                    self._send_json(202, job.to_dict())
+                return
+            if self.path not in ("/exams", "/submissions"):
+                self._send_json(404, {"error": "not found"})
+                return
+            if self.path == "/submissions" and grading_server.service.is_full():
+                # Refuse before parsing or spooling the upload; the body is only drained so the client sees the 503
+                self.close_connection = True
+                self._send_json(503, {"error": "grading queue is full, retry later"}, {"Retry-After": "30"})
+                self._discard_body()
+                return
+            try:
+                form = self._read_form()
+                if form is None:
+                    # Do not read the oversized body; drop the connection afterwards
+                    self.close_connection = True
+                    self._send_json(413, {"error": "upload too large"})
+                    return
+                fields, files = form
+                if self.path == "/exams":
+                    self._send_json(201, {"exam_id": grading_server.register_exam(fields, files)})
+                else:
+                    job = grading_server.submit(fields, files)
+                    self._send_json(202, {"job_id": job.job_id, "status_url": f"/jobs/{job.job_id}"})
+            except queue.Full:
+                self._send_json(503, {"error": "grading queue is full, retry later"}, {"Retry-After": "30"})
+            except KeyError as e:
+                self._send_json(404, {"error": str(e.args[0])})
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+
+    return GradingRequestHandler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP grading service for Rison Copy Checker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=2, help="Number of grading worker threads")
+    parser.add_argument("--max-queue", type=int, default=20, help="Queued submissions before answering 503")
+    parser.add_argument("--output", default="reports", help="Folder for the generated reports")
+    parser.add_argument("--job-deadline", type=float,
+                        help="Seconds after submission before a job is abandoned (default: no deadline)")
+    parser.add_argument("--pack-scripts", type=int, default=0,
+                        help="Grade up to this many short scripts of one exam per request (0 to disable)")
+    parser.add_argument("--large-requests", choices=("upload", "split"),
+                        help="How to send answer sheets over the inline request limit (default: the requests section of config.json, else upload)")
+    parser.add_argument("--pack-pages", action="store_true",
+                        help="Pack nearly blank pages several to an image (default: the page_packing section of config.json)")
+    parser.add_argument("--job-ttl", type=float, default=JOB_TTL_SECONDS,
+                        help="Seconds a finished job stays available at /jobs/<id>")
+    args = parser.parse_args(argv)
+
+    from src.utils.api_key_manager import ApiKeyManager
+    from src.utils.page_packing import PagePacker
+    from src.utils.pdf_processor import PDFProcessor
+    from src.utils.processing_service import ProcessingService
+    from src.utils.request_planner import RequestPlanner
+    from src.utils.script_packing import ScriptPacker
+    script_packer = ScriptPacker(args.pack_scripts) if args.pack_scripts > 1 else None
+    # Each worker thread gets its own packer, since a packer holds the pages it is grouping
+    service = ProcessingService(ApiKeyManager.get_api_key(), args.workers, args.max_queue,
+                                processor_factory=lambda api_key: PDFProcessor(
+                                    api_key, page_packer=PagePacker() if args.pack_pages else None,
+                                    request_planner=RequestPlanner(strategy=args.large_requests)
+                                    if args.large_requests else None),
+                                script_packer=script_packer)
+    server = GradingServer(service, output_dir=args.output, job_deadline=args.job_deadline,
+                           job_ttl=args.job_ttl).serve(args.host, args.port)
+    print(f"Grading service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
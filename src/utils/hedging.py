@@ -0,0 +1,128 @@
+import time, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from src.utils.metrics import RETRIES
+
+
+class LatencyTracker:
+    """Keeps a sliding window of recent call latencies"""
+
+    def __init__(self, window=100):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def count(self):
+        with self.lock:
+            return len(self.samples)
+
+    def percentile(self, percent):
+        """Return the given percentile of the recorded latencies (nearest rank)"""
+        with self.lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        rank = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered))) - 1))
+        return ordered[rank]
+
+
+def _wait(pending, timeout, cancel_token=None, poll_interval=0.25):
+    """wait() for the first finished future, checking cancel_token every poll_interval"""
+    if cancel_token is None:
+        return wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        cancel_token.check()
+        slice_timeout = poll_interval
+        if deadline is not None:
+            slice_timeout = min(slice_timeout, max(0.0, deadline - time.monotonic()))
+        done, not_done = wait(pending, timeout=slice_timeout, return_when=FIRST_COMPLETED)
+        if done or (deadline is not None and time.monotonic() >= deadline):
+            return done, not_done
+
+
+class HedgePolicy:
+    """
+    Sends a duplicate request when the first one is slower than the recent
+    latency percentile, and returns whichever finishes first.
+    Duplicates are capped at max_hedge_ratio of all calls (plus a small burst).
+    """
+
+    def __init__(self, percentile=95, min_samples=10, default_delay=120.0, max_hedge_ratio=0.1,
+                 burst=1, timeout=None, window=100):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.burst = burst
+        self.timeout = timeout
+        self.tracker = LatencyTracker(window)
+        self.calls = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+
+    def hedge_delay(self):
+        """Seconds to wait for the first attempt before sending a duplicate"""
+        if self.tracker.count() < self.min_samples:
+            return self.default_delay
+        return self.tracker.percentile(self.percentile)
+
+    def _take_hedge_budget(self):
+        with self.lock:
+            if self.hedges < self.max_hedge_ratio * self.calls + self.burst:
+                self.hedges += 1
+                return True
+            return False
+
+    def call(self, fn, *args, cancel_token=None, **kwargs):
+        """
+        Run fn(*args, **kwargs) with hedging.
+        Raises TimeoutError if no attempt finishes within the policy timeout,
+        and stops waiting as soon as cancel_token is cancelled or expires.
+        """
+        with self.lock:
+            self.calls += 1
+
+        def timed_attempt():
+            started = time.monotonic()
+            result = fn(*args, **kwargs)
+            return result, time.monotonic() - started
+
+        executor = ThreadPoolExecutor(max_workers=2)
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        try:
+            pending = {executor.submit(timed_attempt)}
+            delay = self.hedge_delay()
+            if deadline is not None:
+                delay = min(delay, self.timeout)
+            done, pending = _wait(pending, delay, cancel_token)
+            time_left = deadline is None or time.monotonic() < deadline
+            if not done and time_left and self._take_hedge_budget():
+                print(f"Model call exceeded {delay:.1f}s, sending a hedged request")
+                RETRIES.inc(reason="hedge")
+                pending.add(executor.submit(timed_attempt))
+
+            last_error = None
+            while True:
+                for future in done:
+                    try:
+                        result, latency = future.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    self.tracker.record(latency)
+                    return result
+                if not pending:
+                    raise last_error
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                done, pending = _wait(pending, remaining, cancel_token)
+                if not done:
+                    raise TimeoutError(f"Model call did not finish within {self.timeout} seconds")
+        finally:
+            # The losing attempt is abandoned; it cannot be interrupted mid-request
+            # but its own request timeout bounds how long it lingers
+            executor.shutdown(wait=False, cancel_futures=True)
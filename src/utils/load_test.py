@@ -0,0 +1,204 @@
+import os, sys, json, time, random, argparse, threading
+from collections import namedtuple
+
+import numpy as np
+
+from src.ui.prompts import construct_prompt
+from src.utils.cost_model import CostModel
+from src.utils.pdf_processor import PDFProcessor
+from src.utils.processing_service import ProcessingService
+from src.utils.render_cache import RenderCache
+from src.utils.request_planner import payload_size
+
+ReplayResponse = namedtuple("ReplayResponse", ["text"])
+
+
+class RecordingModel:
+    """Wraps a real model and appends every interaction to a cassette (JSON lines)"""
+
+    def __init__(self, model, cassette_path):
+        self.model = model
+        self.cassette_path = cassette_path
+        self.lock = threading.Lock()
+
+    def count_tokens(self, contents):
+        return self.model.count_tokens(contents)
+
+    def generate_content(self, parts, **kwargs):
+        started = time.monotonic()
+        response = self.model.generate_content(parts, **kwargs)
+        record = {
+            "model": getattr(self.model, "model_name", ""),
+            "request_bytes": payload_size(parts),
+            "images": sum(1 for part in parts if not isinstance(part, dict) or "text" not in part),
+            "latency": time.monotonic() - started,
+            "response_text": response.text,
+        }
+        with self.lock:
+            with open(self.cassette_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        return response
+
+
+class ReplayModel:
+    """
+    Stands in for the model using recorded interactions.
+    Each call sleeps for a latency drawn from the recorded distribution and
+    returns a recorded response, so no quota is spent.
+    """
+
+    def __init__(self, records, latency_scale=1.0, seed=None):
+        if not records:
+            raise ValueError("The cassette has no recorded interactions")
+        self.records = records
+        self.latency_scale = latency_scale
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def count_tokens(self, contents):
+        return None
+
+    def generate_content(self, parts, **kwargs):
+        with self.lock:
+            latency = self.random.choice(self.records)["latency"]
+            record = self.random.choice(self.records)
+        time.sleep(latency * self.latency_scale)
+        return ReplayResponse(record["response_text"])
+
+
+def load_cassette(cassette_path):
+    with open(cassette_path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process in MB, or None where unsupported"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_load_test(jobs, records, concurrency=2, arrival_rate=None, total_jobs=None, latency_scale=1.0,
+                  seed=None):
+    """
+    Replay grading jobs through a ProcessingService at the given concurrency.
+    jobs is a list of (pdf_paths, prompt) cycled until total_jobs are submitted.
+    arrival_rate is jobs per second (Poisson arrivals); None submits everything at once.
+    """
+    total_jobs = total_jobs or len(jobs)
+    arrivals = random.Random(seed)
+    replay = ReplayModel(records, latency_scale, seed)
+    # No API key: the replayed model needs none, and configuring one would replace the process's real key
+    service = ProcessingService(
+        None, workers=concurrency,
+        # A cache that keeps nothing: the same scripts are replayed over and over, and reusing their
+        # rendered pages would report throughput a real batch of distinct scripts never reaches
+        processor_factory=lambda api_key: PDFProcessor(api_key, model_factory=lambda model_name: replay,
+                                                       render_cache=RenderCache(max_bytes=0)),
+        # Replayed latencies must not train the real cost model
+        cost_model=CostModel(os.devnull))
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def job_done(submitted, future):
+        with lock:
+            if future.exception() is not None:
+                errors.append(str(future.exception()))
+            else:
+                latencies.append(time.monotonic() - submitted)
+
+    started = time.monotonic()
+    futures = []
+    try:
+        for index in range(total_jobs):
+            pdf_paths, prompt = jobs[index % len(jobs)]
+            submitted = time.monotonic()
+            future = service.submit(pdf_paths, prompt)
+            future.add_done_callback(lambda done, submitted=submitted: job_done(submitted, done))
+            futures.append(future)
+            if arrival_rate:
+                time.sleep(arrivals.expovariate(arrival_rate))
+        for future in futures:
+            future.exception()
+    finally:
+        service.shutdown()
+    elapsed = time.monotonic() - started
+
+    summary = {
+        "jobs": total_jobs,
+        "errors": len(errors),
+        "concurrency": concurrency,
+        "arrival_rate": arrival_rate,
+        "elapsed_seconds": elapsed,
+        "throughput_per_minute": 60 * len(latencies) / elapsed if elapsed else 0.0,
+        "peak_memory_mb": peak_memory_mb(),
+    }
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary.update(p50_seconds=float(p50), p95_seconds=float(p95), p99_seconds=float(p99))
+    return summary
+
+
+def format_summary(summary):
+    lines = [f"{'Metric':<24}Value"]
+    for key, value in summary.items():
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        lines.append(f"{key:<24}{value}")
+    return "\n".join(lines)
+
+
+def _collect_jobs(question, reference, scripts):
+    prompt = construct_prompt(bool(reference))
+    jobs = []
+    for script in scripts:
+        if os.path.isdir(script):
+            paths = sorted(os.path.join(script, name) for name in os.listdir(script) if name.lower().endswith(".pdf"))
+        else:
+            paths = [script]
+        for path in paths:
+            jobs.append(({"Question Paper": question, "Reference Answer": reference or "", "Actual Answer": path}, prompt))
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record and replay model interactions to load-test grading")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    for mode, help_text in (("record", "Grade scripts with the real model and record a cassette"),
+                            ("replay", "Replay a cassette at a chosen concurrency and arrival rate")):
+        subparser = subparsers.add_parser(mode, help=help_text)
+        subparser.add_argument("--cassette", required=True, help="Cassette file (JSON lines)")
+        subparser.add_argument("--question", required=True, help="Question paper PDF")
+        subparser.add_argument("--reference", help="Reference answer PDF")
+        subparser.add_argument("--scripts", nargs="+", required=True, help="Answer sheet PDFs or folders")
+    replay_parser = subparsers.choices["replay"]
+    replay_parser.add_argument("--concurrency", type=int, default=2)
+    replay_parser.add_argument("--rate", type=float, help="Arrival rate in jobs per second (default: all at once)")
+    replay_parser.add_argument("--jobs", type=int, help="Number of jobs to submit (default: one per script)")
+    replay_parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply recorded latencies")
+    args = parser.parse_args(argv)
+
+    jobs = _collect_jobs(args.question, args.reference, args.scripts)
+    if args.mode == "record":
+        import google.generativeai as genai
+        from src.utils.api_key_manager import ApiKeyManager
+        processor = PDFProcessor(
+            ApiKeyManager.get_api_key(),
+            model_factory=lambda model_name: RecordingModel(genai.GenerativeModel(model_name), args.cassette))
+        for pdf_paths, prompt in jobs:
+            processor.process_pdfs(pdf_paths, prompt)
+        print(f"Recorded {len(jobs)} interactions to {args.cassette}")
+    else:
+        summary = run_load_test(jobs, load_cassette(args.cassette), args.concurrency, args.rate, args.jobs,
+                                args.latency_scale)
+        print(format_summary(summary))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
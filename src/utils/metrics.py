@@ -0,0 +1,218 @@
+import time, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, key, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, key)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing value per label combination"""
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        # Unlabelled counters start at zero so they are exported before their first use
+        self.values = {} if self.label_names else {(): 0}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def total(self):
+        with self.lock:
+            return sum(self.values.values())
+
+    def samples(self):
+        with self.lock:
+            return [(self.name + _format_labels(self.label_names, key), value) for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """A value that can go up and down, or be read from a function when scraped"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self.function = None
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def total(self):
+        if self.function is not None:
+            return self.function()
+        return super().total()
+
+    def samples(self):
+        if self.function is not None:
+            return [(self.name, self.function())]
+        return super().samples()
+
+
+class Histogram(Counter):
+    """Counts observations into cumulative buckets"""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.values = {}
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [bucket_count + (value <= bound) for bucket_count, bound in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, count + 1)
+
+    def sum_and_count(self):
+        """Return (sum, count) over every label combination"""
+        with self.lock:
+            return (sum(total for _, total, _ in self.values.values()),
+                    sum(count for _, _, count in self.values.values()))
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append((self.name + "_bucket" + _format_labels(self.label_names, key, [("le", bound)]),
+                                  bucket_count))
+                lines.append((self.name + "_bucket" + _format_labels(self.label_names, key, [("le", "+Inf")]), count))
+                lines.append((self.name + "_sum" + _format_labels(self.label_names, key), total))
+                lines.append((self.name + "_count" + _format_labels(self.label_names, key), count))
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric of the process and renders them in Prometheus text format"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric_class, name, help_text, labels, **kwargs):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = metric_class(name, help_text, labels, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._register(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, value in metric.samples():
+                lines.append(f"{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+JOBS_IN_FLIGHT = REGISTRY.gauge("rison_jobs_in_flight", "Grading jobs currently being processed")
+JOBS_QUEUED = REGISTRY.gauge("rison_jobs_queued", "Grading jobs waiting for a worker")
+JOBS = REGISTRY.counter("rison_jobs_total", "Finished grading jobs", ["status"])
+PAGES_RENDERED = REGISTRY.counter("rison_pages_rendered_total", "Pages rasterised or extracted from scans", ["source"])
+RENDER_CACHE = REGISTRY.counter("rison_render_cache_requests_total", "Render cache lookups", ["result"])
+RUBRIC_CACHE = REGISTRY.counter("rison_rubric_cache_requests_total", "Rubric cache lookups", ["result"])
+MODEL_REQUESTS = REGISTRY.counter("rison_model_requests_total", "Model calls", ["model", "status"])
+MODEL_REQUEST_BYTES = REGISTRY.counter("rison_model_request_bytes_total", "Bytes sent to the model", ["model"])
+MODEL_LATENCY = REGISTRY.histogram("rison_model_latency_seconds", "Model call latency", ["model"])
+MODEL_TOKENS = REGISTRY.counter("rison_model_tokens_total", "Tokens reported by the model", ["model", "kind"])
+RETRIES = REGISTRY.counter("rison_retries_total", "Extra model requests (hedges, escalations, re-asks)", ["reason"])
+LOCAL_QUESTIONS = REGISTRY.counter("rison_locally_scored_questions_total", "Questions scored against the answer key")
+
+
+def cache_hit_rate(counter):
+    """Hit ratio of a cache counter labelled by result, or None before any lookup"""
+    hits, misses = counter.value(result="hit"), counter.value(result="miss")
+    return hits / (hits + misses) if hits + misses else None
+
+
+class MetricsSummary:
+    """Compact live summary for a status panel; rates are since the previous call"""
+
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+        self.last_time = time.monotonic()
+        self.last_pages = PAGES_RENDERED.total()
+
+    def text(self):
+        now = time.monotonic()
+        pages = PAGES_RENDERED.total()
+        pages_per_second = (pages - self.last_pages) / max(now - self.last_time, 1e-6)
+        self.last_time, self.last_pages = now, pages
+
+        latency_sum, latency_count = MODEL_LATENCY.sum_and_count()
+        hit_rate = cache_hit_rate(RENDER_CACHE)
+        lines = [
+            f"Jobs: {JOBS_IN_FLIGHT.total():g} running, {JOBS_QUEUED.total():g} queued, "
+            f"{JOBS.value(status='succeeded'):g} done, {JOBS.value(status='failed'):g} failed, "
+            f"{JOBS.value(status='cancelled'):g} cancelled",
+            f"Pages: {pages_per_second:.1f}/s, cache hits {'-' if hit_rate is None else f'{hit_rate:.0%}'}",
+            f"Model: {latency_count} calls, avg {latency_sum / latency_count if latency_count else 0:.1f}s, "
+            f"{MODEL_REQUEST_BYTES.total() / (1024 * 1024):.1f} MB sent",
+            f"Tokens: {MODEL_TOKENS.total():,}, retries: {RETRIES.total()}",
+        ]
+        return "\n".join(lines)
+
+
+def serve_metrics(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve /metrics in Prometheus text format on a background thread; returns the server"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+    print(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
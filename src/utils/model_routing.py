@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.api_key_manager import ApiKeyManager
+from src.utils.metrics import RETRIES
+from src.utils.regrade import focused_prompt, merge_rows
+from src.utils.result_parser import parse_results_table, parse_marks, question_key, format_results_table
+
+# The model every request uses unless routing is turned on
+DEFAULT_MODEL = 'gemini-2.5-flash'
+# With routing on, the first pass stays on the default model unless config.json names another
+FAST_MODEL = DEFAULT_MODEL
+STRONG_MODEL = 'gemini-2.5-pro'
+ROUTING_COLUMN = "Graded By"
+
+
+def confidence_prompt(prompt_text):
+    """Ask for a per-question confidence column after the usual grading columns"""
+    return prompt_text + (
+        " Add a final column named Confidence to the table, after Comments, giving your confidence "
+        "from 0 to 100% that the Marks Awarded for that question are correct. Be honest: use a low "
+        "value when the handwriting is unclear, the answer is ambiguous or the marking is a judgement call."
+    )
+
+
+def _column(row, name):
+    """Return the value of the first column whose name contains name (case-insensitive)"""
+    for column, value in row.items():
+        if name in column.lower():
+            return value
+    return None
+
+
+def row_confidence(row):
+    """Confidence of a row as a fraction between 0 and 1, or None if it was not given"""
+    value = parse_marks(_column(row, "confidence"))
+    if value is None:
+        return None
+    return value / 100 if value > 1 else value
+
+
+class ModelRouter:
+    """
+    Grades with a fast model first and re-grades only the questions it is
+    unsure about with a stronger one.
+    A question is escalated when its confidence is below min_confidence, when
+    repeated fast samples disagree, or when it earned partial credit and the
+    student's total is within boundary_margin percentage points of one of
+    grade_boundaries (percentages of the total marks).
+    """
+
+    def __init__(self, fast_model=FAST_MODEL, strong_model=STRONG_MODEL, min_confidence=0.75, samples=1,
+                 grade_boundaries=(), boundary_margin=2.0, max_sample_disagreement=0.5):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.min_confidence = min_confidence
+        self.samples = samples
+        self.grade_boundaries = tuple(grade_boundaries)
+        self.boundary_margin = boundary_margin
+        self.max_sample_disagreement = max_sample_disagreement
+
+    @classmethod
+    def from_config(cls):
+        """
+        Build the router from the "routing" section of config.json.
+        Routing is opt-in: returns None unless the section sets "enabled": true.
+        """
+        settings = ApiKeyManager.get_settings('routing')
+        if not settings.pop('enabled', False):
+            return None
+        return cls(**settings)
+
+    def escalations(self, rows, samples=()):
+        """Return {question key: reason} for the rows that should go to the strong model"""
+        reasons = {}
+        for row in rows:
+            confidence = row_confidence(row)
+            if confidence is None or confidence < self.min_confidence:
+                reasons[question_key(next(iter(row.values())))] = "low confidence"
+
+        for sample_rows in samples:
+            awarded = {question_key(next(iter(row.values()))): parse_marks(_column(row, "awarded")) for row in sample_rows}
+            for row in rows:
+                key = question_key(next(iter(row.values())))
+                first, other = parse_marks(_column(row, "awarded")), awarded.get(key)
+                if first is None or other is None or abs(first - other) > self.max_sample_disagreement:
+                    reasons.setdefault(key, "inconsistent samples")
+
+        if self.grade_boundaries:
+            awarded = [parse_marks(_column(row, "awarded")) or 0.0 for row in rows]
+            allocated = [parse_marks(_column(row, "allocated")) or 0.0 for row in rows]
+            if sum(allocated):
+                total = 100 * sum(awarded) / sum(allocated)
+                if any(abs(total - boundary) <= self.boundary_margin for boundary in self.grade_boundaries):
+                    for row, row_awarded, row_allocated in zip(rows, awarded, allocated):
+                        if 0 < row_awarded < row_allocated:
+                            reasons.setdefault(question_key(next(iter(row.values()))), "near grade boundary")
+        return reasons
+
+    def grade(self, processor, encoded_images_sets, prompt_text):
+        """Grade the prepared pages, escalating uncertain questions; returns the response text"""
+        routed_prompt = confidence_prompt(prompt_text)
+        if self.samples > 1:
+            RETRIES.inc(self.samples - 1, reason="self-consistency")
+            with ThreadPoolExecutor(self.samples) as executor:
+                responses = list(executor.map(
+                    lambda _: processor.grade_pages(encoded_images_sets, routed_prompt, self.fast_model),
+                    range(self.samples)))
+        else:
+            responses = [processor.grade_pages(encoded_images_sets, routed_prompt, self.fast_model)]
+        return self.resolve(processor, encoded_images_sets, prompt_text, responses)
+
+    def resolve(self, processor, encoded_images_sets, prompt_text, responses):
+        """
+        Finish grading from the fast model's responses (asked with confidence_prompt):
+        escalate the uncertain questions and return the merged response text.
+        """
+        routed_prompt = confidence_prompt(prompt_text)
+        rows = parse_results_table(responses[0])
+        if not rows:
+            # Nothing to judge confidence on; let the strong model grade everything
+            print(f"{self.fast_model} returned no results table, grading with {self.strong_model}")
+            return processor.grade_pages(encoded_images_sets, prompt_text, self.strong_model)
+
+        columns = list(rows[0].keys()) + [ROUTING_COLUMN]
+        for row in rows:
+            row[ROUTING_COLUMN] = self.fast_model
+        reasons = self.escalations(rows, [parse_results_table(text) for text in responses[1:]])
+        if not reasons:
+            return (f"All questions were graded by {self.fast_model}.\n\n"
+                    + format_results_table(rows, columns))
+
+        questions = [next(iter(row.values())) for row in rows if question_key(next(iter(row.values()))) in reasons]
+        RETRIES.inc(reason="escalation")
+        strong_rows = parse_results_table(processor.grade_pages(
+            encoded_images_sets, focused_prompt(routed_prompt, questions), self.strong_model))
+        for row in strong_rows:
+            reason = reasons.get(question_key(next(iter(row.values()))), "escalated")
+            row[ROUTING_COLUMN] = f"{self.strong_model} ({reason})"
+        return (f"{len(questions)} of {len(rows)} questions were escalated from {self.fast_model} "
+                f"to {self.strong_model}.\n\n" + format_results_table(merge_rows(rows, strong_rows), columns))
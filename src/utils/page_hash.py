@@ -0,0 +1,74 @@
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+PageSignature = namedtuple("PageSignature", ["dhash", "thumbnail"])
+
+
+def dhash(image, hash_size=16):
+    """
+    Compute a difference hash (dHash) for a rendered page image.
+    Returns the hash as a Python int of hash_size * hash_size bits.
+    """
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def thumbnail(image, width=256):
+    """Return a small grayscale copy of the page used to confirm hash matches"""
+    height = max(1, round(image.height * width / image.width))
+    return np.asarray(image.convert("L").resize((width, height), Image.BOX), dtype=np.int16)
+
+
+def page_signature(image):
+    """Return the signature used to compare pages"""
+    return PageSignature(dhash(image), thumbnail(image))
+
+
+def hamming_distance(hash_a, hash_b):
+    """Return the number of differing bits between two hashes"""
+    return bin(hash_a ^ hash_b).count("1")
+
+
+class PageDeduplicator:
+    """Tracks page signatures seen in a request and flags repeated pages"""
+
+    def __init__(self, boilerplate_signatures=None, threshold=10, pixel_tolerance=32, max_changed_ratio=0.0005):
+        self.threshold = threshold
+        self.pixel_tolerance = pixel_tolerance
+        self.max_changed_ratio = max_changed_ratio
+        self.boilerplate_signatures = list(boilerplate_signatures or [])
+        self.seen_signatures = {}
+
+    def add_boilerplate(self, signature):
+        """Register a page (cover, instructions, rough work) that never needs sending"""
+        self.boilerplate_signatures.append(signature)
+
+    def reset(self):
+        """Forget the pages seen so far, keeping the boilerplate set"""
+        self.seen_signatures = {}
+
+    def _same_page(self, signature, known):
+        # The hash is only a cheap filter; mostly-white pages hash alike even
+        # when one of them carries a short handwritten answer
+        if hamming_distance(signature.dhash, known.dhash) > self.threshold:
+            return False
+        if signature.thumbnail.shape != known.thumbnail.shape:
+            return False
+        changed = np.abs(signature.thumbnail - known.thumbnail) > self.pixel_tolerance
+        return changed.mean() <= self.max_changed_ratio
+
+    def is_duplicate(self, signature, group="exam"):
+        """
+        Check a page against the boilerplate set and every page already kept in its group.
+        Unique pages are remembered so later repeats are caught.
+        """
+        seen = self.seen_signatures.setdefault(group, [])
+        for known in self.boilerplate_signatures + seen:
+            if self._same_page(signature, known):
+                return True
+        seen.append(signature)
+        return False
@@ -0,0 +1,114 @@
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from src.utils.api_key_manager import ApiKeyManager
+
+# Gemini bills images in 768x768 tiles, so canvases are a whole number of tiles
+TILE_SIZE = 768
+
+PackedPage = namedtuple("PackedPage", ["label", "page_numbers", "image"])
+
+
+def ink_ratio(image, ink_level=160):
+    """Return the fraction of a page covered by ink, measured on a small grayscale copy"""
+    small = image.convert("L")
+    small.thumbnail((300, 300))
+    return float((np.asarray(small) < ink_level).mean())
+
+
+def crop_to_content(image, ink_level=200, margin=20):
+    """Trim blank margins so the written part fills as much of a grid cell as possible"""
+    pixels = np.asarray(image.convert("L"))
+    rows = np.flatnonzero((pixels < ink_level).any(axis=1))
+    cols = np.flatnonzero((pixels < ink_level).any(axis=0))
+    if rows.size == 0 or cols.size == 0:
+        return image
+    box = (max(0, cols[0] - margin), max(0, rows[0] - margin),
+           min(image.width, cols[-1] + margin + 1), min(image.height, rows[-1] + margin + 1))
+    return image.crop(box)
+
+
+def _label_font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only has the fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+class PagePacker:
+    """
+    Composites sparse pages of the same PDF into a grid on one image.
+    Every cell is captioned with its original page number and the page
+    mapping is kept, so comments can still cite the original pages.
+    """
+
+    def __init__(self, columns=2, rows=2, tiles=2, sparse_threshold=0.03):
+        self.columns = columns
+        self.rows = rows
+        self.canvas_size = tiles * TILE_SIZE
+        self.sparse_threshold = sparse_threshold
+        self.group = []
+        self.group_label = None
+
+    @classmethod
+    def from_config(cls):
+        """
+        Build a packer from the "page_packing" section of config.json.
+        Packing is opt-in: returns None unless the section sets "enabled": true.
+        """
+        settings = ApiKeyManager.get_settings('page_packing')
+        if not settings.pop('enabled', False):
+            return None
+        return cls(**settings)
+
+    def is_sparse(self, image):
+        return ink_ratio(image) <= self.sparse_threshold
+
+    def add(self, label, page_number, image):
+        """Add a page and return any packed pages that are ready to send, in page order"""
+        ready = []
+        if self.group and label != self.group_label:
+            ready.extend(self.flush())
+        if not self.is_sparse(image):
+            ready.extend(self.flush())
+            ready.append(PackedPage(label, [page_number], image))
+            return ready
+        self.group.append((page_number, image))
+        self.group_label = label
+        if len(self.group) == self.columns * self.rows:
+            ready.extend(self.flush())
+        return ready
+
+    def flush(self):
+        """Return the pages still waiting to be packed"""
+        if not self.group:
+            return []
+        group, label = self.group, self.group_label
+        self.group, self.group_label = [], None
+        if len(group) == 1:
+            page_number, image = group[0]
+            return [PackedPage(label, [page_number], image)]
+        return [PackedPage(label, [page_number for page_number, _ in group], self._composite(group))]
+
+    def _composite(self, group):
+        columns = min(self.columns, len(group))
+        rows = (len(group) + columns - 1) // columns
+        cell_width = self.canvas_size // columns
+        cell_height = self.canvas_size // max(rows, 1)
+        caption_height = 36
+        canvas = Image.new("RGB", (self.canvas_size, cell_height * rows), "white")
+        draw = ImageDraw.Draw(canvas)
+        font = _label_font(26)
+        for index, (page_number, image) in enumerate(group):
+            left = (index % columns) * cell_width
+            top = (index // columns) * cell_height
+            content = crop_to_content(image)
+            content.thumbnail((cell_width - 8, cell_height - caption_height - 8))
+            canvas.paste(content, (left + 4, top + caption_height + 4))
+            draw.rectangle([left, top, left + cell_width - 1, top + cell_height - 1], outline="black", width=2)
+            draw.rectangle([left, top, left + cell_width - 1, top + caption_height], fill="black")
+            draw.text((left + 10, top + 4), f"Page {page_number}", fill="white", font=font)
+        return canvas
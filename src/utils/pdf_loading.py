@@ -0,0 +1,104 @@
+import re, mmap
+
+import fitz  # PyMuPDF
+
+RANGE_PATTERN = re.compile(r"^(\d*)\s*-\s*(\d*)$")
+
+
+class MappedPDF:
+    """
+    A fitz.Document read from a memory map of its file.
+    The document keeps a view of the map after it is closed, so closing this
+    closes the document, then releases the view and closes the map. The file
+    can be deleted or replaced straight away, which Windows refuses while a
+    map is open. Everything else is passed through to the document.
+    """
+
+    def __init__(self, document, mapped, view):
+        self.document = document
+        self.mapped = mapped
+        self.view = view
+
+    def __getattr__(self, name):
+        return getattr(self.document, name)
+
+    def __len__(self):
+        return len(self.document)
+
+    def __getitem__(self, index):
+        return self.document[index]
+
+    def __iter__(self):
+        return iter(self.document)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.mapped is None:
+            return
+        self.document.close()
+        self.view.release()
+        self.mapped.close()
+        self.view = self.mapped = None
+
+
+def open_pdf(pdf_path):
+    """
+    Open a PDF from a read-only memory map of the file.
+    MuPDF reads the mapped bytes in place, so only the parts it touches (the
+    cross-reference table and the objects of the pages actually used) are
+    read from disk. Falls back to a normal open where the file cannot be mapped.
+    Close the result (or use it as a context manager) to release the file.
+    """
+    try:
+        with open(pdf_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return fitz.open(pdf_path)
+    view = memoryview(mapped)
+    try:
+        return MappedPDF(fitz.open(stream=view, filetype="pdf"), mapped, view)
+    except Exception:
+        view.release()
+        mapped.close()
+        raise
+
+
+def parse_page_ranges(spec, page_count):
+    """
+    Return the sorted 1-based page numbers selected by a spec such as
+    "3-12, 15, 20-" (open ranges run to the first or last page). A list of
+    page numbers is accepted as well. An empty spec or None selects every page.
+    Raises ValueError for malformed specs or pages outside the document.
+    """
+    if spec is None or (isinstance(spec, str) and not spec.strip()):
+        return list(range(1, page_count + 1))
+    if not isinstance(spec, str):
+        pages = {int(page) for page in spec}
+    else:
+        pages = set()
+        for item in re.split(r"[,;]", spec):
+            item = item.strip()
+            if not item:
+                continue
+            if item.isdigit():
+                pages.add(int(item))
+                continue
+            match = RANGE_PATTERN.match(item)
+            if not match or not (match.group(1) or match.group(2)):
+                raise ValueError(f"Invalid page range: {item!r}")
+            first = int(match.group(1) or 1)
+            last = int(match.group(2) or page_count)
+            if first > last:
+                raise ValueError(f"Invalid page range: {item!r}")
+            pages.update(range(first, last + 1))
+    outside = [page for page in pages if page < 1 or page > page_count]
+    if outside:
+        raise ValueError(f"Page {min(outside)} is outside the document, which has {page_count} pages")
+    if not pages:
+        raise ValueError("The page selection is empty")
+    return sorted(pages)
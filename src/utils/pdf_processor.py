@@ -1,35 +1,170 @@
-import os, base64, tempfile
-import fitz  # PyMuPDF
-from PIL import Image
+import os, time, base64, tempfile, threading
 import google.generativeai as genai
 
+from src.utils.answer_key import answer_key_from_pdfs, grade_with_answer_key
+from src.utils.cancellation import CancellationToken, JobCancelled
+from src.utils.hedging import HedgePolicy
+from src.utils.metrics import MODEL_LATENCY, MODEL_REQUESTS, MODEL_REQUEST_BYTES, MODEL_TOKENS
+from src.utils.model_routing import DEFAULT_MODEL, ModelRouter
+from src.utils.page_hash import PageDeduplicator
+from src.utils.page_packing import PagePacker
+from src.utils.pdf_loading import open_pdf, parse_page_ranges
+from src.utils.pipeline import prefetch
+from src.utils.preprocessing import cached_signature, page_payload
+from src.utils.render_cache import shared_render_cache
+from src.utils.result_parser import parse_results_table
+from src.utils.request_planner import RequestPlanner, continuation_prompt, merge_responses, payload_size
+
+_configured_api_key = None
+_configure_lock = threading.Lock()
+
+
+def configure_genai(api_key):
+    """Configure the Gemini client once per API key so its connection is reused"""
+    global _configured_api_key
+    with _configure_lock:
+        if _configured_api_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+
+
 class PDFProcessor:
-    def __init__(self, api_key):
+    def __init__(self, api_key, boilerplate_signatures=None, deduplicate_pages=True, render_queue_size=2,
+                 hedge_policy=None, request_timeout=600, request_planner=None, page_packer=None,
+                 model_factory=None, router=None, local_scoring=True, render_cache=None):
         self.api_key = api_key
-        genai.configure(api_key=api_key)
+        self.render_cache = render_cache or shared_render_cache
+        self.local_scoring = local_scoring
+        # None reads the routing settings from config.json (off unless enabled there); False always uses DEFAULT_MODEL
+        self.router = ModelRouter.from_config() if router is None else router or None
+        self.model_factory = model_factory or genai.GenerativeModel
+        # None reads the packing settings from config.json (off unless enabled there); False never packs
+        self.page_packer = PagePacker.from_config() if page_packer is None else page_packer or None
+        # None reads the large-request strategy from config.json (uploads unless set to split there)
+        self.request_planner = request_planner or RequestPlanner.from_config()
+        self.hedge_policy = hedge_policy or HedgePolicy()
+        self.request_timeout = request_timeout
+        self.deduplicate_pages = deduplicate_pages
+        # Boilerplate given here applies to every job; an exam's own boilerplate PDF is added per job
+        self.boilerplate_signatures = list(boilerplate_signatures or [])
+        self.deduplicator = PageDeduplicator(self.boilerplate_signatures)
+        self.render_queue_size = render_queue_size
+        self.models = {}
+        # Seconds spent preparing pages and waiting on the model, for the batch cost model
+        self.timings = {"render": 0.0, "model": 0.0}
+        # Checked between pages and before model calls; the service swaps in each job's token
+        self.cancel_token = CancellationToken()
+        # Without a key (rendering only, or a replayed model) the process-wide client settings are left alone
+        if api_key:
+            configure_genai(api_key)
+
+    def get_model(self, model_name=DEFAULT_MODEL):
+        """Return a cached model instance so repeated calls skip client setup"""
+        if model_name not in self.models:
+            self.models[model_name] = self.model_factory(model_name)
+        return self.models[model_name]
+
+    def warm_up(self, model_name=None):
+        """Create the model and open its connection before the first real request"""
+        if model_name is None:
+            model_name = self.router.fast_model if self.router else DEFAULT_MODEL
+        model = self.get_model(model_name)
+        try:
+            model.count_tokens("ping")
+        except Exception as e:
+            print(f"Model warm-up failed: {e}")
+
+    def render_pages(self, pdf_path, skip_pages=(), pages=None):
+        """
+        Yield (page_number, RGB image) for the selected pages of a PDF.
+        pages is a range spec such as "3-12" or a list of page numbers (None for
+        all); the document is memory-mapped, so other pages are never read.
+        """
+        pdf_document = open_pdf(pdf_path)
+        try:
+            for page_number in parse_page_ranges(pages, len(pdf_document)):
+                if page_number in skip_pages:
+                    continue
+                # Pages previewed in the GUI are usually already in the cache
+                yield page_number, self.render_cache.render(pdf_document, pdf_path, page_number)
+        finally:
+            pdf_document.close()
+
+    def render_documents(self, pdf_paths, skip_pages=None, page_selection=None):
+        """
+        Yield (label, page_number, image) for every selected page of every uploaded PDF.
+        skip_pages maps a label to page numbers that should not be sent;
+        page_selection maps a label to the page range to grade.
+        """
+        for label, pdf_path in pdf_paths.items():
+            if pdf_path:
+                skipped = (skip_pages or {}).get(label, ())
+                selected = (page_selection or {}).get(label)
+                for page_number, image in self.render_pages(pdf_path, skipped, selected):
+                    self.cancel_token.check()
+                    yield label, page_number, image
 
     def pdf_to_images(self, pdf_path):
         # Create a temporary directory
         temp_dir = tempfile.mkdtemp()  
         images = []
         try:
-            pdf_document = fitz.open(pdf_path)
-            for page_num in range(len(pdf_document)):
-                page = pdf_document[page_num]
-                pix = page.get_pixmap(dpi=150)
-                image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                image_path = os.path.join(temp_dir, f"page_{page_num + 1}.png")
-                image.save(image_path, "PNG")
+            for page_number, image in self.render_pages(pdf_path):
+                encoded = getattr(image, "encoded", None)
+                if encoded is not None:
+                    # Embedded scan: write its bytes as they are
+                    extension = "jpg" if encoded[1] == "image/jpeg" else "png"
+                    image_path = os.path.join(temp_dir, f"page_{page_number}.{extension}")
+                    with open(image_path, "wb") as f:
+                        f.write(encoded[0])
+                else:
+                    image_path = os.path.join(temp_dir, f"page_{page_number}.png")
+                    image.save(image_path, "PNG")
                 images.append(image_path)
         except Exception as e:
             print(f"Error processing PDF: {e}")
             # Cleanup on error
             self.cleanup_temp_dir(temp_dir)
             raise
-        finally:
-            pdf_document.close()
         return images, temp_dir
 
+    def load_boilerplate(self, pdf_path):
+        """
+        Use every page of a PDF (cover, instructions, rough work) as the exam's
+        boilerplate, replacing the previous job's. None leaves only the
+        boilerplate given to the constructor.
+        """
+        self.deduplicator.boilerplate_signatures = list(self.boilerplate_signatures)
+        if pdf_path:
+            # Rendered pages and their signatures come from the render cache after the first job
+            for _, image in self.render_pages(pdf_path):
+                self.deduplicator.add_boilerplate(cached_signature(image))
+
+    def is_duplicate_page(self, image, label):
+        """
+        Check whether a page repeats one already in this request or matches the boilerplate set.
+        Student pages are only compared with the student's own pages and the boilerplate,
+        so an answer copied word for word from the reference is never dropped.
+        """
+        if not self.deduplicate_pages:
+            return False
+        group = "student" if label == "Actual Answer" else "exam"
+        return self.deduplicator.is_duplicate(cached_signature(image), group)
+
+    def encode_page(self, image, label, page_number):
+        """
+        Return a page's base64 payload: a scanned page's embedded image bytes
+        when available, otherwise the rendered page PNG-encoded in memory.
+        Pages preprocessed on selection are already encoded.
+        """
+        data, mime_type = page_payload(image)
+        return {
+            "label": label,
+            "page_number": page_number,
+            "mime_type": mime_type,
+            "img_base64": base64.b64encode(data).decode('utf-8')
+        }
+
     def images_to_base64(self, image_paths, label):
         encoded_images = []
         for page_num, image_path in enumerate(image_paths):
@@ -39,6 +174,7 @@ class PDFProcessor:
                     encoded_images.append({
                         "label": label,
                         "page_number": page_num + 1,
+                        "mime_type": "image/jpeg" if image_path.endswith(".jpg") else "image/png",
                         "img_base64": img_base64
                     })
             except Exception as e:
@@ -49,37 +185,159 @@ class PDFProcessor:
         parts = [{"text": text_prompt}]
         for encoded_images in encoded_images_sets:
             for img in encoded_images:
+                if len(img.get("pages", [])) > 1:
+                    # Packed image: tell the model which original pages it holds
+                    parts.append({"text": (
+                        f"The next image shows {img['label']} pages {', '.join(map(str, img['pages']))} "
+                        "packed into a grid, each captioned with its page number. "
+                        "Cite these original page numbers in your comments."
+                    )})
+                else:
+                    # Skipped duplicate or locally scored pages leave gaps, so images are not numbered consecutively
+                    parts.append({"text": f"{img['label']} page {img['page_number']}:"})
                 parts.append({
                     "inline_data": {
-                        "mime_type": "image/png",
+                        "mime_type": img.get("mime_type", "image/png"),
                         "data": img["img_base64"]
                     }
                 })
         return parts
 
-    def generate_response(self, parts):
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(parts)
+    def generate_response(self, parts, model_name=DEFAULT_MODEL):
+        self.cancel_token.check()
+        model = self.get_model(model_name)
+        MODEL_REQUEST_BYTES.inc(payload_size(parts), model=model_name)
+        started = time.monotonic()
+        try:
+            # A job's deadline also bounds the request itself
+            response = self.hedge_policy.call(
+                model.generate_content, parts, cancel_token=self.cancel_token,
+                request_options={"timeout": self.cancel_token.timeout(self.request_timeout)})
+        except JobCancelled:
+            MODEL_REQUESTS.inc(model=model_name, status="cancelled")
+            raise
+        except Exception:
+            MODEL_REQUESTS.inc(model=model_name, status="error")
+            raise
+        finally:
+            self.timings["model"] += time.monotonic() - started
+        MODEL_REQUESTS.inc(model=model_name, status="ok")
+        MODEL_LATENCY.observe(time.monotonic() - started, model=model_name)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            MODEL_TOKENS.inc(getattr(usage, "prompt_token_count", 0) or 0, model=model_name, kind="prompt")
+            MODEL_TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, model=model_name, kind="output")
         return response.text
 
-    def process_pdfs(self, pdf_paths, prompt_text):
+    def prepare_pages(self, pdf_paths, skip_pages=None, page_selection=None, exam_bundle=None):
+        """
+        Render, deduplicate and encode every page, grouped per uploaded PDF.
+        Rendering runs one stage ahead in a background thread, so the next
+        page is rasterised while the current one is being compressed.
+        With an exam_bundle the exam pages are read from it instead of rendered.
+        """
+        started = time.monotonic()
+        self.deduplicator.reset()
         encoded_images_sets = []
-        temp_dirs = []
+        sets_by_label = {}
+        if exam_bundle is not None:
+            pdf_paths = {label: path for label, path in pdf_paths.items() if label not in exam_bundle.labels}
+            encoded_images_sets = exam_bundle.encoded_sets()
+            sets_by_label = {encoded_images[0]["label"]: encoded_images for encoded_images in encoded_images_sets}
+        try:
+            for label, page_number, image in prefetch(self.render_documents(pdf_paths, skip_pages, page_selection),
+                                                      self.render_queue_size):
+                self.cancel_token.check()
+                if label not in sets_by_label:
+                    sets_by_label[label] = []
+                    encoded_images_sets.append(sets_by_label[label])
+                if self.is_duplicate_page(image, label):
+                    continue
+                if self.page_packer is None:
+                    sets_by_label[label].append(self.encode_page(image, label, page_number))
+                else:
+                    self.add_packed_pages(sets_by_label, self.page_packer.add(label, page_number, image))
+        except Exception:
+            # Don't carry half-packed pages of an abandoned job into the next one
+            if self.page_packer is not None:
+                self.page_packer.flush()
+            raise
+        if self.page_packer is not None:
+            self.add_packed_pages(sets_by_label, self.page_packer.flush())
+        self.timings["render"] += time.monotonic() - started
+        return encoded_images_sets
+
+    def add_packed_pages(self, sets_by_label, packed_pages):
+        """Encode packed pages into the set of the PDF they came from"""
+        for packed in packed_pages:
+            encoded = self.encode_page(packed.image, packed.label, packed.page_numbers[0])
+            encoded["pages"] = packed.page_numbers
+            sets_by_label[packed.label].append(encoded)
+
+    def grade_pages(self, encoded_images_sets, prompt_text, model_name=DEFAULT_MODEL):
+        """Send the encoded pages to one model, planning around the inline size limit"""
+        parts = self.create_parts(prompt_text, encoded_images_sets)
+        if self.request_planner.fits(parts):
+            return self.generate_response(parts, model_name)
+        if self.request_planner.strategy == "split":
+            return self.generate_split_response(encoded_images_sets, prompt_text, model_name)
+        return self.generate_uploaded_response(parts, model_name)
+
+    def route_pages(self, encoded_images_sets, prompt_text):
+        """Grade the encoded pages through the model router, if one is configured"""
+        if self.router is None:
+            return self.grade_pages(encoded_images_sets, prompt_text)
+        return self.router.grade(self, encoded_images_sets, prompt_text)
+
+    def generate_uploaded_response(self, parts, model_name=DEFAULT_MODEL):
+        """Send the page images through the file-upload API instead of inline"""
+        upload_parts, uploaded_files = self.request_planner.upload_parts(parts)
+        try:
+            return self.generate_response(upload_parts, model_name)
+        finally:
+            self.request_planner.delete_uploads(uploaded_files)
+
+    def generate_split_response(self, encoded_images_sets, prompt_text, model_name=DEFAULT_MODEL):
+        """Grade the answer sheet in sequential chunks and merge the result tables"""
+        exam_sets, chunks = self.request_planner.split_pages(encoded_images_sets, prompt_text)
+        responses = []
+        graded_questions = []
+        for chunk_index, chunk in enumerate(chunks):
+            chunk_prompt = continuation_prompt(prompt_text, chunk_index, len(chunks), chunk, graded_questions)
+            response_text = self.generate_response(self.create_parts(chunk_prompt, exam_sets + [chunk]), model_name)
+            responses.append(response_text)
+            for row in parse_results_table(response_text):
+                question = next(iter(row.values()))
+                if question not in graded_questions:
+                    graded_questions.append(question)
+        return merge_responses(responses)
+
+    def process_pdfs(self, pdf_paths, prompt_text, answer_key=None, page_selection=None, exam_bundle=None,
+                     boilerplate_pdf=None):
+        """
+        Grade the uploaded PDFs. MCQ and numeric questions found in the answer
+        key (by default read from the reference's text layer) are scored
+        locally and only the remaining questions go to the model.
+        page_selection maps a label to the pages to use, e.g. {"Actual Answer": "3-12"}.
+        An exam_bundle (see exam_bundle.py) supplies the question paper and
+        reference pages and the answer key, so only the student's PDF is needed.
+        Pages matching any page of boilerplate_pdf (the exam's cover or
+        instruction sheets) are not sent.
+        """
+        self.load_boilerplate(boilerplate_pdf)
         try:
-            for label, pdf_path in pdf_paths.items():
-                if pdf_path:
-                    image_paths, temp_dir = self.pdf_to_images(pdf_path)
-                    encoded_images = self.images_to_base64(image_paths, label)
-                    encoded_images_sets.append(encoded_images)
-                    temp_dirs.append(temp_dir)
-
-            parts = self.create_parts(prompt_text, encoded_images_sets)
-            response_text = self.generate_response(parts)
-            return response_text
+            if self.local_scoring and pdf_paths.get("Actual Answer"):
+                if answer_key is None:
+                    answer_key = (exam_bundle.answer_key if exam_bundle is not None
+                                  else answer_key_from_pdfs(pdf_paths, page_selection=page_selection))
+                if answer_key:
+                    return grade_with_answer_key(self, pdf_paths, prompt_text, answer_key,
+                                                 page_selection=page_selection, exam_bundle=exam_bundle)
+            return self.route_pages(self.prepare_pages(pdf_paths, page_selection=page_selection,
+                                                       exam_bundle=exam_bundle), prompt_text)
         finally:
-            # Cleanup: remove the temporary directories
-            for temp_dir in temp_dirs:
-                self.cleanup_temp_dir(temp_dir)
+            # One exam's cover sheet must not hide pages of the next job's exam
+            self.load_boilerplate(None)
 
     def cleanup_temp_dir(self, temp_dir):
         try:
@@ -0,0 +1,57 @@
+import queue, threading
+
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def prefetch(iterable, maxsize=2):
+    """
+    Run an iterable in a background thread and yield its items through a bounded queue.
+    The producer stays at most maxsize items ahead of the consumer, so the next
+    stage's work overlaps with this one without buffering a whole document.
+    Exceptions raised by the producer are re-raised in the consumer.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_StageError(e))
+        finally:
+            # Close generators here so open documents are released by this thread
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.exception
+            yield item
+    finally:
+        # Consumer finished or gave up early; let the producer exit
+        stop.set()
+        thread.join()
@@ -0,0 +1,97 @@
+import io, threading
+
+from src.utils.page_hash import page_signature
+from src.utils.pdf_loading import open_pdf, parse_page_ranges
+from src.utils.render_cache import shared_render_cache
+
+
+def cached_signature(image):
+    """Return the page's dedup signature, computing it once per rendered page"""
+    signature = getattr(image, "signature", None)
+    if signature is None:
+        signature = image.signature = page_signature(image)
+    return signature
+
+
+def page_payload(image):
+    """
+    Return (bytes, mime_type) to send for a page, encoding it once per rendered page.
+    Scanned pages already carry their embedded image; others are PNG-encoded.
+    """
+    encoded = getattr(image, "encoded", None)
+    if encoded is None:
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        encoded = image.encoded = (buffer.getvalue(), "image/png")
+    return encoded
+
+
+class PreprocessTask:
+    """Renders, fingerprints and encodes the selected pages of one PDF on a background thread"""
+
+    def __init__(self, pdf_path, render_cache, max_fill=0.9, pages=None):
+        self.pdf_path = pdf_path
+        self.pages = pages
+        self.render_cache = render_cache
+        self.max_fill = max_fill
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="Preprocess", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _run(self):
+        try:
+            with open_pdf(self.pdf_path) as pdf_document:
+                for page_number in parse_page_ranges(self.pages, len(pdf_document)):
+                    if self.cancelled.is_set():
+                        return
+                    # Stop before this PDF starts evicting its own earlier pages (or at once for a cache that keeps nothing)
+                    if self.render_cache.total_bytes >= self.render_cache.max_bytes * self.max_fill:
+                        return
+                    image = self.render_cache.render(pdf_document, self.pdf_path, page_number)
+                    cached_signature(image)
+                    page_payload(image)
+        except Exception as e:
+            print(f"Error preprocessing {self.pdf_path}: {e}")
+        finally:
+            self.done.set()
+
+
+class Preprocessor:
+    """
+    Starts preprocessing a PDF as soon as it is selected, one task per slot
+    (e.g. "Question Paper"). Selecting another file for a slot cancels the
+    previous task; grading then finds the pages already in the render cache.
+    """
+
+    def __init__(self, render_cache=None):
+        self.render_cache = render_cache or shared_render_cache
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    def start(self, slot, pdf_path, pages=None):
+        with self.lock:
+            previous = self.tasks.pop(slot, None)
+            if previous is not None:
+                previous.cancel()
+            task = self.tasks[slot] = PreprocessTask(pdf_path, self.render_cache, pages=pages).start()
+        return task
+
+    def cancel(self, slot):
+        with self.lock:
+            task = self.tasks.pop(slot, None)
+        if task is not None:
+            task.cancel()
+
+    def cancel_all(self):
+        with self.lock:
+            tasks = list(self.tasks.values())
+            self.tasks.clear()
+        for task in tasks:
+            task.cancel()
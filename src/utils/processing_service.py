@@ -0,0 +1,236 @@
+import sys, heapq, queue, itertools, threading
+from concurrent.futures import Future
+
+from src.utils.cancellation import CancellationToken, JobCancelled, SharedCancellationToken
+from src.utils.cost_model import CostModel, job_features
+from src.utils.metrics import JOBS, JOBS_IN_FLIGHT, JOBS_QUEUED
+from src.utils.pdf_processor import PDFProcessor
+from src.utils.preprocessing import Preprocessor
+from src.utils.rubric import RubricCache, apply_rubric
+
+
+class ProcessingJob:
+    """A single grading request queued on the service"""
+
+    def __init__(self, pdf_paths, prompt, progress_callback=None, use_rubric=False, priority=0, cancel_token=None,
+                 page_selection=None, boilerplate_pdf=None):
+        self.pdf_paths = pdf_paths
+        self.boilerplate_pdf = boilerplate_pdf
+        self.page_selection = page_selection
+        self.prompt = prompt
+        self.progress_callback = progress_callback
+        self.use_rubric = use_rubric
+        self.priority = priority
+        self.cancel_token = cancel_token or CancellationToken()
+        self.features = None
+        self.predicted = None
+        self.packable = False
+        self.prefetched = False
+        self.future = Future()
+
+
+class ProcessingService:
+    """
+    Long-lived grading service.
+    Each worker thread owns one PDFProcessor whose model client stays warm
+    between jobs, so only the first job pays for client and connection setup.
+    Queued jobs run highest priority first and, within a priority, longest
+    predicted first, so long scripts do not leave the pool idling at the end
+    of a batch. While a worker's job waits on the model, the next queued
+    job's pages are rendered into the render cache, so that job starts with
+    its pages ready. With a script_packer, short scripts of the same exam
+    waiting in the queue are graded together in one request.
+    """
+
+    def __init__(self, api_key, workers=1, max_queue=0, processor_factory=PDFProcessor, rubric_cache=None,
+                 cost_model=None, script_packer=None):
+        self.api_key = api_key
+        self.script_packer = script_packer
+        self.rubric_cache = rubric_cache or RubricCache()
+        self.cost_model = cost_model or CostModel()
+        self.sequence = itertools.count()
+        self.jobs = queue.PriorityQueue(maxsize=max_queue)
+        JOBS_QUEUED.set_function(self.pending_jobs)
+        self.processor_factory = processor_factory
+        self.threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"ProcessingService-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, pdf_paths, prompt, progress_callback=None, use_rubric=False, priority=0, cancel_token=None,
+               page_selection=None, boilerplate_pdf=None):
+        """
+        Queue a job and return a Future resolving to the model's response text.
+        With use_rubric the reference pages are replaced by the exam's precompiled
+        rubric, and the prompt is rebuilt to match. Higher priorities run first.
+        Cancelling cancel_token, or letting its deadline pass, stops the job
+        between pages or during its model call with JobCancelled.
+        page_selection maps a label to the pages to grade, e.g. {"Actual Answer": "3-12"}.
+        Pages matching the exam's boilerplate_pdf (cover, instructions) are not sent.
+        Raises queue.Full when the service was created with a bounded queue that is full.
+        """
+        job = ProcessingJob(dict(pdf_paths), prompt, progress_callback, use_rubric, priority, cancel_token,
+                            dict(page_selection or {}), boilerplate_pdf)
+        try:
+            job.features = job_features(job.pdf_paths, job.page_selection)
+            job.predicted = self.cost_model.predict(job.features)
+        except Exception as e:
+            print(f"Could not estimate the job's cost: {e}")
+        if self.script_packer is not None and not job.page_selection:
+            job.packable = self.script_packer.packable(job.pdf_paths)
+        predicted_total = job.predicted["total"] if job.predicted else 0.0
+        self.jobs.put_nowait((-priority, -predicted_total, next(self.sequence), job))
+        return job.future
+
+    def pending_jobs(self):
+        return self.jobs.qsize()
+
+    def is_full(self):
+        """Whether submit() would raise queue.Full right now"""
+        return self.jobs.full()
+
+    def _worker_loop(self):
+        # Connect before the first job arrives; on failure the first job retries
+        processor = None
+        preprocessor = None
+        try:
+            processor = self.processor_factory(self.api_key)
+            processor.warm_up()
+        except Exception as e:
+            processor = None
+            print(f"Could not start a grading worker ahead of time: {e}")
+        while True:
+            job = self.jobs.get()[-1]
+            if job is None:
+                if preprocessor is not None:
+                    preprocessor.cancel_all()
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            batch = [job] + (self._take_companions(job) if job.packable else [])
+            JOBS_IN_FLIGHT.inc(len(batch))
+            try:
+                if processor is None:
+                    try:
+                        processor = self.processor_factory(self.api_key)
+                        processor.warm_up()
+                    except Exception as e:
+                        processor = None
+                        for queued_job in batch:
+                            JOBS.inc(status="failed")
+                            queued_job.future.set_exception(e)
+                        continue
+                if preprocessor is None:
+                    preprocessor = Preprocessor(processor.render_cache)
+                self._prefetch_next(preprocessor)
+                # Jobs cancelled while queued are settled on their own instead of taking a place in the pack
+                live = [queued_job for queued_job in batch if not queued_job.cancel_token.cancelled]
+                responses = self._run_packed(processor, live) if len(live) > 1 else None
+                packed = dict(zip(live, responses)) if responses is not None else {}
+                for queued_job in batch:
+                    # Each job's own token is checked, so a member cancelled mid-pack ends cancelled alone
+                    if queued_job in packed:
+                        self._settle(queued_job, lambda response: response, packed[queued_job])
+                    else:
+                        self._settle(queued_job, self._run_job, processor, queued_job)
+            finally:
+                JOBS_IN_FLIGHT.dec(len(batch))
+
+    def _prefetch_next(self, preprocessor):
+        """Start rendering the pages of the job at the head of the queue in the background"""
+        with self.jobs.mutex:
+            job = self.jobs.queue[0][-1] if self.jobs.queue else None
+            # Another worker may already be preparing it
+            if job is None or job.prefetched or job.cancel_token.cancelled:
+                return
+            job.prefetched = True
+        # Starting a slot cancels this worker's previous prefetch; its job has usually started by now
+        for label, pdf_path in job.pdf_paths.items():
+            if pdf_path:
+                preprocessor.start(label, pdf_path, job.page_selection.get(label))
+
+    def _settle(self, job, run, *args):
+        """Resolve a job's future with run(*args), counting the outcome"""
+        try:
+            # Jobs cancelled or expired while queued never start
+            job.cancel_token.check()
+            job.future.set_result(run(*args))
+            JOBS.inc(status="succeeded")
+        except JobCancelled as e:
+            JOBS.inc(status="cancelled")
+            job.future.set_exception(e)
+        except Exception as e:
+            JOBS.inc(status="failed")
+            job.future.set_exception(e)
+
+    def _run_job(self, processor, job):
+        if job.progress_callback:
+            job.progress_callback(30)
+        pdf_paths, prompt, answer_key = job.pdf_paths, job.prompt, None
+        processor.cancel_token = job.cancel_token
+        try:
+            if job.use_rubric:
+                pdf_paths, prompt, answer_key = apply_rubric(processor, pdf_paths, self.rubric_cache)
+            for stage in processor.timings:
+                processor.timings[stage] = 0.0
+            response = processor.process_pdfs(pdf_paths, prompt, answer_key, job.page_selection,
+                                              boilerplate_pdf=job.boilerplate_pdf)
+        except JobCancelled:
+            # Free the abandoned script's rendered pages now rather than when the cache evicts them
+            if pdf_paths.get("Actual Answer"):
+                processor.render_cache.evict(pdf_paths["Actual Answer"])
+            raise
+        finally:
+            processor.cancel_token = CancellationToken()
+        if job.predicted is not None:
+            self.cost_model.record(job.features, job.predicted, processor.timings)
+        return response
+
+    def _take_companions(self, job):
+        """Take queued jobs that can share a request with job out of the queue"""
+        pack_key = self.script_packer.pack_key(job.pdf_paths, job.prompt, job.use_rubric)
+        # PriorityQueue has no selective get; work on its heap under its own lock
+        with self.jobs.mutex:
+            matches = [item for item in sorted(self.jobs.queue)
+                       if item[-1] is not None and item[-1].packable
+                       and self.script_packer.pack_key(item[-1].pdf_paths, item[-1].prompt,
+                                                       item[-1].use_rubric) == pack_key]
+            matches = matches[:self.script_packer.max_students - 1]
+            if matches:
+                for item in matches:
+                    self.jobs.queue.remove(item)
+                heapq.heapify(self.jobs.queue)
+                self.jobs.not_full.notify(len(matches))
+        return [item[-1] for item in matches if item[-1].future.set_running_or_notify_cancel()]
+
+    def _run_packed(self, processor, jobs):
+        """Grade short scripts of one exam in one request; returns their responses, or None to grade singly"""
+        for job in jobs:
+            if job.progress_callback:
+                job.progress_callback(30)
+        pdf_paths, prompt, answer_key = jobs[0].pdf_paths, jobs[0].prompt, None
+        # The shared request only stops once every member is cancelled or past its deadline
+        processor.cancel_token = SharedCancellationToken(job.cancel_token for job in jobs)
+        try:
+            if jobs[0].use_rubric:
+                pdf_paths, prompt, answer_key = apply_rubric(processor, pdf_paths, self.rubric_cache)
+            student_paths = [dict(pdf_paths, **{"Actual Answer": job.pdf_paths["Actual Answer"]}) for job in jobs]
+            # Packed jobs share one exam, and with it its boilerplate
+            processor.load_boilerplate(jobs[0].boilerplate_pdf)
+            return self.script_packer.grade(processor, student_paths, prompt, answer_key)
+        except Exception as e:
+            print(f"Packed grading of {len(jobs)} scripts failed, grading them one by one: {e}")
+            return None
+        finally:
+            processor.load_boilerplate(None)
+            processor.cancel_token = CancellationToken()
+
+    def shutdown(self, wait=False):
+        """Stop the worker threads once the queued jobs have finished"""
+        # Sentinels sort after every queued job
+        for _ in self.threads:
+            self.jobs.put((sys.maxsize, 0.0, next(self.sequence), None))
+        if wait:
+            for thread in self.threads:
+                thread.join()
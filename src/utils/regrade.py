@@ -0,0 +1,217 @@
+import os, re, sys, json, hashlib, argparse
+import fitz  # PyMuPDF
+from PIL import Image
+
+from src.ui.prompts import construct_prompt
+from src.ui.report_generator import generate_markdown_report
+from src.utils.exam_registry import ExamRegistry
+from src.utils.metrics import RETRIES
+from src.utils.page_hash import dhash, hamming_distance
+from src.utils.result_parser import parse_results_table, format_results_table, question_key
+from src.utils.results_store import ResultsStore
+
+# Lines such as "Q3", "Question 3.", "Ans 3:", "Answer 3)" or "3." start a new question
+QUESTION_START = re.compile(
+    r"^\s*(?:(?:Q|Ques|Question|Ans|Answer)\s*\.?\s*(\d{1,3}[a-z]?)\b|(\d{1,3}[a-z]?)\s*[.)])",
+    re.IGNORECASE)
+
+
+def _text_hash(text):
+    return hashlib.sha256(" ".join(text.split()).lower().encode("utf-8")).hexdigest()
+
+
+def split_questions(page_texts):
+    """
+    Split a document's text layer into questions.
+    Returns ({question: text}, [questions on each page]).
+    """
+    questions = {}
+    page_questions = []
+    current = None
+    for text in page_texts:
+        on_page = [current] if current else []
+        for line in text.splitlines():
+            match = QUESTION_START.match(line)
+            if match:
+                current = question_key(match.group(1) or match.group(2))
+                if current not in on_page:
+                    on_page.append(current)
+            if current:
+                questions[current] = questions.get(current, "") + line + "\n"
+        page_questions.append(on_page)
+    return questions, page_questions
+
+
+def document_fingerprint(pdf_path):
+    """Fingerprint a PDF by per-page dHash and per-question text hashes"""
+    page_hashes = []
+    page_texts = []
+    with fitz.open(pdf_path) as pdf_document:
+        for page in pdf_document:
+            pix = page.get_pixmap(dpi=50)
+            page_hashes.append(format(dhash(Image.frombytes("RGB", [pix.width, pix.height], pix.samples)), "x"))
+            page_texts.append(page.get_text())
+    questions, page_questions = split_questions(page_texts)
+    return {
+        "page_hashes": page_hashes,
+        "page_text_hashes": [_text_hash(text) for text in page_texts],
+        "page_questions": page_questions,
+        "questions": {question: _text_hash(text) for question, text in questions.items()},
+    }
+
+
+def fingerprint_version(fingerprint):
+    """Short stable ID of a reference fingerprint, recorded on results graded against it"""
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def changed_questions(old, new, page_hash_tolerance=2):
+    """
+    Work out which questions' reference content changed.
+    Returns a sorted list of question keys, or None when the change cannot be
+    narrowed down to questions (no text layer) and a full regrade is needed.
+    """
+    changed = {question for question, digest in new["questions"].items()
+               if old["questions"].get(question) != digest}
+
+    # Pages whose image changed but whose text did not (scanned corrections, marks
+    # written in by hand) still invalidate the questions on them
+    for index, page_hash in enumerate(new["page_hashes"]):
+        if index >= len(old["page_hashes"]):
+            page_changed = not new["page_questions"][index]
+        else:
+            image_changed = hamming_distance(int(page_hash, 16), int(old["page_hashes"][index], 16)) > page_hash_tolerance
+            page_changed = image_changed and old["page_text_hashes"][index] == new["page_text_hashes"][index]
+        if page_changed:
+            if not new["page_questions"][index]:
+                return None
+            changed.update(new["page_questions"][index])
+    return sorted(changed, key=_question_sort_key)
+
+
+def _question_sort_key(question):
+    match = re.match(r"(\d+)(.*)", question)
+    return (int(match.group(1)), match.group(2)) if match else (sys.maxsize, question)
+
+
+def focused_prompt(prompt_text, questions):
+    """Restrict a grading prompt to the given questions"""
+    return prompt_text + (
+        " IMPORTANT: Only grade these questions: " + ", ".join(questions) + ". "
+        "Leave every other question out of the table."
+    )
+
+
+def merge_rows(rows, new_rows):
+    """Replace rows for regraded questions and add any that were missing"""
+    merged = {}
+    for row in rows + new_rows:
+        merged[question_key(next(iter(row.values()), ""))] = row
+    return sorted(merged.values(), key=lambda row: _question_sort_key(question_key(next(iter(row.values()), ""))))
+
+
+def find_missing_questions(rows, expected_questions):
+    graded = {question_key(next(iter(row.values()), "")) for row in rows}
+    return [question for question in expected_questions if question not in graded]
+
+
+def grade_with_completion(processor, pdf_paths, prompt_text, expected_questions=None, questions=None,
+                          boilerplate_pdf=None):
+    """
+    Grade (optionally only some questions), then re-ask the model only for
+    expected questions missing from a truncated or malformed response.
+    Returns the parsed rows.
+    """
+    if questions:
+        expected_questions = questions
+        prompt_text_for_call = focused_prompt(prompt_text, questions)
+    else:
+        prompt_text_for_call = prompt_text
+    rows = parse_results_table(processor.process_pdfs(pdf_paths, prompt_text_for_call, boilerplate_pdf=boilerplate_pdf))
+    missing = find_missing_questions(rows, expected_questions or [])
+    if missing:
+        print(f"Response was missing questions {', '.join(missing)}, asking again for those only")
+        RETRIES.inc(reason="missing questions")
+        retry_rows = parse_results_table(processor.process_pdfs(pdf_paths, focused_prompt(prompt_text, missing),
+                                                                boilerplate_pdf=boilerplate_pdf))
+        rows = merge_rows(rows, retry_rows)
+    return rows
+
+
+def regrade_exam(processor, exam_id, new_reference_path, registry=None, store=None, output_dir="reports"):
+    """
+    Replace an exam's reference and regrade only the questions whose reference changed.
+    Each regraded result records the reference it was graded against, and the
+    exam's fingerprint only moves to the new reference once every student is
+    done, so running it again after a failure picks up the remaining students.
+    Returns the list of questions that were regraded.
+    """
+    registry = registry or ExamRegistry()
+    store = store or ResultsStore(registry)
+    metadata = registry.metadata(exam_id)
+    if metadata is None:
+        raise KeyError(f"Unknown exam: {exam_id}")
+
+    pdf_paths = registry.pdf_paths(exam_id)
+    if "reference_fingerprint" in metadata:
+        old_fingerprint = metadata["reference_fingerprint"]
+    else:
+        old_fingerprint = document_fingerprint(pdf_paths["Reference Answer"]) if pdf_paths["Reference Answer"] else None
+    new_fingerprint = document_fingerprint(new_reference_path)
+    questions = None if old_fingerprint is None else changed_questions(old_fingerprint, new_fingerprint)
+    reference_version = fingerprint_version(new_fingerprint)
+
+    if "reference_fingerprint" not in metadata:
+        # Keep the fingerprint the stored results were graded against (None: no reference) until they are all regraded
+        registry.update_metadata(exam_id, reference_fingerprint=old_fingerprint)
+    with open(new_reference_path, "rb") as f:
+        pdf_paths["Reference Answer"] = registry.replace_file(exam_id, "Reference Answer", f.read())
+    if questions == []:
+        registry.update_metadata(exam_id, reference_fingerprint=new_fingerprint)
+        print("No reference content changed; stored results are still valid")
+        return []
+
+    expected_questions = document_fingerprint(pdf_paths["Question Paper"])["questions"].keys()
+    prompt = construct_prompt(True)
+    boilerplate_pdf = registry.boilerplate_path(exam_id)
+    for record in store.load_all(exam_id):
+        student = record["student"]
+        if record.get("reference_version") == reference_version:
+            continue
+        script_path = store.script_path(exam_id, student)
+        if not os.path.exists(script_path):
+            print(f"Skipping {student}: their answer sheet is not in the results store")
+            continue
+        student_paths = dict(pdf_paths, **{"Actual Answer": script_path})
+        if questions is None:
+            rows = grade_with_completion(processor, student_paths, prompt, list(expected_questions),
+                                         boilerplate_pdf=boilerplate_pdf)
+        else:
+            rows = merge_rows(record["rows"], grade_with_completion(processor, student_paths, prompt, questions=questions,
+                                                                    boilerplate_pdf=boilerplate_pdf))
+        response_text = format_results_table(rows)
+        store.save(exam_id, student, rows, response_text, reference_version=reference_version)
+        os.makedirs(output_dir, exist_ok=True)
+        generate_markdown_report(response_text, os.path.join(output_dir, f"report_{exam_id}_{student}.md"))
+        print(f"Regraded {student}")
+    registry.update_metadata(exam_id, reference_fingerprint=new_fingerprint)
+    return questions if questions is not None else list(expected_questions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regrade only the questions whose reference answer changed")
+    parser.add_argument("--exam", required=True, help="Registered exam ID")
+    parser.add_argument("--reference", required=True, help="Corrected reference answer PDF")
+    parser.add_argument("--output", default="reports", help="Folder for the regenerated reports")
+    args = parser.parse_args(argv)
+
+    from src.utils.api_key_manager import ApiKeyManager
+    from src.utils.pdf_processor import PDFProcessor
+    questions = regrade_exam(PDFProcessor(ApiKeyManager.get_api_key()), args.exam, args.reference,
+                             output_dir=args.output)
+    if questions:
+        print(f"Regraded questions: {', '.join(questions)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
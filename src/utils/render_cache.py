@@ -0,0 +1,87 @@
+import os, threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from src.utils.metrics import PAGES_RENDERED, RENDER_CACHE
+from src.utils.scan_images import extract_scan
+
+RENDER_DPI = 150
+
+
+class RenderCache:
+    """
+    In-memory LRU of rendered pages, bounded by total image size.
+    Entries are keyed by the file's path, size and modification time, so an
+    edited PDF is rendered again. Cached images are shared; callers must not
+    modify them in place.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(pdf_path, page_number, dpi):
+        stat = os.stat(pdf_path)
+        return os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns, page_number, dpi
+
+    def get(self, key):
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        size = image.width * image.height * len(image.getbands())
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.images:
+                return
+            self.images[key] = image
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.images.popitem(last=False)
+                self.total_bytes -= evicted.width * evicted.height * len(evicted.getbands())
+
+    def render(self, pdf_document, pdf_path, page_number, dpi=RENDER_DPI):
+        """
+        Return the page as an RGB image, rasterising it only on a cache miss.
+        Scanned pages come straight from their embedded image (see extract_scan).
+        """
+        key = self.cache_key(pdf_path, page_number, dpi)
+        image = self.get(key)
+        if image is not None:
+            RENDER_CACHE.inc(result="hit")
+            return image
+        RENDER_CACHE.inc(result="miss")
+        image = extract_scan(pdf_document, page_number, dpi)
+        if image is not None:
+            PAGES_RENDERED.inc(source="scan")
+        else:
+            pix = pdf_document[page_number - 1].get_pixmap(dpi=dpi)
+            image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            PAGES_RENDERED.inc(source="render")
+        self.put(key, image)
+        return image
+
+    def evict(self, pdf_path):
+        """Drop every cached page of one PDF, e.g. after its job was cancelled"""
+        path = os.path.abspath(pdf_path)
+        with self.lock:
+            for key in [key for key in self.images if key[0] == path]:
+                evicted = self.images.pop(key)
+                self.total_bytes -= evicted.width * evicted.height * len(evicted.getbands())
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+            self.total_bytes = 0
+
+
+# Shared by the grading pipeline and the GUI's page previews
+shared_render_cache = RenderCache()
@@ -0,0 +1,172 @@
+import io, uuid, base64
+import google.generativeai as genai
+
+from src.utils.api_key_manager import ApiKeyManager
+from src.utils.result_parser import parse_results_table, format_results_table, question_key
+
+# Gemini rejects requests whose inline data exceeds 20 MB; stay under it with some headroom
+INLINE_PAYLOAD_LIMIT = 18 * 1024 * 1024
+
+STUDENT_LABEL = "Actual Answer"
+
+
+def payload_size(parts):
+    """
+    Approximate inline request size in bytes for a list of request parts.
+    Files already uploaded through the File API are referenced, not sent, so they count as nothing.
+    """
+    size = 0
+    for part in parts:
+        if not isinstance(part, dict):
+            continue
+        if "text" in part:
+            size += len(part["text"].encode("utf-8"))
+        elif "inline_data" in part:
+            size += len(part["inline_data"]["data"])
+    return size
+
+
+class GeminiFileUploader:
+    """Uploads page images through the Gemini File API"""
+
+    def upload(self, data, mime_type):
+        return genai.upload_file(io.BytesIO(data), mime_type=mime_type)
+
+    def delete(self, uploaded):
+        try:
+            genai.delete_file(uploaded.name)
+        except Exception as e:
+            print(f"Error deleting uploaded file {uploaded.name}: {e}")
+
+
+class FakeFileUploader:
+    """Keeps 'uploaded' files in memory; used for testing without network access"""
+
+    def __init__(self):
+        self.files = {}
+
+    def upload(self, data, mime_type):
+        file_uri = f"fake://{uuid.uuid4().hex}"
+        self.files[file_uri] = data
+        return {"file_data": {"mime_type": mime_type, "file_uri": file_uri}}
+
+    def delete(self, uploaded):
+        self.files.pop(uploaded["file_data"]["file_uri"], None)
+
+
+class RequestPlanner:
+    """
+    Decides how to send a request whose inline payload is too large.
+    'upload' moves page images to the file-upload API; 'split' grades the
+    answer sheet in sequential chunks and merges the result tables.
+    """
+
+    def __init__(self, max_inline_bytes=INLINE_PAYLOAD_LIMIT, strategy="upload", uploader=None):
+        if strategy not in ("upload", "split"):
+            raise ValueError(f"Unknown request strategy: {strategy}")
+        self.max_inline_bytes = max_inline_bytes
+        self.strategy = strategy
+        self.uploader = uploader or GeminiFileUploader()
+
+    @classmethod
+    def from_config(cls):
+        """
+        Build the planner from the "requests" section of config.json, e.g.
+        {"strategy": "split"}; without one, oversized requests are uploaded.
+        """
+        return cls(**ApiKeyManager.get_settings('requests'))
+
+    def fits(self, parts):
+        return payload_size(parts) <= self.max_inline_bytes
+
+    def upload_parts(self, parts):
+        """
+        Replace inline images with uploaded file references.
+        Returns (new_parts, uploaded_files) so the caller can delete the uploads afterwards.
+        """
+        new_parts = []
+        uploaded_files = []
+        try:
+            for part in parts:
+                if "inline_data" in part:
+                    inline = part["inline_data"]
+                    uploaded = self.uploader.upload(base64.b64decode(inline["data"]), inline["mime_type"])
+                    uploaded_files.append(uploaded)
+                    new_parts.append(uploaded)
+                else:
+                    new_parts.append(part)
+        except Exception:
+            self.delete_uploads(uploaded_files)
+            raise
+        return new_parts, uploaded_files
+
+    def delete_uploads(self, uploaded_files):
+        for uploaded in uploaded_files:
+            self.uploader.delete(uploaded)
+
+    def split_pages(self, encoded_images_sets, prompt_text):
+        """
+        Split the student's pages into chunks that fit alongside the exam pages.
+        Returns (exam_sets, chunks) where each chunk is a list of encoded student pages.
+        """
+        exam_sets = [images for images in encoded_images_sets
+                     if not images or images[0]["label"] != STUDENT_LABEL]
+        student_pages = [img for images in encoded_images_sets for img in images
+                         if img["label"] == STUDENT_LABEL]
+        # Leave room for the continuation note added to every chunk's prompt
+        budget = self.max_inline_bytes - len(prompt_text.encode("utf-8")) - 4096
+        budget -= sum(len(img["img_base64"]) for images in exam_sets for img in images)
+        if budget <= 0:
+            raise ValueError("The question paper and reference alone exceed the request size limit")
+
+        chunks = []
+        current, current_size = [], 0
+        for img in student_pages:
+            size = len(img["img_base64"])
+            if size > budget:
+                raise ValueError(f"Answer sheet page {img['page_number']} alone exceeds the request size limit")
+            if current and current_size + size > budget:
+                chunks.append(current)
+                current, current_size = [], 0
+            current.append(img)
+            current_size += size
+        if current:
+            chunks.append(current)
+        return exam_sets, chunks
+
+
+def continuation_prompt(prompt_text, chunk_index, chunk_count, chunk, graded_questions):
+    """Extend the grading prompt for one chunk of a split answer sheet"""
+    first_page = chunk[0]["page_number"]
+    last_page = chunk[-1].get("pages", [chunk[-1]["page_number"]])[-1]
+    note = (
+        f" NOTE: The answer sheet is too large for one request and is being graded in {chunk_count} parts. "
+        f"This is part {chunk_index + 1} of {chunk_count}, containing answer sheet pages {first_page} to {last_page}. "
+        "Only grade answers that appear on these pages. "
+    )
+    if graded_questions:
+        note += (
+            "These questions were already graded in earlier parts: " + ", ".join(graded_questions) + ". "
+            "Do not grade them again, unless the answer to the last of them continues onto these pages, "
+            "in which case grade that answer again taking all of it into account. "
+        )
+    return prompt_text + note
+
+
+def merge_responses(responses):
+    """
+    Merge the grading tables from a split request into one response.
+    A question graded again in a later part replaces the earlier row.
+    """
+    merged = {}
+    columns = None
+    for response_text in responses:
+        for row in parse_results_table(response_text):
+            columns = columns or list(row.keys())
+            merged[question_key(row[columns[0]])] = row
+    if not merged:
+        return "\n\n".join(responses)
+    return (
+        f"The answer sheet was graded in {len(responses)} parts and the results were merged.\n\n"
+        + format_results_table(list(merged.values()), columns)
+    )
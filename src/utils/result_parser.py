@@ -0,0 +1,64 @@
+import re
+
+QUESTION_COLUMN = "Question Number"
+
+
+def _split_row(line):
+    cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+    return cells
+
+
+def _is_separator(cells):
+    return all(re.fullmatch(r":?-{3,}:?", cell) for cell in cells if cell)
+
+
+def parse_results_table(response_text):
+    """
+    Parse the markdown grading table returned by the model.
+    Returns a list of dicts keyed by the table's column names.
+    """
+    rows = []
+    header = None
+    for line in response_text.splitlines():
+        if "|" not in line:
+            # A table ends at the first line without cells
+            if header and rows:
+                break
+            continue
+        cells = _split_row(line)
+        if header is None:
+            if any(QUESTION_COLUMN.lower() in cell.lower() for cell in cells):
+                header = cells
+            continue
+        if _is_separator(cells):
+            continue
+        row = dict(zip(header, cells + [""] * (len(header) - len(cells))))
+        if row.get(header[0]):
+            rows.append(row)
+    return rows
+
+
+def parse_marks(value):
+    """Return the first number in a table cell such as '4.5', '4.5/5' or '90%', or None"""
+    match = re.search(r"-?\d+(?:\.\d+)?", value or "")
+    return float(match.group()) if match else None
+
+
+def question_key(value):
+    """Normalise a question label ('Q1', '1.', 'Question 1') to a comparable key"""
+    value = re.sub(r"^(question|ques|q)\.?\s*", "", (value or "").strip(), flags=re.IGNORECASE)
+    return value.strip(" .:)").lower()
+
+
+def format_results_table(rows, columns=None):
+    """Render parsed rows back into a markdown table"""
+    if not rows:
+        return ""
+    columns = columns or list(rows[0].keys())
+    lines = [
+        "| " + " | ".join(columns) + " |",
+        "| " + " | ".join("---" for _ in columns) + " |",
+    ]
+    for row in rows:
+        lines.append("| " + " | ".join(str(row.get(column, "")) for column in columns) + " |")
+    return "\n".join(lines)
@@ -0,0 +1,60 @@
+import os, re, json, shutil, threading
+from datetime import datetime
+
+from src.utils.exam_registry import ExamRegistry, RESULTS_DIR
+
+
+def _safe_name(student):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", student).strip("._") or "student"
+
+
+class ResultsStore:
+    """
+    Keeps each student's parsed grading results (and a copy of their script)
+    next to the exam in the registry, so later regrades can reuse them.
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or ExamRegistry()
+        self.lock = threading.Lock()
+
+    def _results_dir(self, exam_id):
+        return os.path.join(self.registry.exam_dir(exam_id), RESULTS_DIR)
+
+    def _result_path(self, exam_id, student):
+        return os.path.join(self._results_dir(exam_id), f"{_safe_name(student)}.json")
+
+    def script_path(self, exam_id, student):
+        return os.path.join(self._results_dir(exam_id), f"{_safe_name(student)}.pdf")
+
+    def save(self, exam_id, student, rows, response_text, script_path=None, **extra):
+        """Store a student's results, copying their script into the store if given"""
+        results_dir = self._results_dir(exam_id)
+        record = dict(extra, exam_id=exam_id, student=student, rows=rows, response_text=response_text,
+                      graded_at=datetime.now().isoformat(timespec="seconds"))
+        with self.lock:
+            os.makedirs(results_dir, exist_ok=True)
+            if script_path and os.path.abspath(script_path) != self.script_path(exam_id, student):
+                shutil.copyfile(script_path, self.script_path(exam_id, student))
+            with open(self._result_path(exam_id, student), "w", encoding="utf-8") as f:
+                json.dump(record, f, indent=2)
+        return record
+
+    def load(self, exam_id, student):
+        try:
+            with open(self._result_path(exam_id, student), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load_all(self, exam_id):
+        """Return every stored result for an exam"""
+        results_dir = self._results_dir(exam_id)
+        if not os.path.isdir(results_dir):
+            return []
+        records = []
+        for name in sorted(os.listdir(results_dir)):
+            if name.endswith(".json"):
+                with open(os.path.join(results_dir, name), "r", encoding="utf-8") as f:
+                    records.append(json.load(f))
+        return records
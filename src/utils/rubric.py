@@ -0,0 +1,130 @@
+import os, re, sys, json, hashlib, argparse, threading
+
+from src.ui.prompts import construct_prompt, construct_rubric_prompt
+from src.utils.answer_key import answer_key_from_rubric
+from src.utils.api_key_manager import ApiKeyManager
+from src.utils.metrics import RUBRIC_CACHE
+
+# Bump when the rubric prompt or format changes so stale rubrics are rebuilt
+RUBRIC_VERSION = 2
+
+
+def parse_rubric(response_text):
+    """Extract the rubric JSON from a model response, or return None if it is unusable"""
+    match = re.search(r"\{.*\}", response_text, re.DOTALL)
+    if not match:
+        return None
+    try:
+        rubric = json.loads(match.group())
+    except ValueError:
+        return None
+    questions = rubric.get("questions")
+    if not isinstance(questions, list) or not questions:
+        return None
+    return rubric
+
+
+def format_rubric(rubric):
+    """Render a rubric as compact text for the grading prompt"""
+    lines = []
+    for entry in rubric["questions"]:
+        line = f"Q{entry.get('question', '?')} ({entry.get('marks', '?')} marks): " + "; ".join(entry.get("key_points", []))
+        if entry.get("answer"):
+            line += f" | Answer: {entry['answer']}"
+        variants = entry.get("accepted_variants") or []
+        if variants:
+            line += " | Also accept: " + "; ".join(variants)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class RubricCache:
+    """
+    Compiles a rubric once per exam (question paper + reference pair) and keeps
+    it on disk, keyed by the content of both PDFs.
+    """
+
+    def __init__(self, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = ApiKeyManager._get_config_path().parent / "rubrics"
+        self.cache_dir = str(cache_dir)
+        self.lock = threading.Lock()
+        self.key_locks = {}
+
+    def cache_key(self, question_path, reference_path):
+        return hashlib.sha256(
+            f"{RUBRIC_VERSION}:{_file_digest(question_path)}:{_file_digest(reference_path)}".encode("utf-8")
+        ).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def load(self, question_path, reference_path):
+        try:
+            with open(self._path(self.cache_key(question_path, reference_path)), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get_or_prepare(self, processor, question_path, reference_path):
+        """Return the exam's rubric, compiling it with one model call if it is not cached"""
+        key = self.cache_key(question_path, reference_path)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        # Concurrent workers grading the same exam wait for a single compilation
+        with key_lock:
+            rubric = self.load(question_path, reference_path)
+            if rubric is not None:
+                RUBRIC_CACHE.inc(result="hit")
+                return rubric
+            RUBRIC_CACHE.inc(result="miss")
+            # Not routed: the rubric is a one-off per exam and has no grading table to route on
+            response_text = processor.grade_pages(processor.prepare_pages(
+                {"Question Paper": question_path, "Reference Answer": reference_path}), construct_rubric_prompt())
+            rubric = parse_rubric(response_text)
+            if rubric is None:
+                return None
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self._path(key), "w", encoding="utf-8") as f:
+                json.dump(rubric, f, indent=2)
+            return rubric
+
+
+def apply_rubric(processor, pdf_paths, cache):
+    """
+    Swap the reference images for the exam's compact rubric.
+    Returns (pdf_paths, prompt, answer_key); falls back to the reference
+    images, with no answer key, if no rubric could be compiled.
+    """
+    reference_path = pdf_paths.get("Reference Answer")
+    if not reference_path:
+        return pdf_paths, construct_prompt(False), None
+    rubric = cache.get_or_prepare(processor, pdf_paths["Question Paper"], reference_path)
+    if rubric is None:
+        print("Could not compile a rubric from the reference, sending the reference pages instead")
+        return pdf_paths, construct_prompt(True), None
+    student_paths = dict(pdf_paths, **{"Reference Answer": ""})
+    return student_paths, construct_prompt(True, format_rubric(rubric)), answer_key_from_rubric(rubric)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile an exam's marking rubric from its reference answer sheet")
+    parser.add_argument("--question", required=True, help="Question paper PDF")
+    parser.add_argument("--reference", required=True, help="Reference answer PDF")
+    args = parser.parse_args(argv)
+
+    from src.utils.pdf_processor import PDFProcessor
+    rubric = RubricCache().get_or_prepare(PDFProcessor(ApiKeyManager.get_api_key()), args.question, args.reference)
+    if rubric is None:
+        print("The model did not return a usable rubric")
+        return 1
+    print(format_rubric(rubric))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import io
+
+from PIL import Image
+
+# Embedded formats the model accepts as they are
+PASSTHROUGH_TYPES = {"jpeg": "image/jpeg", "jpg": "image/jpeg", "png": "image/png"}
+
+
+def embedded_scan(page, min_coverage=0.95):
+    """
+    Return the xref of the single image that makes up a scanned page, or None.
+    Pages with rotation, transparency, vector drawings or annotations on top
+    of the image are rendered normally, since the image alone would not match
+    what the page shows. An invisible OCR text layer does not matter.
+    """
+    if page.rotation or page.first_annot is not None:
+        return None
+    images = page.get_images(full=True)
+    if len(images) != 1 or images[0][1]:
+        return None
+    xref = images[0][0]
+    placements = page.get_image_rects(xref, transform=True)
+    if len(placements) != 1:
+        return None
+    rect, matrix = placements[0]
+    if abs(matrix.b) > 1e-3 or abs(matrix.c) > 1e-3 or matrix.a <= 0 or matrix.d <= 0:
+        return None
+    if (rect & page.rect).get_area() < min_coverage * page.rect.get_area():
+        return None
+    if page.get_drawings():
+        return None
+    return xref
+
+
+def extract_scan(pdf_document, page_number, dpi=150):
+    """
+    Return a scanned page's embedded image as an RGB image, or None if the page
+    has to be rendered. The bytes to send are attached as image.encoded =
+    (data, mime_type): the original bytes when the image is a JPEG or PNG no
+    larger than the target resolution, otherwise a downscaled re-encode.
+    """
+    page = pdf_document[page_number - 1]
+    xref = embedded_scan(page)
+    if xref is None:
+        return None
+    try:
+        extracted = pdf_document.extract_image(xref)
+        image = Image.open(io.BytesIO(extracted["image"]))
+        target = (round(page.rect.width / 72 * dpi), round(page.rect.height / 72 * dpi))
+        mime_type = PASSTHROUGH_TYPES.get(extracted["ext"].lower())
+        if mime_type and image.mode in ("1", "L", "RGB") and image.width <= target[0] * 1.1:
+            image = image.convert("RGB")
+            image.encoded = (extracted["image"], mime_type)
+            return image
+
+        # Larger than needed: JPEG scans decode straight at a reduced scale
+        bilevel = image.mode in ("1", "P")
+        image.draft("RGB", target)
+        image = image.convert("RGB")
+        image.thumbnail(target, Image.LANCZOS)
+        buffer = io.BytesIO()
+        if bilevel:
+            image.convert("L").save(buffer, "PNG", optimize=True)
+            image.encoded = (buffer.getvalue(), "image/png")
+        else:
+            image.save(buffer, "JPEG", quality=85)
+            image.encoded = (buffer.getvalue(), "image/jpeg")
+        return image
+    except Exception as e:
+        print(f"Could not extract the scan on page {page_number}, rendering it instead: {e}")
+        return None
@@ -0,0 +1,130 @@
+import os, re
+
+from src.utils.answer_key import answer_key_from_pdfs, exclusion_prompt, merge_local_rows, plan_local_scoring
+from src.utils.model_routing import confidence_prompt
+from src.utils.pdf_loading import open_pdf
+from src.utils.result_parser import parse_results_table
+
+STUDENT_LABEL = "Actual Answer"
+STUDENT_HEADING = re.compile(r"^\s*#*\s*\**\s*Student\s+(\d+)\b.*$", re.IGNORECASE | re.MULTILINE)
+
+
+def packed_prompt(prompt_text, student_count):
+    """Ask for one results table per student in a request holding several answer sheets"""
+    return prompt_text + (
+        f" This request contains the answer sheets of {student_count} different students, numbered 1 to "
+        f"{student_count}. Each student's pages are introduced by a line naming the student's number. Grade "
+        "every student independently against the same question paper and never mix answers between students. "
+        "For each student, in order, write a heading line '### Student N' followed by that student's own "
+        "complete table."
+    )
+
+
+def student_caption(index, excluded_questions=()):
+    """Delimiter placed before a student's pages"""
+    caption = f"Student {index}: the following pages are this student's answer sheet."
+    if excluded_questions:
+        caption += (f" Questions {', '.join(excluded_questions)} were already scored for this student; "
+                    "leave them out of this student's table.")
+    return caption
+
+
+def split_packed_response(response_text, student_count):
+    """
+    Split a packed response into one text per student, in student order.
+    Returns None unless every student has exactly one section with a results table.
+    """
+    headings = list(STUDENT_HEADING.finditer(response_text))
+    numbers = [int(match.group(1)) for match in headings]
+    if sorted(numbers) != list(range(1, student_count + 1)):
+        return None
+    sections = {}
+    for match, following in zip(headings, headings[1:] + [None]):
+        end = following.start() if following else len(response_text)
+        sections[int(match.group(1))] = response_text[match.end():end].strip()
+    if not all(parse_results_table(sections[number]) for number in sections):
+        return None
+    return [sections[number] for number in range(1, student_count + 1)]
+
+
+class ScriptPacker:
+    """
+    Grades several students' short scripts for the same exam in one request.
+    The prompt, question paper and reference pages are sent once instead of
+    once per student; the response is split back into per-student results.
+    """
+
+    def __init__(self, max_students=5, max_pages=2):
+        self.max_students = max_students
+        self.max_pages = max_pages
+
+    def packable(self, pdf_paths):
+        """Whether the student's script is short enough to share a request"""
+        script = pdf_paths.get(STUDENT_LABEL)
+        if not script or self.max_students < 2:
+            return False
+        try:
+            with open_pdf(script) as pdf_document:
+                return len(pdf_document) <= self.max_pages
+        except Exception as e:
+            print(f"Could not count the pages of {script}: {e}")
+            return False
+
+    @staticmethod
+    def pack_key(pdf_paths, prompt_text, use_rubric=False):
+        """Jobs can share a request only when everything but the script is the same"""
+        exam = tuple(os.path.abspath(pdf_paths[label]) if pdf_paths.get(label) else ""
+                     for label in ("Question Paper", "Reference Answer"))
+        return exam, prompt_text, use_rubric
+
+    def grade(self, processor, student_paths, prompt_text, answer_key=None):
+        """
+        Grade several scripts of one exam; student_paths lists each student's pdf_paths.
+        Returns one response text per student, or None if the packed response
+        could not be split reliably (the caller then grades them one by one).
+        """
+        exam_paths = {label: path for label, path in student_paths[0].items() if label != STUDENT_LABEL}
+        key = {}
+        if processor.local_scoring:
+            key = answer_key if answer_key is not None else answer_key_from_pdfs(exam_paths)
+
+        responses = [None] * len(student_paths)
+        pending = []
+        for index, pdf_paths in enumerate(student_paths):
+            local_rows, local_pages, complete = plan_local_scoring(key, pdf_paths) if key else ([], set(), False)
+            if complete:
+                responses[index] = merge_local_rows("", local_rows)
+                continue
+            encoded_images = processor.prepare_pages(
+                {STUDENT_LABEL: pdf_paths[STUDENT_LABEL]}, skip_pages={STUDENT_LABEL: local_pages})
+            pending.append((index, local_rows, encoded_images[0] if encoded_images else []))
+        if not pending:
+            return responses
+
+        exam_sets = processor.prepare_pages(exam_paths)
+        router = processor.router
+        request_prompt = confidence_prompt(prompt_text) if router else prompt_text
+        parts = processor.create_parts(packed_prompt(request_prompt, len(pending)), exam_sets)
+        for number, (_, local_rows, encoded_images) in enumerate(pending, start=1):
+            parts.append({"text": student_caption(number, [row["Question Number"] for row in local_rows])})
+            parts.extend(processor.create_parts("", [encoded_images])[1:])
+        if not processor.request_planner.fits(parts):
+            return None
+
+        if router:
+            response_text = processor.generate_response(parts, router.fast_model)
+        else:
+            response_text = processor.generate_response(parts)
+        sections = split_packed_response(response_text, len(pending))
+        if sections is None:
+            print(f"Could not split the packed response for {len(pending)} students, grading them one by one")
+            return None
+
+        for (index, local_rows, encoded_images), section in zip(pending, sections):
+            student_prompt = prompt_text
+            if local_rows:
+                student_prompt = exclusion_prompt(prompt_text, [row["Question Number"] for row in local_rows])
+            if router:
+                section = router.resolve(processor, exam_sets + [encoded_images], student_prompt, [section])
+            responses[index] = merge_local_rows(section, local_rows) if local_rows else section
+        return responses
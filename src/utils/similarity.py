@@ -0,0 +1,163 @@
+import os, re, sys, json, zlib, argparse
+from collections import defaultdict
+from itertools import combinations
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from src.utils.exam_registry import ExamRegistry
+from src.utils.regrade import split_questions
+from src.utils.results_store import ResultsStore
+
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+
+def shingles(text, k=5):
+    """Return the set of hashed k-word shingles of a text"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < k:
+        return set()
+    return {zlib.crc32(" ".join(words[i:i + k]).encode("utf-8")) for i in range(len(words) - k + 1)}
+
+
+class MinHasher:
+    """Computes MinHash signatures with num_perm universal hash functions"""
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, int(_MERSENNE_PRIME), num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, int(_MERSENNE_PRIME), num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_set):
+        hashes = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set)) % _MERSENNE_PRIME
+        # (num_perm, n) table of permuted hashes; every value stays below 2**62
+        permuted = (np.outer(self.a, hashes) + self.b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1)
+
+
+class SimilarityIndex:
+    """
+    Finds suspiciously similar answers across a cohort, per question.
+    Signatures are split into bands and bucketed (LSH), so only answers that
+    share a bucket are compared instead of every pair of students.
+    """
+
+    def __init__(self, num_perm=128, bands=32, shingle_size=5, ignore_texts=()):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        # Text everyone is expected to repeat (e.g. the question itself) is not evidence of copying
+        self.ignored = set().union(*(shingles(text, shingle_size) for text in ignore_texts)) if ignore_texts else set()
+        self.signatures = {}
+        self.buckets = defaultdict(list)
+
+    def add(self, student, question, text):
+        """Index one student's answer to one question; very short answers are ignored"""
+        answer_shingles = shingles(text, self.shingle_size) - self.ignored
+        if not answer_shingles:
+            return
+        signature = self.hasher.signature(answer_shingles)
+        key = (question, student)
+        self.signatures[key] = signature
+        for band in range(self.bands):
+            band_values = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            self.buckets[(question, band, band_values)].append(student)
+
+    def similar_pairs(self, threshold=0.6):
+        """
+        Return (question, student_a, student_b, estimated Jaccard similarity)
+        for candidate pairs at or above the threshold, most similar first.
+        """
+        candidates = set()
+        for (question, _, _), students in self.buckets.items():
+            for student_a, student_b in combinations(sorted(set(students)), 2):
+                candidates.add((question, student_a, student_b))
+        pairs = []
+        for question, student_a, student_b in candidates:
+            score = float(np.mean(self.signatures[(question, student_a)] == self.signatures[(question, student_b)]))
+            if score >= threshold:
+                pairs.append((question, student_a, student_b, score))
+        return sorted(pairs, key=lambda pair: -pair[3])
+
+
+def answer_texts(pdf_path):
+    """Split a script's text layer into {question: answer text}"""
+    with fitz.open(pdf_path) as pdf_document:
+        page_texts = [page.get_text() for page in pdf_document]
+    return split_questions(page_texts)[0]
+
+
+def similarity_section(pairs, uncompared=()):
+    """Render flagged pairs as a Markdown section for the class report"""
+    note = ""
+    if uncompared:
+        note = ("\n\nNot compared with anyone, because the script has no text layer (scanned pages) and no "
+                f"transcription was given ({len(uncompared)}): " + ", ".join(uncompared) + ".")
+    if not pairs:
+        if uncompared:
+            return "No suspiciously similar answers were found among the scripts with text." + note
+        return "No suspiciously similar answers were found."
+    lines = [
+        "| Question Number | Student A | Student B | Similarity |",
+        "| --- | --- | --- | --- |",
+    ]
+    for question, student_a, student_b, score in pairs:
+        lines.append(f"| {question} | {student_a} | {student_b} | {score:.0%} |")
+    return "\n".join(lines) + note
+
+
+def cohort_similarity(exam_id, registry=None, threshold=0.6, transcriptions=None):
+    """
+    Compare every stored script of an exam question by question.
+    Answer text comes from transcriptions (student -> {question: text}) when
+    given for a student, otherwise from the script's text layer.
+    Returns (pairs, uncompared) where uncompared lists the students with no
+    answer text at all, e.g. scanned scripts, whose answers could not be compared.
+    """
+    registry = registry or ExamRegistry()
+    store = ResultsStore(registry)
+    question_paper = registry.pdf_paths(exam_id)["Question Paper"]
+    index = SimilarityIndex(ignore_texts=answer_texts(question_paper).values())
+    uncompared = []
+    for record in store.load_all(exam_id):
+        student = record["student"]
+        texts = (transcriptions or {}).get(student)
+        script_path = store.script_path(exam_id, student)
+        if not texts and os.path.exists(script_path):
+            texts = answer_texts(script_path)
+        if not texts:
+            uncompared.append(student)
+            continue
+        for question, text in texts.items():
+            index.add(student, question, text)
+    return index.similar_pairs(threshold), uncompared
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Flag similar answers across a cohort")
+    parser.add_argument("--exam", required=True, help="Registered exam ID")
+    parser.add_argument("--threshold", type=float, default=0.6, help="Minimum estimated similarity to flag")
+    parser.add_argument("--transcriptions",
+                        help="JSON file mapping student -> {question: answer text}, for scanned scripts")
+    parser.add_argument("--output", help="Class report path")
+    args = parser.parse_args(argv)
+
+    from src.ui.report_generator import generate_class_report
+    transcriptions = None
+    if args.transcriptions:
+        with open(args.transcriptions, "r", encoding="utf-8") as f:
+            transcriptions = json.load(f)
+    pairs, uncompared = cohort_similarity(args.exam, threshold=args.threshold, transcriptions=transcriptions)
+    report_path = generate_class_report(args.exam, [("Answer Similarity", similarity_section(pairs, uncompared))],
+                                        args.output)
+    print(f"{len(pairs)} similar answer pairs flagged; class report saved to {report_path}")
+    if uncompared:
+        print(f"{len(uncompared)} scripts without a text layer or transcription were not compared")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
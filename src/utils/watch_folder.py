@@ -0,0 +1,305 @@
+import os, re, sys, json, time, queue, select, struct, hashlib, argparse, threading
+import ctypes, ctypes.util
+
+from src.ui.prompts import construct_prompt
+from src.ui.report_generator import generate_markdown_report
+from src.utils.exam_registry import ExamRegistry
+from src.utils.result_parser import parse_results_table
+from src.utils.results_store import ResultsStore
+
+# Scanner files are expected as <exam_id>_<student>.pdf unless a sidecar says otherwise
+DEFAULT_NAME_PATTERN = r"^(?P<exam_id>[A-Za-z0-9-]+)_(?P<student>.+)\.pdf$"
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Waits for file events in a folder using Linux inotify (via libc)"""
+
+    def __init__(self, folder):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+        self.folder = folder
+
+    def wait(self, timeout):
+        """Return the names of files that changed, waiting at most timeout seconds"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        names = set()
+        offset = 0
+        while offset < len(data):
+            _, _, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback watcher that rescans the folder on a fixed interval"""
+
+    def __init__(self, folder, interval=5):
+        self.folder = folder
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        return set(os.listdir(self.folder))
+
+    def close(self):
+        pass
+
+
+def create_watcher(folder, force_polling=False, poll_interval=5):
+    """Use inotify where available and fall back to polling"""
+    if not force_polling:
+        try:
+            return InotifyWatcher(folder)
+        except OSError as e:
+            print(f"inotify unavailable ({e}), polling {folder} every {poll_interval}s")
+    return PollingWatcher(folder, poll_interval)
+
+
+def file_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class ProcessedLedger:
+    """Append-only record of graded files, keyed by content hash"""
+
+    def __init__(self, path):
+        self.path = path
+        self.digests = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.digests.add(json.loads(line)["sha256"])
+                    except (ValueError, KeyError):
+                        continue
+
+    def __contains__(self, digest):
+        return digest in self.digests
+
+    def record(self, digest, **details):
+        self.digests.add(digest)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(dict(details, sha256=digest)) + "\n")
+
+
+class WatchFolder:
+    """
+    Feeds scanner output into the grading pipeline.
+    A PDF is submitted once its size and modification time have stopped
+    changing for settle_seconds, and is recorded so it is never graded twice.
+    """
+
+    def __init__(self, folder, service, registry=None, output_dir="reports", name_pattern=DEFAULT_NAME_PATTERN,
+                 settle_seconds=5, ledger_path=None, force_polling=False, poll_interval=5):
+        self.folder = os.path.abspath(folder)
+        self.service = service
+        self.registry = registry or ExamRegistry()
+        self.store = ResultsStore(self.registry)
+        self.output_dir = output_dir
+        self.name_pattern = re.compile(name_pattern)
+        self.settle_seconds = settle_seconds
+        self.ledger = ProcessedLedger(ledger_path or os.path.join(self.folder, ".rison_processed.jsonl"))
+        self.watcher = create_watcher(self.folder, force_polling, poll_interval)
+        self.pending = {}   # path -> (size, mtime, unchanged since)
+        self.handled = {}   # path -> (size, mtime) of files already graded, skipped or failed
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def resolve_exam(self, path):
+        """
+        Map a scanned file to (exam_id, student).
+        A sidecar <name>.json with "exam_id" (and optionally "student") wins over the naming rule.
+        """
+        stem = os.path.splitext(path)[0]
+        for sidecar in (path + ".json", stem + ".json"):
+            if os.path.exists(sidecar):
+                with open(sidecar, "r", encoding="utf-8") as f:
+                    metadata = json.load(f)
+                if not isinstance(metadata, dict) or not metadata.get("exam_id"):
+                    raise ValueError(f"{os.path.basename(sidecar)} has no exam_id")
+                return metadata["exam_id"], metadata.get("student", os.path.basename(stem))
+        match = self.name_pattern.match(os.path.basename(path))
+        if match:
+            return match.group("exam_id"), match.group("student")
+        return None
+
+    def _track(self, names):
+        now = time.monotonic()
+        for name in names:
+            path = os.path.join(self.folder, name)
+            if not name.lower().endswith(".pdf") or path in self.pending or path in self.in_flight:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            # Files already dealt with are only looked at again if they change
+            if self.handled.get(path) != (stat.st_size, stat.st_mtime):
+                self.pending[path] = (-1, -1, now)
+
+    def _settled_files(self):
+        now = time.monotonic()
+        ready = []
+        for path, (size, mtime, since) in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime) != (size, mtime):
+                self.pending[path] = (stat.st_size, stat.st_mtime, now)
+            elif now - since >= self.settle_seconds and stat.st_size > 0:
+                ready.append(path)
+        return ready
+
+    def _submit(self, path):
+        stat = os.stat(path)
+        mapping = self.resolve_exam(path)
+        if mapping is None or not self.registry.exists(mapping[0]):
+            print(f"Skipping {os.path.basename(path)}: no registered exam matches it")
+            self.handled[path] = (stat.st_size, stat.st_mtime)
+            del self.pending[path]
+            return
+        digest = file_digest(path)
+        if digest in self.ledger:
+            self.handled[path] = (stat.st_size, stat.st_mtime)
+            del self.pending[path]
+            return
+        exam_id, student = mapping
+        pdf_paths = self.registry.pdf_paths(exam_id)
+        pdf_paths["Actual Answer"] = path
+        try:
+            future = self.service.submit(pdf_paths, construct_prompt(bool(pdf_paths["Reference Answer"])),
+                                         use_rubric=True, boilerplate_pdf=self.registry.boilerplate_path(exam_id))
+        except queue.Full:
+            # Leave it pending and try again on the next pass
+            return
+        del self.pending[path]
+        with self.lock:
+            self.in_flight.add(path)
+        future.add_done_callback(
+            lambda done: self._job_done(path, (stat.st_size, stat.st_mtime), digest, exam_id, student, done))
+        print(f"Queued {os.path.basename(path)} for exam {exam_id}")
+
+    def _job_done(self, path, file_state, digest, exam_id, student, future):
+        with self.lock:
+            self.in_flight.discard(path)
+            self.handled[path] = file_state
+            try:
+                response_text = future.result()
+                os.makedirs(self.output_dir, exist_ok=True)
+                report_path = generate_markdown_report(
+                    response_text, os.path.join(self.output_dir, f"report_{exam_id}_{student}.md"))
+                self.store.save(exam_id, student, parse_results_table(response_text), response_text, path)
+                self.ledger.record(digest, file=os.path.basename(path), exam_id=exam_id,
+                                   student=student, report=report_path)
+                print(f"Graded {os.path.basename(path)} -> {report_path}")
+            except Exception as e:
+                print(f"Grading {os.path.basename(path)} failed: {e}")
+
+    def run(self):
+        """Watch the folder until stop() is called"""
+        # Pick up anything that arrived while we were not running
+        self._track(os.listdir(self.folder))
+        try:
+            while not self.stop_event.is_set():
+                # Poll quickly while files are settling, otherwise just wait for events
+                timeout = 1 if self.pending else 5
+                self._track(self.watcher.wait(timeout))
+                for path in self._settled_files():
+                    try:
+                        self._submit(path)
+                    except Exception as e:
+                        # One bad scan or sidecar must not stop the station
+                        print(f"Skipping {os.path.basename(path)}: {e}")
+                        size, mtime, _ = self.pending.pop(path, (None, None, None))
+                        self.handled[path] = (size, mtime)
+        finally:
+            self.watcher.close()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade PDFs as they appear in a scanner folder")
+    parser.add_argument("--folder", required=True, help="Folder the scanning station writes to")
+    parser.add_argument("--output", default="reports", help="Folder for the generated reports")
+    parser.add_argument("--pattern", default=DEFAULT_NAME_PATTERN,
+                        help="Regex with exam_id and student groups used to map file names to exams")
+    parser.add_argument("--settle", type=float, default=5, help="Seconds a file must stop growing before grading")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--poll", action="store_true", help="Poll the folder instead of using inotify")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    parser.add_argument("--pack-scripts", type=int, default=0,
+                        help="Grade up to this many short scripts of one exam per request (0 to disable)")
+    parser.add_argument("--large-requests", choices=("upload", "split"),
+                        help="How to send answer sheets over the inline request limit (default: the requests section of config.json, else upload)")
+    parser.add_argument("--pack-pages", action="store_true",
+                        help="Pack nearly blank pages several to an image (default: the page_packing section of config.json)")
+    args = parser.parse_args(argv)
+
+    if args.metrics_port:
+        from src.utils.metrics import serve_metrics
+        serve_metrics(args.metrics_port)
+
+    from src.utils.api_key_manager import ApiKeyManager
+    from src.utils.page_packing import PagePacker
+    from src.utils.pdf_processor import PDFProcessor
+    from src.utils.processing_service import ProcessingService
+    from src.utils.request_planner import RequestPlanner
+    from src.utils.script_packing import ScriptPacker
+    script_packer = ScriptPacker(args.pack_scripts) if args.pack_scripts > 1 else None
+    # Keep enough scripts queued for a worker to fill a packed request
+    max_queue = args.workers * max(2, args.pack_scripts)
+    # Each worker thread gets its own packer, since a packer holds the pages it is grouping
+    service = ProcessingService(ApiKeyManager.get_api_key(), args.workers, max_queue=max_queue,
+                                processor_factory=lambda api_key: PDFProcessor(
+                                    api_key, page_packer=PagePacker() if args.pack_pages else None,
+                                    request_planner=RequestPlanner(strategy=args.large_requests)
+                                    if args.large_requests else None),
+                                script_packer=script_packer)
+    watcher = WatchFolder(args.folder, service, output_dir=args.output, name_pattern=args.pattern,
+                          settle_seconds=args.settle, force_polling=args.poll)
+    print(f"Watching {watcher.folder}")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+
+from src.utils.answer_key import (KeyEntry, answer_key_from_rubric, answer_key_from_texts, detect_bubble_rows, read_choice, read_number,
+                                  score_locally)
+
+
+def write_pdf(path, page_texts):
+    pdf_document = fitz.open()
+    for text in page_texts:
+        pdf_document.new_page().insert_text((72, 72), text)
+    pdf_document.save(path)
+    return str(path)
+
+
+def bubble_sheet(marked, offsets=None, width=1000):
+    """A white page with one row of four boxes per question, the marked option filled in"""
+    image = Image.new("RGB", (width, 1400), "white")
+    draw = ImageDraw.Draw(image)
+    for row, choice in enumerate(marked):
+        offset = (offsets or {}).get(row, 0)
+        for column in range(4):
+            x, y = 100 + 60 * column + offset, 100 + 60 * row
+            draw.rectangle([x, y, x + 20, y + 20], outline="black", width=2,
+                           fill="black" if "abcd"[column] == choice else None)
+    return image
+
+
+def test_read_choice_ignores_words_starting_with_an_option_letter():
+    assert read_choice("Answer: A cell is the basic unit of life") is None
+    assert read_choice("Ans: e.g. mitochondria") is None
+    assert read_choice("Answer: B") == "b"
+    assert read_choice("Answer: (c) Paris") == "c"
+    assert read_choice("(d)") == "d"
+
+
+def test_read_number_takes_the_assigned_value():
+    assert read_number("v = 12.5 m/s after 3 s") == (12.5, None)
+    assert read_number("a = 2\nv = u + at = 0 + 2 * 5 = 10") == (10.0, None)
+    assert read_number("Answer: 3.2 ± 0.1") == (3.2, 0.1)
+    assert read_number("7") == (7.0, None)
+
+
+def test_read_number_leaves_ambiguous_working_to_the_model():
+    assert read_number("It took 3 s to reach 12.5 m/s") is None
+    assert read_number("between 3 and 4", final=False) is None
+
+
+def test_read_number_keeps_a_stated_tolerance():
+    assert read_number("9.8 ± 0.1", final=False) == (9.8, 0.1)
+    assert read_number("9.8 +/- 0.1 m/s^2", final=False) == (9.8, 0.1)
+    assert read_number("200 ± 2%", final=False) == (200.0, 4.0)
+
+
+def test_rubric_numeric_answers_with_a_tolerance_are_keys():
+    rubric = {"questions": [
+        {"question": "1", "type": "numeric", "answer": "9.8 ± 0.1", "marks": 2},
+        {"question": "2", "type": "mcq", "answer": "b", "marks": 1},
+        {"question": "3", "type": "written", "answer": "Photosynthesis", "marks": 4},
+    ]}
+    assert answer_key_from_rubric(rubric) == {
+        "1": KeyEntry("1", "numeric", 9.8, 2.0, 0.1),
+        "2": KeyEntry("2", "mcq", "b", 1.0, None),
+    }
+
+
+def test_written_answers_are_not_mcq_keys():
+    questions = {"1": "1. Define a cell. (5 marks)", "2": "2. Capital of France? (1 mark)\n(a) Rome (b) Paris (c) Oslo"}
+    reference = {"1": "1. Answer: A cell is the basic unit of life", "2": "2. Answer: b"}
+    key = answer_key_from_texts(reference, questions)
+    assert "1" not in key
+    assert key["2"] == KeyEntry("2", "mcq", "b", 1.0, None)
+
+
+def test_bare_option_is_a_key_without_listed_options():
+    key = answer_key_from_texts({"3": "3. C"}, {"3": "3. Pick the right graph. [2]"})
+    assert key["3"].kind == "mcq" and key["3"].answer == "c"
+
+
+def test_option_outside_the_listed_options_is_not_a_key():
+    key = answer_key_from_texts({"4": "4. Answer: (e)"}, {"4": "4. Pick one [1]\n(a) x (b) y (c) z"})
+    assert "4" not in key
+
+
+def test_wrong_written_answer_is_not_scored_locally(tmp_path):
+    questions = {"2": "2. Define a cell. (5 marks)"}
+    key = answer_key_from_texts({"2": "2. Answer: A cell is the basic unit of life"}, questions)
+    student = write_pdf(tmp_path / "student.pdf", ["2. Answer: A rock is a mineral"])
+    assert score_locally(key, student) == ([], set())
+
+
+def test_bubble_grid_is_read_when_aligned():
+    assert detect_bubble_rows(bubble_sheet(["b", "d", "a"])) == ["b", "d", "a"]
+
+
+def test_misaligned_boxes_are_not_a_grid():
+    assert detect_bubble_rows(bubble_sheet(["b", "d", "a"], offsets={1: 40})) is None
+
+
+def test_scanned_page_is_not_scored_from_a_partial_grid(tmp_path):
+    key = {question: KeyEntry(question, "mcq", "b", 1.0, None) for question in ("1", "2", "3", "4")}
+    image_path = tmp_path / "scan.png"
+    bubble_sheet(["b", "b"]).save(image_path)
+    pdf_document = fitz.open()
+    pdf_document.new_page().insert_image(fitz.Rect(0, 0, 595, 842), filename=str(image_path))
+    pdf_document.save(tmp_path / "scan.pdf")
+    rows, local_pages = score_locally(key, str(tmp_path / "scan.pdf"))
+    assert rows == [] and local_pages == set()
+
+
+def test_scanned_grid_never_drops_the_page(tmp_path):
+    key = {question: KeyEntry(question, "mcq", "b", 1.0, None) for question in ("1", "2")}
+    image_path = tmp_path / "scan.png"
+    bubble_sheet(["b", "c"]).save(image_path)
+    pdf_document = fitz.open()
+    pdf_document.new_page().insert_image(fitz.Rect(0, 0, 595, 842), filename=str(image_path))
+    pdf_document.save(tmp_path / "scan.pdf")
+    rows, local_pages = score_locally(key, str(tmp_path / "scan.pdf"))
+    assert [row["Marks Awarded"] for row in rows] == ["1", "0"]
+    assert local_pages == set()
@@ -0,0 +1,112 @@
+import os, time, threading
+from collections import namedtuple
+
+import fitz  # PyMuPDF
+import pytest
+
+from src.utils.cancellation import CancellationToken, DeadlineExceeded, JobCancelled, SharedCancellationToken
+from src.utils.cost_model import CostModel
+from src.utils.pdf_processor import PDFProcessor
+from src.utils.processing_service import ProcessingService
+from src.utils.render_cache import RenderCache
+from src.utils.script_packing import ScriptPacker
+
+Response = namedtuple("Response", ["text"])
+
+
+def test_shared_token_stops_only_when_every_job_has():
+    first, second = CancellationToken(), CancellationToken()
+    shared = SharedCancellationToken([first, second])
+    first.cancel()
+    assert not shared.cancelled
+    shared.check()
+    second.cancel("gone")
+    assert shared.cancelled
+    with pytest.raises(JobCancelled):
+        shared.check()
+
+
+def test_shared_token_runs_until_the_latest_deadline():
+    short, long = CancellationToken(deadline_seconds=0.01), CancellationToken(deadline_seconds=60)
+    shared = SharedCancellationToken([short, long])
+    time.sleep(0.02)
+    assert short.expired and not shared.expired
+    assert 50 < shared.remaining() <= 60
+    assert SharedCancellationToken([short, CancellationToken()]).remaining() is None
+
+
+class PackedModel:
+    """Answers a packed request with one table per student after a delay, letting the test act meanwhile"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.requests = 0
+        self.started = threading.Event()
+
+    def count_tokens(self, contents):
+        return None
+
+    def generate_content(self, parts, **kwargs):
+        self.requests += 1
+        self.started.set()
+        time.sleep(self.delay)
+        students = sum(1 for part in parts if part.get("text", "").startswith("Student "))
+        return Response("\n\n".join(
+            f"### Student {number}\n| Question Number | Marks Awarded |\n| --- | --- |\n| 1 | {number} |"
+            for number in range(1, students + 1)))
+
+
+def write_pdf(path, text):
+    pdf_document = fitz.open()
+    pdf_document.new_page().insert_text((72, 72), text)
+    pdf_document.save(path)
+    return str(path)
+
+
+def packed_service(tmp_path, model, tokens):
+    question = write_pdf(tmp_path / "question.pdf", "1. Name a noble gas (2 marks)")
+    release = threading.Event()
+
+    def processor_factory(api_key):
+        # Hold the worker back until every job is queued, so they share one request
+        release.wait(10)
+        return PDFProcessor(api_key, router=False, page_packer=False, local_scoring=False,
+                            model_factory=lambda model_name: model, render_cache=RenderCache())
+
+    service = ProcessingService("test", processor_factory=processor_factory, cost_model=CostModel(os.devnull),
+                                script_packer=ScriptPacker(max_students=3))
+    futures = [service.submit({"Question Paper": question,
+                               "Actual Answer": write_pdf(tmp_path / f"student{index}.pdf", f"Answer {index}")},
+                              "grade", cancel_token=token)
+               for index, token in enumerate(tokens)]
+    release.set()
+    return service, futures
+
+
+def test_cancelling_one_packed_job_leaves_the_others_running(tmp_path):
+    model = PackedModel(delay=0.5)
+    tokens = [CancellationToken() for _ in range(3)]
+    service, futures = packed_service(tmp_path, model, tokens)
+    assert model.started.wait(10)
+    tokens[1].cancel()
+    with pytest.raises(JobCancelled):
+        futures[1].result(timeout=10)
+    assert "| 1 | 1 |" in futures[0].result(timeout=10)
+    assert "| 1 | 3 |" in futures[2].result(timeout=10)
+    assert model.requests == 1
+    service.shutdown(wait=True)
+
+
+def test_one_packed_job_past_its_deadline_leaves_the_others_running(tmp_path):
+    model = PackedModel(delay=2.0)
+    tokens = [CancellationToken(), CancellationToken(deadline_seconds=1.0), CancellationToken()]
+    service, futures = packed_service(tmp_path, model, tokens)
+    assert model.started.wait(10)
+    # The deadline passes while the shared request is in flight
+    assert not tokens[1].expired
+    with pytest.raises(DeadlineExceeded):
+        futures[1].result(timeout=10)
+    assert "| 1 | 1 |" in futures[0].result(timeout=10)
+    assert "| 1 | 3 |" in futures[2].result(timeout=10)
+    assert model.requests == 1
+    service.shutdown(wait=True)
@@ -0,0 +1,87 @@
+import os, threading
+
+import fitz  # PyMuPDF
+
+from src.utils.cost_model import CostModel
+from src.utils.distributed import Coordinator, Worker, _student_names
+
+TABLE = "| Question Number | Marks Allocated | Marks Awarded |\n| --- | --- | --- |\n| 1 | 2 | 2 |"
+
+
+def write_pdf(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pdf_document = fitz.open()
+    pdf_document.new_page().insert_text((72, 72), text)
+    pdf_document.save(path)
+    return str(path)
+
+
+def pdf_text(path):
+    pdf_document = fitz.open(path)
+    try:
+        return pdf_document[0].get_text().strip()
+    finally:
+        pdf_document.close()
+
+
+class FakeProcessor:
+    def __init__(self):
+        self.graded = []
+
+    def process_pdfs(self, pdf_paths, prompt_text, exam_bundle=None, boilerplate_pdf=None):
+        self.graded.append(pdf_text(pdf_paths["Actual Answer"]))
+        return TABLE
+
+
+def coordinator(tmp_path, scripts, **kwargs):
+    question = write_pdf(tmp_path / "question.pdf", "1. Question (2 marks)")
+    return Coordinator(question, scripts, output_dir=str(tmp_path / "reports"), cost_model=CostModel(os.devnull),
+                       **kwargs)
+
+
+def test_scripts_sharing_a_file_name_get_distinct_names():
+    paths = ["s/a/alice.pdf", "s/b/alice.pdf", "s/bob.pdf", "s/bob.pdf"]
+    assert _student_names(paths) == ["a_alice", "b_alice", "bob", "bob_2"]
+
+
+def test_workers_grade_the_batch_without_overwriting_reports(tmp_path):
+    scripts = [write_pdf(tmp_path / "sectionA" / "alice.pdf", "alice A"),
+               write_pdf(tmp_path / "sectionB" / "alice.pdf", "alice B"),
+               write_pdf(tmp_path / "sectionB" / "bob.pdf", "bob B")]
+    batch = coordinator(tmp_path, scripts)
+    server = batch.serve("127.0.0.1", 0)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    processors = [FakeProcessor(), FakeProcessor()]
+    workers = [threading.Thread(target=Worker(url, processor, f"worker{index}", poll_interval=0.1).run)
+               for index, processor in enumerate(processors)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+    server.shutdown()
+
+    assert batch.status() == {"total": 3, "counts": {"done": 3}}
+    assert sorted(processors[0].graded + processors[1].graded) == ["alice A", "alice B", "bob B"]
+    assert sorted(os.listdir(tmp_path / "reports")) == [
+        "report_bob.md", "report_sectionA_alice.md", "report_sectionB_alice.md"]
+    assert set(batch.results()) == {"sectionA_alice", "sectionB_alice", "bob"}
+
+
+def test_expired_lease_is_reissued_and_its_late_result_discarded(tmp_path):
+    batch = coordinator(tmp_path, [write_pdf(tmp_path / "alice.pdf", "alice")], lease_seconds=0)
+    first = batch.lease("slow")
+    second = batch.lease("fast")
+    assert second["job_id"] == first["job_id"] and second["lease_id"] != first["lease_id"]
+    assert not batch.complete(first["job_id"], first["lease_id"], TABLE)
+    assert batch.complete(second["job_id"], second["lease_id"], TABLE)
+    assert batch.is_finished()
+
+
+def test_failing_job_is_retried_then_marked_failed(tmp_path):
+    batch = coordinator(tmp_path, [write_pdf(tmp_path / "alice.pdf", "alice")], max_attempts=2)
+    for _ in range(2):
+        job = batch.lease("worker")
+        assert batch.complete(job["job_id"], job["lease_id"], error="model unavailable")
+    assert batch.lease("worker") is None
+    assert batch.status()["counts"] == {"failed": 1}
+    assert batch.is_finished()
@@ -0,0 +1,54 @@
+import fitz  # PyMuPDF
+
+from src.utils.exam_registry import ExamRegistry
+from src.utils.results_store import ResultsStore
+
+
+def pdf_bytes(text):
+    pdf_document = fitz.open()
+    pdf_document.new_page().insert_text((72, 72), text)
+    return pdf_document.tobytes()
+
+
+def test_reregistering_an_exam_keeps_stored_results(tmp_path):
+    registry = ExamRegistry(tmp_path)
+    store = ResultsStore(registry)
+    exam_id = registry.register(pdf_bytes("1. Question"), pdf_bytes("1. Answer: 4"), "Physics", "phys")
+    store.save(exam_id, "alice", [{"Question Number": "1", "Marks Awarded": "2"}], "table")
+
+    assert registry.register(pdf_bytes("1. Question"), pdf_bytes("1. Answer: 5"), exam_id="phys") == "phys"
+    assert [record["student"] for record in store.load_all("phys")] == ["alice"]
+    assert registry.metadata("phys")["name"] == "Physics"
+
+
+def test_reregistering_with_a_new_reference_remembers_the_old_one(tmp_path):
+    registry = ExamRegistry(tmp_path)
+    registry.register(pdf_bytes("1. Question"), pdf_bytes("1. Answer: 4"), exam_id="phys")
+    ResultsStore(registry).save("phys", "alice", [], "table")
+
+    registry.register(pdf_bytes("1. Question"), pdf_bytes("1. Answer: 5"), exam_id="phys")
+    assert "1" in registry.metadata("phys")["reference_fingerprint"]["questions"]
+
+
+def test_reregistering_without_a_reference_removes_it(tmp_path):
+    registry = ExamRegistry(tmp_path)
+    registry.register(pdf_bytes("1. Question"), pdf_bytes("1. Answer: 4"), exam_id="phys")
+    registry.register(pdf_bytes("1. Question"), exam_id="phys")
+    assert registry.pdf_paths("phys")["Reference Answer"] == ""
+
+
+def test_new_exam_without_results_has_no_fingerprint(tmp_path):
+    registry = ExamRegistry(tmp_path)
+    registry.register(pdf_bytes("1. Question"), pdf_bytes("1. Answer: 4"), exam_id="phys")
+    registry.register(pdf_bytes("1. Question"), pdf_bytes("1. Answer: 5"), exam_id="phys")
+    assert "reference_fingerprint" not in registry.metadata("phys")
+
+
+def test_boilerplate_is_stored_apart_from_the_graded_pdfs(tmp_path):
+    registry = ExamRegistry(tmp_path)
+    registry.register(pdf_bytes("1. Question"), exam_id="phys", boilerplate_pdf=pdf_bytes("Instructions"))
+    assert registry.boilerplate_path("phys").endswith("boilerplate.pdf")
+    assert set(registry.pdf_paths("phys")) == {"Question Paper", "Reference Answer"}
+
+    registry.register(pdf_bytes("1. Question"), exam_id="phys")
+    assert registry.boilerplate_path("phys") is None
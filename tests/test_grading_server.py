@@ -0,0 +1,63 @@
+import os, json, uuid, threading, urllib.request, urllib.error
+
+import fitz  # PyMuPDF
+import pytest
+
+from src.utils.exam_registry import ExamRegistry
+from src.utils.grading_server import GradingServer
+
+
+class FakeService:
+    def __init__(self):
+        self.submitted = []
+
+    def is_full(self):
+        return False
+
+    def submit(self, pdf_paths, prompt, progress_callback=None, **kwargs):
+        self.submitted.append(pdf_paths["Actual Answer"])
+        raise AssertionError("invalid submissions must not be queued")
+
+
+def pdf_bytes(text):
+    pdf_document = fitz.open()
+    pdf_document.new_page().insert_text((72, 72), text)
+    return pdf_document.tobytes()
+
+
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    body = b""
+    for name, value in fields.items():
+        body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n").encode()
+    for name, (filename, data) in files.items():
+        body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+                 "Content-Type: application/pdf\r\n\r\n").encode() + data + b"\r\n"
+    return body + f"--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+@pytest.fixture
+def server(tmp_path):
+    registry = ExamRegistry(tmp_path / "exams")
+    registry.register(pdf_bytes("1. Question"), exam_id="phys")
+    service = FakeService()
+    grading_server = GradingServer(service, registry, output_dir=str(tmp_path / "reports"))
+    http_server = grading_server.serve("127.0.0.1", 0)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    yield grading_server, service, f"http://127.0.0.1:{http_server.server_address[1]}"
+    http_server.shutdown()
+    http_server.server_close()
+
+
+@pytest.mark.parametrize("pages", ["", "1-2"])
+def test_unreadable_script_is_answered_with_400(server, pages):
+    grading_server, service, url = server
+    fields = {"exam_id": "phys", "pages": pages} if pages else {"exam_id": "phys"}
+    body, content_type = multipart(fields, {"script": ("alice.pdf", b"this is not a PDF")})
+    request = urllib.request.Request(url + "/submissions", data=body, headers={"Content-Type": content_type})
+    with pytest.raises(urllib.error.HTTPError) as raised:
+        urllib.request.urlopen(request, timeout=10)
+    assert raised.value.code == 400
+    assert "not a readable PDF" in json.loads(raised.value.read())["error"]
+    assert service.submitted == []
+    assert os.listdir(grading_server.spool_dir) == []
@@ -0,0 +1,24 @@
+import fitz  # PyMuPDF
+import google.generativeai as genai
+
+from src.utils.load_test import run_load_test
+
+TABLE = "| Question Number | Marks Allocated | Marks Awarded |\n| --- | --- | --- |\n| 1 | 2 | 2 |"
+
+
+def write_pdf(path, text):
+    pdf_document = fitz.open()
+    pdf_document.new_page().insert_text((72, 72), text)
+    pdf_document.save(path)
+    return str(path)
+
+
+def test_replay_leaves_the_configured_api_key_alone(tmp_path, monkeypatch):
+    configured = []
+    monkeypatch.setattr(genai, "configure", lambda **kwargs: configured.append(kwargs))
+    pdf_paths = {"Question Paper": write_pdf(tmp_path / "question.pdf", "1. Explain inertia (2 marks)"),
+                 "Actual Answer": write_pdf(tmp_path / "alice.pdf", "1. Objects resist changes in motion")}
+    records = [{"latency": 0.0, "response_text": TABLE}]
+    summary = run_load_test([(pdf_paths, "grade")], records, concurrency=2, total_jobs=3, seed=1)
+    assert summary["jobs"] == 3 and summary["errors"] == 0
+    assert configured == []
@@ -0,0 +1,84 @@
+from collections import namedtuple
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from src.utils.page_hash import PageDeduplicator, PageSignature, hamming_distance, page_signature
+from src.utils.pdf_processor import PDFProcessor
+
+Response = namedtuple("Response", ["text"])
+THUMBNAIL = np.zeros((8, 8), dtype=np.int16)
+
+
+def written_page(lines):
+    image = Image.new("RGB", (600, 800), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=36)
+    for index, line in enumerate(lines):
+        draw.text((40, 40 + 50 * index), line, fill="black", font=font)
+    return image
+
+
+def test_hashes_within_the_threshold_are_duplicates():
+    deduplicator = PageDeduplicator(threshold=10)
+    assert not deduplicator.is_duplicate(PageSignature(0, THUMBNAIL))
+    assert deduplicator.is_duplicate(PageSignature(0b1111111111, THUMBNAIL))
+    assert hamming_distance(0, 0b11111111111) == 11
+    assert not deduplicator.is_duplicate(PageSignature(0b11111111111, THUMBNAIL))
+
+
+def test_short_answer_on_a_blank_page_is_not_a_duplicate():
+    deduplicator = PageDeduplicator()
+    assert not deduplicator.is_duplicate(page_signature(written_page([])), "student")
+    # Mostly-white pages hash alike; the thumbnail comparison keeps the answer
+    assert not deduplicator.is_duplicate(page_signature(written_page(["x = 4"])), "student")
+    assert deduplicator.is_duplicate(page_signature(written_page(["x = 4"])), "student")
+
+
+def test_groups_are_compared_separately():
+    deduplicator = PageDeduplicator()
+    page = written_page(["The answer is 42"])
+    assert not deduplicator.is_duplicate(page_signature(page), "exam")
+    assert not deduplicator.is_duplicate(page_signature(page), "student")
+
+
+class FakeModel:
+    def __init__(self):
+        self.requests = []
+
+    def count_tokens(self, contents):
+        return None
+
+    def generate_content(self, parts, **kwargs):
+        self.requests.append(parts)
+        return Response("| Question Number | Marks Awarded |\n| --- | --- |\n| 1 | 2 |")
+
+
+def write_pdf(path, page_texts):
+    pdf_document = fitz.open()
+    for text in page_texts:
+        pdf_document.new_page().insert_text((72, 72), text)
+    pdf_document.save(path)
+    return str(path)
+
+
+def test_boilerplate_pages_are_not_sent_and_are_forgotten_after_the_job(tmp_path):
+    cover = "EXAMINATION COVER SHEET\nWrite your roll number on every page"
+    question = write_pdf(tmp_path / "question.pdf", ["1. Explain photosynthesis (4 marks)"])
+    script = write_pdf(tmp_path / "script.pdf", [cover, "1. Plants turn light into sugar", cover])
+    boilerplate = write_pdf(tmp_path / "boilerplate.pdf", [cover])
+
+    model = FakeModel()
+    processor = PDFProcessor("test", router=False, page_packer=False, local_scoring=False,
+                             model_factory=lambda model_name: model)
+    processor.process_pdfs({"Question Paper": question, "Actual Answer": script}, "grade",
+                           boilerplate_pdf=boilerplate)
+    captions = [part["text"] for part in model.requests[0] if "text" in part][1:]
+    assert captions == ["Question Paper page 1:", "Actual Answer page 2:"]
+    assert processor.deduplicator.boilerplate_signatures == []
+
+    processor.process_pdfs({"Question Paper": question, "Actual Answer": script}, "grade")
+    captions = [part["text"] for part in model.requests[1] if "text" in part][1:]
+    # Without the boilerplate only the repeated cover is dropped
+    assert captions == ["Question Paper page 1:", "Actual Answer page 1:", "Actual Answer page 2:"]
@@ -0,0 +1,70 @@
+import json
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from src.utils.api_key_manager import ApiKeyManager
+from src.utils.page_packing import PagePacker
+from src.utils.pdf_processor import PDFProcessor
+
+
+def sparse_page():
+    return Image.new("RGB", (600, 800), "white")
+
+
+def dense_page():
+    return Image.new("RGB", (600, 800), "black")
+
+
+def test_sparse_pages_are_grouped_with_their_page_numbers():
+    packer = PagePacker(columns=2, rows=2)
+    assert packer.add("Actual Answer", 1, sparse_page()) == []
+    assert packer.add("Actual Answer", 2, sparse_page()) == []
+    ready = packer.add("Actual Answer", 3, dense_page())
+    assert [(packed.label, packed.page_numbers) for packed in ready] == [
+        ("Actual Answer", [1, 2]), ("Actual Answer", [3])]
+    assert packer.flush() == []
+
+
+def test_full_grid_is_sent_without_waiting_for_flush():
+    packer = PagePacker(columns=2, rows=1)
+    packer.add("Actual Answer", 4, sparse_page())
+    ready = packer.add("Actual Answer", 5, sparse_page())
+    assert [packed.page_numbers for packed in ready] == [[4, 5]]
+    assert packer.group == []
+
+
+def test_pages_of_different_pdfs_are_never_packed_together():
+    packer = PagePacker()
+    packer.add("Question Paper", 1, sparse_page())
+    ready = packer.add("Actual Answer", 1, sparse_page())
+    assert [(packed.label, packed.page_numbers) for packed in ready] == [("Question Paper", [1])]
+    # A lone waiting page is sent as it is, not as a one-cell grid
+    flushed = packer.flush()
+    assert [(packed.label, packed.page_numbers) for packed in flushed] == [("Actual Answer", [1])]
+    assert flushed[0].image.size == (600, 800)
+
+
+def test_packed_pages_keep_their_original_numbers_in_the_request(tmp_path):
+    pdf_document = fitz.open()
+    for page_number in range(1, 4):
+        pdf_document.new_page().insert_text((72, 72), f"Answer on page {page_number}")
+    path = str(tmp_path / "script.pdf")
+    pdf_document.save(path)
+
+    processor = PDFProcessor("test", router=False, deduplicate_pages=False, local_scoring=False,
+                             page_packer=PagePacker(columns=2, rows=1))
+    encoded_images_sets = processor.prepare_pages({"Actual Answer": path})
+    assert [img.get("pages", [img["page_number"]]) for img in encoded_images_sets[0]] == [[1, 2], [3]]
+    texts = [part["text"] for part in processor.create_parts("grade", encoded_images_sets) if "text" in part]
+    assert "Actual Answer pages 1, 2 packed into a grid" in texts[1]
+    assert texts[2] == "Actual Answer page 3:"
+
+
+def test_packing_is_off_unless_enabled_in_config(tmp_path, monkeypatch):
+    config_file = tmp_path / "config.json"
+    monkeypatch.setattr(ApiKeyManager, "_get_config_path", classmethod(lambda cls: config_file))
+    assert PagePacker.from_config() is None
+    config_file.write_text(json.dumps({"page_packing": {"enabled": True, "columns": 3}}))
+    assert PagePacker.from_config().columns == 3
+    assert PDFProcessor("test", router=False, page_packer=False).page_packer is None
@@ -0,0 +1,48 @@
+import os
+
+import fitz  # PyMuPDF
+import pytest
+
+from src.utils.pdf_loading import open_pdf, parse_page_ranges
+
+
+def write_pdf(path, page_texts):
+    pdf_document = fitz.open()
+    for text in page_texts:
+        pdf_document.new_page().insert_text((72, 72), text)
+    pdf_document.save(path)
+    return str(path)
+
+
+def test_closing_a_pdf_closes_its_map_so_the_file_can_be_deleted(tmp_path):
+    path = write_pdf(tmp_path / "script.pdf", ["Page one", "Page two"])
+    with open_pdf(path) as pdf_document:
+        mapped = pdf_document.mapped
+        assert len(pdf_document) == 2
+        assert "Page two" in pdf_document[1].get_text()
+    assert mapped.closed
+    os.remove(path)
+    assert not os.path.exists(path)
+
+
+def test_close_can_be_called_twice(tmp_path):
+    pdf_document = open_pdf(write_pdf(tmp_path / "script.pdf", ["Page one"]))
+    pdf_document.close()
+    pdf_document.close()
+
+
+def test_invalid_pdf_does_not_leave_the_map_open(tmp_path):
+    path = tmp_path / "broken.pdf"
+    path.write_bytes(b"not a pdf at all")
+    with pytest.raises(Exception):
+        open_pdf(str(path))
+    os.remove(path)
+
+
+def test_page_ranges():
+    assert parse_page_ranges("3-5, 8, 9-", 10) == [3, 4, 5, 8, 9, 10]
+    assert parse_page_ranges("", 3) == [1, 2, 3]
+    with pytest.raises(ValueError):
+        parse_page_ranges("4-2", 10)
+    with pytest.raises(ValueError):
+        parse_page_ranges("12", 10)
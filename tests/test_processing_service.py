@@ -0,0 +1,66 @@
+import os, time, threading
+
+import fitz  # PyMuPDF
+
+from src.utils.cancellation import CancellationToken
+from src.utils.cost_model import CostModel
+from src.utils.processing_service import ProcessingService
+from src.utils.render_cache import RenderCache
+
+
+def write_pdf(path, page_texts):
+    pdf_document = fitz.open()
+    for text in page_texts:
+        pdf_document.new_page().insert_text((72, 72), text)
+    pdf_document.save(path)
+    return str(path)
+
+
+def cached_pages(render_cache, pdf_path):
+    return sorted(key[3] for key in list(render_cache.images) if key[0] == os.path.abspath(pdf_path))
+
+
+class SlowProcessor:
+    """Stands in for PDFProcessor; each 'model call' lasts until another queued script's pages are cached"""
+
+    def __init__(self, render_cache, scripts):
+        self.render_cache = render_cache
+        self.waiting = list(scripts)
+        self.timings = {"render": 0.0, "model": 0.0}
+        self.cancel_token = CancellationToken()
+        self.cached_on_start = []
+
+    def warm_up(self):
+        pass
+
+    def process_pdfs(self, pdf_paths, prompt, answer_key=None, page_selection=None, boilerplate_pdf=None):
+        script = pdf_paths["Actual Answer"]
+        self.cached_on_start.append(cached_pages(self.render_cache, script) == [1, 2])
+        self.waiting.remove(script)
+        deadline = time.monotonic() + 10
+        while self.waiting and time.monotonic() < deadline:
+            if any(cached_pages(self.render_cache, other) == [1, 2] for other in self.waiting):
+                break
+            time.sleep(0.01)
+        return "graded"
+
+
+def test_next_job_is_rendered_while_the_current_one_is_graded(tmp_path):
+    scripts = [write_pdf(tmp_path / f"student{index}.pdf", [f"Answer {index}a", f"Answer {index}b"])
+               for index in range(3)]
+    render_cache = RenderCache()
+    processor = SlowProcessor(render_cache, scripts)
+    started = threading.Event()
+
+    def processor_factory(api_key):
+        # Hold the worker back until every job is queued
+        started.wait(10)
+        return processor
+
+    service = ProcessingService("test", processor_factory=processor_factory, cost_model=CostModel(os.devnull))
+    futures = [service.submit({"Actual Answer": script}, "grade") for script in scripts]
+    started.set()
+    assert [future.result(timeout=30) for future in futures] == ["graded"] * 3
+    # Only the first script had to be rendered by the job itself
+    assert processor.cached_on_start == [False, True, True]
+    service.shutdown(wait=True)
@@ -0,0 +1,64 @@
+import fitz  # PyMuPDF
+import pytest
+
+from src.utils.exam_registry import ExamRegistry
+from src.utils.regrade import changed_questions, document_fingerprint, regrade_exam
+from src.utils.results_store import ResultsStore
+
+TABLE = ("| Question Number | Marks Allocated | Marks Awarded |\n| --- | --- | --- |\n"
+         "| 1 | 2 | 2 |\n| 2 | 2 | 1 |")
+
+
+def write_pdf(path, text):
+    pdf_document = fitz.open()
+    pdf_document.new_page().insert_text((72, 72), text)
+    pdf_document.save(path)
+    return str(path)
+
+
+class FakeProcessor:
+    """Returns a fixed table and raises on the student named in fail_on"""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.graded = []
+
+    def process_pdfs(self, pdf_paths, prompt_text, boilerplate_pdf=None):
+        student = pdf_paths["Actual Answer"].rsplit("/", 1)[-1][:-4]
+        if student == self.fail_on:
+            raise RuntimeError("model unavailable")
+        self.graded.append(student)
+        return TABLE
+
+
+@pytest.fixture
+def exam(tmp_path):
+    registry = ExamRegistry(tmp_path / "exams")
+    store = ResultsStore(registry)
+    question = write_pdf(tmp_path / "question.pdf", "1. Speed? (2 marks)\n2. Force? (2 marks)")
+    reference = write_pdf(tmp_path / "reference.pdf", "1. 12 m/s\n2. 5 N")
+    registry.register_files(question, reference, exam_id="phys")
+    for student in ("alice", "bob", "carol"):
+        script = write_pdf(tmp_path / f"{student}.pdf", "1. 12 m/s\n2. 4 N")
+        store.save("phys", student, [], "old", script)
+    new_reference = write_pdf(tmp_path / "corrected.pdf", "1. 12 m/s\n2. 6 N")
+    return registry, store, new_reference, str(tmp_path / "reports")
+
+
+def test_failed_regrade_resumes_with_the_remaining_students(exam):
+    registry, store, new_reference, output_dir = exam
+    failing = FakeProcessor(fail_on="bob")
+    with pytest.raises(RuntimeError):
+        regrade_exam(failing, "phys", new_reference, registry, store, output_dir)
+    assert failing.graded == ["alice"]
+    # The exam still records the reference the remaining results were graded against
+    assert changed_questions(registry.metadata("phys")["reference_fingerprint"],
+                             document_fingerprint(new_reference)) == ["2"]
+
+    processor = FakeProcessor()
+    assert regrade_exam(processor, "phys", new_reference, registry, store, output_dir) == ["2"]
+    assert processor.graded == ["bob", "carol"]
+
+    processor = FakeProcessor()
+    assert regrade_exam(processor, "phys", new_reference, registry, store, output_dir) == []
+    assert processor.graded == []
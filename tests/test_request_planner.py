@@ -0,0 +1,121 @@
+import json, base64
+from collections import namedtuple
+
+import pytest
+
+from src.utils.api_key_manager import ApiKeyManager
+from src.utils.pdf_processor import PDFProcessor
+from src.utils.request_planner import RequestPlanner, continuation_prompt, merge_responses, payload_size
+
+Response = namedtuple("Response", ["text"])
+
+
+class UploadedFile:
+    """Stands in for genai's File: an object, not a dict, that supports no 'in' test"""
+
+    def __init__(self, name, size_bytes):
+        self.name = name
+        self.size_bytes = size_bytes
+
+
+class FileUploader:
+    def __init__(self):
+        self.uploaded = []
+        self.deleted = []
+
+    def upload(self, data, mime_type):
+        uploaded = UploadedFile(f"files/{len(self.uploaded)}", len(data))
+        self.uploaded.append(uploaded)
+        return uploaded
+
+    def delete(self, uploaded):
+        self.deleted.append(uploaded.name)
+
+
+class FakeModel:
+    def __init__(self):
+        self.requests = []
+
+    def count_tokens(self, contents):
+        return None
+
+    def generate_content(self, parts, **kwargs):
+        self.requests.append(parts)
+        return Response("| Question Number | Marks Awarded |\n| --- | --- |\n| 1 | 2 |")
+
+
+def page(label, page_number, size):
+    return {"label": label, "page_number": page_number, "mime_type": "image/png",
+            "img_base64": base64.b64encode(b"x" * size).decode("utf-8")}
+
+
+def test_payload_size_ignores_uploaded_files():
+    parts = [{"text": "grade"}, UploadedFile("files/0", 10_000), {"inline_data": {"data": "abcd"}}]
+    assert payload_size(parts) == len("grade") + 4
+
+
+def test_oversized_sheet_is_sent_through_uploaded_files():
+    model = FakeModel()
+    uploader = FileUploader()
+    processor = PDFProcessor("test", router=False, model_factory=lambda model_name: model,
+                             request_planner=RequestPlanner(max_inline_bytes=5000, uploader=uploader))
+    sets = [[page("Question Paper", 1, 3000)], [page("Actual Answer", 1, 3000), page("Actual Answer", 2, 3000)]]
+    assert "| 1 | 2 |" in processor.grade_pages(sets, "grade")
+    assert len(model.requests) == 1
+    assert sum(isinstance(part, UploadedFile) for part in model.requests[0]) == 3
+    assert uploader.deleted == ["files/0", "files/1", "files/2"]
+
+
+def test_split_pages_fills_chunks_up_to_the_budget():
+    planner = RequestPlanner(max_inline_bytes=4096 + 6000 + len("grade"))
+    exam = [page("Question Paper", 1, 1500)]
+    sheet = [page("Actual Answer", number, 1500) for number in range(1, 5)]
+    exam_sets, chunks = planner.split_pages([exam, sheet], "grade")
+    assert exam_sets == [exam]
+    # 6000 bytes of room less the 2000-byte question page leaves two 2000-byte answer pages per chunk
+    assert [[img["page_number"] for img in chunk] for chunk in chunks] == [[1, 2], [3, 4]]
+
+
+def test_split_pages_rejects_a_page_over_the_budget():
+    planner = RequestPlanner(max_inline_bytes=4096 + 3000)
+    with pytest.raises(ValueError, match="page 2"):
+        planner.split_pages([[page("Actual Answer", 1, 1000), page("Actual Answer", 2, 3000)]], "")
+
+
+def test_continuation_prompt_names_the_pages_and_graded_questions():
+    chunk = [page("Actual Answer", 5, 10), dict(page("Actual Answer", 6, 10), pages=[6, 7])]
+    prompt = continuation_prompt("grade.", 1, 3, chunk, ["1", "2"])
+    assert "part 2 of 3, containing answer sheet pages 5 to 7" in prompt
+    assert "already graded in earlier parts: 1, 2" in prompt
+    assert "already graded" not in continuation_prompt("grade.", 0, 3, chunk, [])
+
+
+def test_merge_responses_keeps_the_latest_row_per_question():
+    first = "| Question Number | Marks Awarded |\n| --- | --- |\n| 1 | 2 |\n| Q2 | 1 |"
+    second = "| Question Number | Marks Awarded |\n| --- | --- |\n| 2 | 3 |\n| 3 | 4 |"
+    merged = merge_responses([first, second])
+    assert merged.startswith("The answer sheet was graded in 2 parts")
+    assert "| 1 | 2 |" in merged and "| 2 | 3 |" in merged and "| 3 | 4 |" in merged
+    assert "| Q2 | 1 |" not in merged
+    # Without any table the responses are passed through
+    assert merge_responses(["no table", "still none"]) == "no table\n\nstill none"
+
+
+def test_split_strategy_grades_the_sheet_in_parts():
+    model = FakeModel()
+    processor = PDFProcessor("test", router=False, model_factory=lambda model_name: model,
+                             request_planner=RequestPlanner(max_inline_bytes=4096 + 5 + 10000, strategy="split"))
+    # 8000 bytes of room next to the question page: two 4000-byte answer pages per part
+    sets = [[page("Question Paper", 1, 1500)], [page("Actual Answer", number, 3000) for number in range(1, 5)]]
+    assert processor.grade_pages(sets, "grade").startswith("The answer sheet was graded in 2 parts")
+    assert len(model.requests) == 2
+    assert "containing answer sheet pages 3 to 4" in model.requests[1][0]["text"]
+    assert "already graded in earlier parts: 1" in model.requests[1][0]["text"]
+
+
+def test_strategy_is_read_from_config(tmp_path, monkeypatch):
+    config_file = tmp_path / "config.json"
+    monkeypatch.setattr(ApiKeyManager, "_get_config_path", classmethod(lambda cls: config_file))
+    assert RequestPlanner.from_config().strategy == "upload"
+    config_file.write_text(json.dumps({"requests": {"strategy": "split"}}))
+    assert PDFProcessor("test", router=False).request_planner.strategy == "split"
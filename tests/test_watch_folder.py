@@ -0,0 +1,67 @@
+import os, time, threading
+from concurrent.futures import Future
+
+import fitz  # PyMuPDF
+
+from src.utils.exam_registry import ExamRegistry
+from src.utils.watch_folder import WatchFolder
+
+TABLE = "| Question Number | Marks Allocated | Marks Awarded |\n| --- | --- | --- |\n| 1 | 2 | 2 |"
+
+
+def pdf_bytes(text):
+    pdf_document = fitz.open()
+    pdf_document.new_page().insert_text((72, 72), text)
+    return pdf_document.tobytes()
+
+
+class FakeService:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, pdf_paths, prompt_text, use_rubric=False, boilerplate_pdf=None):
+        self.submitted.append(os.path.basename(pdf_paths["Actual Answer"]))
+        future = Future()
+        future.set_result(TABLE)
+        return future
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_bad_scans_are_skipped_without_stopping_the_watcher(tmp_path):
+    registry = ExamRegistry(tmp_path / "exams")
+    registry.register(pdf_bytes("1. Question (2 marks)"), exam_id="phys")
+    folder = tmp_path / "scans"
+    folder.mkdir()
+    (folder / "broken.pdf").write_bytes(pdf_bytes("1. Answer"))
+    (folder / "broken.json").write_text("{not json")
+    (folder / "nameless.pdf").write_bytes(pdf_bytes("1. Answer"))
+    (folder / "nameless.json").write_text('{"student": "dave"}')
+    (folder / "escape.pdf").write_bytes(pdf_bytes("1. Answer"))
+    (folder / "escape.json").write_text('{"exam_id": "../phys"}')
+    (folder / "phys_carol.pdf").write_bytes(pdf_bytes("1. Answer"))
+
+    service = FakeService()
+    watcher = WatchFolder(str(folder), service, registry, output_dir=str(tmp_path / "reports"),
+                          settle_seconds=0, force_polling=True, poll_interval=0.05)
+    thread = threading.Thread(target=watcher.run, daemon=True)
+    thread.start()
+    try:
+        assert wait_for(lambda: all(str(folder / name) in watcher.handled
+                                    for name in ("broken.pdf", "nameless.pdf", "escape.pdf", "phys_carol.pdf")))
+        assert thread.is_alive()
+        assert service.submitted == ["phys_carol.pdf"]
+
+        # Scans arriving after the bad ones are still picked up
+        (folder / "phys_erin.pdf").write_bytes(pdf_bytes("1. Answer"))
+        assert wait_for(lambda: "phys_erin.pdf" in service.submitted)
+    finally:
+        watcher.stop()
+        thread.join(5)